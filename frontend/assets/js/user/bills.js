@@ -3,6 +3,8 @@
  * Uses Layout module for header/footer/navigation
  */
 let bills = [];
+let nextCursor = null;
+let summary = null;
 let currentFilter = "all";
 let selectedBillId = null;
 
@@ -20,6 +22,7 @@ document.addEventListener("DOMContentLoaded", () => {
   wireTabs();
   wireListActions();
   wireModal();
+  wireLoadMore();
   loadBills();
   checkVNPayResult();
 });
@@ -189,10 +192,16 @@ function wireModal() {
   });
 }
 
+function wireLoadMore() {
+  const btn = document.getElementById("loadMoreBtn");
+  if (btn) btn.addEventListener("click", loadMoreBills);
+}
+
+// Bills are paginated (keyset cursor); the first page is loaded up front
 async function loadBills() {
   showLoading();
   try {
-    const res = await API.get("/bills");
+    const [res] = await Promise.all([API.get("/bills"), loadSummary()]);
     if (!res.ok) {
       showError(res.data?.message || "Không thể tải hóa đơn");
       return;
@@ -206,6 +215,7 @@ async function loadBills() {
     } else {
       bills = [];
     }
+    nextCursor = data && data.next_cursor ? data.next_cursor : null;
 
     renderStats();
     renderList();
@@ -215,6 +225,33 @@ async function loadBills() {
   }
 }
 
+async function loadMoreBills() {
+  if (!nextCursor) return;
+  const btn = document.getElementById("loadMoreBtn");
+  if (btn) btn.disabled = true;
+  try {
+    const res = await API.get(`/bills?cursor=${encodeURIComponent(nextCursor)}`);
+    if (!res.ok) return;
+    bills = bills.concat(res.data.bills || []);
+    nextCursor = res.data.next_cursor || null;
+    renderList();
+  } catch (error) {
+    console.error("Load more bills error:", error);
+  } finally {
+    if (btn) btn.disabled = false;
+  }
+}
+
+// Counts and totals over all of the tenant's bills, not only the loaded pages
+async function loadSummary() {
+  try {
+    const res = await API.get("/bills/summary");
+    summary = res.ok ? res.data.statuses || {} : null;
+  } catch (error) {
+    summary = null;
+  }
+}
+
 function showLoading() {
   const loading = document.getElementById("loadingState");
   const error = document.getElementById("errorState");
@@ -256,21 +293,35 @@ function renderStats() {
   const paidBills = bills.filter(isPaid);
 
   // API returns 'total' field
-  const totalUnpaid = pendingBills.reduce(
+  let pendingCount = pendingBills.length;
+  let paidCount = paidBills.length;
+  let allCount = bills.length;
+  let totalUnpaid = pendingBills.reduce(
     (sum, b) => sum + (b.total || b.total_amount || b.totalAmount || 0),
     0
   );
-  const totalPaid = paidBills.reduce(
+  let totalPaid = paidBills.reduce(
     (sum, b) => sum + (b.total || b.total_amount || b.totalAmount || 0),
     0
   );
 
+  // Prefer server-side totals when available (the list is paginated)
+  if (summary) {
+    const stat = (s) => summary[s] || { count: 0, total: 0 };
+    const pendingStatuses = ["pending", "unpaid", "overdue"];
+    pendingCount = pendingStatuses.reduce((n, s) => n + stat(s).count, 0);
+    totalUnpaid = pendingStatuses.reduce((n, s) => n + stat(s).total, 0);
+    paidCount = stat("paid").count;
+    totalPaid = stat("paid").total;
+    allCount = Object.values(summary).reduce((n, s) => n + s.count, 0);
+  }
+
   // Update stat cards
   const statPending = document.getElementById("statPendingCount");
   const statUnpaid = document.getElementById("statUnpaidTotal");
   const statPaid = document.getElementById("statPaidTotal");
 
-  if (statPending) statPending.textContent = pendingBills.length;
+  if (statPending) statPending.textContent = pendingCount;
   if (statUnpaid) statUnpaid.textContent = formatCurrency(totalUnpaid);
   if (statPaid) statPaid.textContent = formatCurrency(totalPaid);
 
@@ -279,9 +330,9 @@ function renderStats() {
   const tabPending = document.getElementById("tabPendingCount");
   const tabPaid = document.getElementById("tabPaidCount");
 
-  if (tabAll) tabAll.textContent = bills.length;
-  if (tabPending) tabPending.textContent = pendingBills.length;
-  if (tabPaid) tabPaid.textContent = paidBills.length;
+  if (tabAll) tabAll.textContent = allCount;
+  if (tabPending) tabPending.textContent = pendingCount;
+  if (tabPaid) tabPaid.textContent = paidCount;
 }
 
 function renderList() {
@@ -291,6 +342,9 @@ function renderList() {
 
   if (loading) loading.classList.add("hidden");
 
+  const loadMore = document.getElementById("loadMoreWrap");
+  if (loadMore) loadMore.classList.toggle("hidden", !nextCursor);
+
   if (!listEl) return;
 
   const filtered = filterBills();
@@ -1,9 +1,13 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+import datetime
+import json
+import uuid
 from flask_cors import CORS
+from pymongo import UpdateOne
 import atexit
 
 from config import Config
-from model import bills_collection
+from model import bills_collection, bump_bills_version
 from decorators import token_required, admin_required, internal_api_required
 from service_registry import register_service, deregister_service
 from utils import (
@@ -11,6 +15,7 @@ from utils import (
     get_timestamp,
     calculate_bill,
     calculate_finalize_fees,
+    calculate_finalize_fees_batch,
     format_bill,
     format_unpaid_bill,
     create_bill_document,
@@ -18,8 +23,21 @@ from utils import (
     check_duplicate_bill,
     get_user_id,
     can_access_bill,
-    send_notification
+    BILL_LIST_PROJECTION,
+    encode_cursor,
+    cursor_condition,
+    parse_period,
+    parse_readings_csv,
+    prepare_finalize_row,
+    to_iso
 )
+from billing import tier_error
+from outbox import run_in_transaction, build_outbox_record, enqueue_notifications, build_revenue_event, enqueue_revenue_events
+from archive import (
+    archive_paid_bills, archived_paid_totals, find_archived_bill, find_bills_with_archive, has_legacy_created_at,
+    years_for_request
+)
+from readings import build_reading, detect_anomalies, insert_readings, room_history, update_room_meters
 
 
 app = Flask(__name__)
@@ -28,6 +46,24 @@ CORS(app)
 atexit.register(deregister_service)
 
 
+# ============== Data Version ==============
+
+# POST endpoints that change no bill data
+READ_ONLY_ENDPOINTS = {'preview_bill'}
+
+
+@app.after_request
+# Every successful write changes bill data
+def bump_version_after_write(response):
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400 \
+            and request.endpoint not in READ_ONLY_ENDPOINTS:
+        try:
+            bump_bills_version()
+        except Exception as e:
+            print(f"[DB] Failed to bump bills version: {e}")
+    return response
+
+
 # ============== Health Check ==============
 
 @app.route('/health', methods=['GET'])
@@ -39,7 +75,9 @@ def health():
 
 @app.route('/api/bills', methods=['GET'])
 @token_required
-# Get bills list (admin sees all, user sees own)
+# Get bills list (admin sees all, user sees own).
+# Archived (long-paid) bills are included only for ?month= / ?year= periods that have an
+# archive, or for every year with ?include_archived=true.
 def get_bills(current_user):
     user_id = get_user_id(current_user)
     role = current_user.get('role', '')
@@ -51,11 +89,69 @@ def get_bills(current_user):
         if value:
             query[param] = value
     
-    bills = list(bills_collection.find(query).sort('created_at', -1))
+    year = None
+    if request.args.get('year'):
+        year, _ = parse_period('01', request.args.get('year'))
+        if year is None:
+            return jsonify({'message': 'year không hợp lệ!'}), 400
+        query['period_year'] = year
+    elif query.get('month'):
+        year, _ = parse_period(query['month'])
+    
+    archive_years = []
+    if query.get('status', 'paid') == 'paid':
+        archive_years = years_for_request(
+            year, request.args.get('include_archived', '').lower() == 'true'
+        )
+    
+    try:
+        limit = int(request.args.get('limit', Config.BILLS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'message': 'limit không hợp lệ!'}), 400
+    limit = max(1, min(limit, Config.BILLS_MAX_PAGE_SIZE))
+    
+    # Keyset pagination on (created_at desc, _id desc)
+    cursor = request.args.get('cursor')
+    if cursor:
+        condition = cursor_condition(cursor, has_legacy_created_at(archive_years))
+        if condition is None:
+            return jsonify({'message': 'cursor không hợp lệ!'}), 400
+        query.update(condition)
+    
+    bills = find_bills_with_archive(query, BILL_LIST_PROJECTION, limit + 1, archive_years)
+    has_more = len(bills) > limit
+    bills = bills[:limit]
     
     return jsonify({
         'bills': [format_bill(b) for b in bills],
-        'total': len(bills)
+        'total': len(bills),
+        'next_cursor': encode_cursor(bills[-1]) if has_more else None
+    }), 200
+
+
+@app.route('/api/bills/summary', methods=['GET'])
+@token_required
+# Bill count and total per status for the stat cards (the list itself is paginated);
+# archived bills are counted as paid
+def get_bills_summary(current_user):
+    match = {} if current_user.get('role') == 'admin' else {'user_id': get_user_id(current_user)}
+    pipeline = [
+        {'$match': match},
+        {'$group': {'_id': '$status', 'count': {'$sum': 1}, 'total': {'$sum': {'$ifNull': ['$total', 0]}}}}
+    ]
+    statuses = {
+        row['_id']: {'count': row['count'], 'total': row['total']}
+        for row in bills_collection.aggregate(pipeline)
+    }
+    # Archived bills left the hot collection but are still paid bills
+    archived_count, archived_total = archived_paid_totals(match.get('user_id'))
+    if archived_count:
+        paid = statuses.setdefault('paid', {'count': 0, 'total': 0})
+        paid['count'] += archived_count
+        paid['total'] += archived_total
+    return jsonify({
+        'statuses': statuses,
+        'total': sum(s['count'] for s in statuses.values())
     }), 200
 
 
@@ -63,7 +159,7 @@ def get_bills(current_user):
 @token_required
 # Get single bill details
 def get_bill(current_user, bill_id):
-    bill = bills_collection.find_one({'_id': bill_id})
+    bill = bills_collection.find_one({'_id': bill_id}) or find_archived_bill(bill_id)
     if not bill:
         return jsonify({'message': 'Hóa đơn không tồn tại!'}), 404
     
@@ -93,6 +189,9 @@ def create_bill(current_user):
     if missing:
         return jsonify({'message': f"Thiếu trường: {', '.join(missing)}"}), 400
     
+    if parse_period(data['month']) == (None, None):
+        return jsonify({'message': 'Tháng không hợp lệ (YYYY-MM)!'}), 400
+    
     # Check duplicate
     if check_duplicate_bill(data['contract_id'], data['month']):
         return jsonify({'message': 'Hóa đơn tháng này đã tồn tại!'}), 400
@@ -112,17 +211,21 @@ def create_bill(current_user):
     # Create bill document
     new_bill = create_bill_document(data, amounts)
     
+    # Notify user via outbox (delivered by background dispatcher)
+    notification = build_outbox_record(
+        new_bill['user_id'],
+        "Hóa đơn mới",
+        f"Bạn có hóa đơn mới tháng {new_bill['month']} cần thanh toán.",
+        "bill",
+        {"bill_id": new_bill['_id']}
+    )
+    
+    def write(session):
+        bills_collection.insert_one(new_bill, session=session)
+        enqueue_notifications([notification], session=session)
+    
     try:
-        bills_collection.insert_one(new_bill)
-        
-        # Send notification to user
-        send_notification(
-            new_bill['user_id'],
-            "Hóa đơn mới",
-            f"Bạn có hóa đơn mới tháng {new_bill['month']} cần thanh toán.",
-            "bill",
-            {"bill_id": new_bill['_id']}
-        )
+        run_in_transaction(write)
         
         return jsonify({
             'message': 'Tạo hóa đơn thành công!',
@@ -164,11 +267,15 @@ def update_bill(current_user, bill_id):
             'electric_price': bill.get('electric_price', 3500),
             'water_price': bill.get('water_price', 15000),
             'room_fee': merged['room_fee'],
-            'other_fee': merged.get('other_fee', 0)
+            'other_fee': merged.get('other_fee', 0),
+            'electric_tiers': bill.get('electric_tiers'),
+            'water_tiers': bill.get('water_tiers'),
+            'billing_days': bill.get('billing_days'),
+            'days_in_month': bill.get('days_in_month')
         })
         update_fields['electric_fee'] = amounts['electric_fee']
         update_fields['water_fee'] = amounts['water_fee']
-        update_fields['total'] = amounts['total']
+        update_fields['total'] = amounts['total'] + bill.get('late_fee', 0)
     
     bills_collection.update_one({'_id': bill_id}, {'$set': update_fields})
     updated = bills_collection.find_one({'_id': bill_id})
@@ -193,13 +300,21 @@ def pay_bill(current_user, bill_id):
     if bill['status'] == 'paid':
         return jsonify({'message': 'Hóa đơn đã được thanh toán!'}), 400
     
-    bills_collection.update_one(
-        {'_id': bill_id},
-        {'$set': {
-            'status': 'paid',
-            'paid_at': get_timestamp()
-        }}
-    )
+    paid_at = get_timestamp()
+    
+    def write(session):
+        result = bills_collection.update_one(
+            {'_id': bill_id, 'status': {'$ne': 'paid'}},
+            {'$set': {
+                'status': 'paid',
+                'paid_at': paid_at
+            }},
+            session=session
+        )
+        if result.modified_count:
+            enqueue_revenue_events([build_revenue_event(bill, f"{bill_id}:paid:{paid_at}")], session=session)
+    
+    run_in_transaction(write)
     
     return jsonify({'message': 'Thanh toán thành công!'}), 200
 
@@ -223,7 +338,20 @@ def update_bill_status_internal(bill_id):
     else:
         update['paid_at'] = None
 
-    bills_collection.update_one({'_id': bill_id}, {'$set': update})
+    # Only a real paid <-> unpaid transition changes revenue
+    def write(session):
+        result = bills_collection.update_one(
+            {'_id': bill_id, 'status': bill['status']}, {'$set': update}, session=session
+        )
+        if result.modified_count and status == 'paid' and bill['status'] != 'paid':
+            event = build_revenue_event(bill, f"{bill_id}:paid:{update['paid_at']}")
+        elif result.modified_count and status != 'paid' and bill['status'] == 'paid':
+            event = build_revenue_event(bill, f"{bill_id}:reverted:{bill.get('paid_at')}", sign=-1)
+        else:
+            return
+        enqueue_revenue_events([event], session=session)
+    
+    run_in_transaction(write)
     return jsonify({'message': 'Cập nhật trạng thái hóa đơn thành công!', 'bill_id': bill_id}), 200
 
 
@@ -258,6 +386,44 @@ def trigger_generate_bills(current_user):
         return jsonify({'message': f'Lỗi: {str(e)}'}), 500
 
 
+@app.route('/api/bills/late-fees/accrue', methods=['POST'])
+@token_required
+@admin_required
+# Manually run late fee accrual (admin only); safe to repeat within a day
+def trigger_late_fee_accrual(current_user):
+    from late_fees import accrue_late_fees
+    try:
+        result = accrue_late_fees()
+        return jsonify({'message': 'Đã tính phí trễ hạn!', **result}), 200
+    except Exception as e:
+        return jsonify({'message': f'Lỗi: {str(e)}'}), 500
+
+
+@app.route('/api/bills/archive', methods=['POST'])
+@token_required
+@admin_required
+# Archive bills paid more than BILL_ARCHIVE_AFTER_MONTHS ago (admin only); ?dry_run=true only counts
+def trigger_bill_archive(current_user):
+    try:
+        result = archive_paid_bills(dry_run=request.args.get('dry_run', '').lower() == 'true')
+        return jsonify({'message': 'Đã lưu trữ hóa đơn cũ!', **result}), 200
+    except Exception as e:
+        return jsonify({'message': f'Lỗi: {str(e)}'}), 500
+
+
+@app.route('/api/bills/price-sync', methods=['POST'])
+@token_required
+@admin_required
+# Apply pending room price changes to draft bills now (admin only)
+def trigger_room_price_sync(current_user):
+    from price_sync import sync_room_prices
+    try:
+        result = sync_room_prices()
+        return jsonify({'message': 'Đã cập nhật giá cho hóa đơn nháp!', **result}), 200
+    except Exception as e:
+        return jsonify({'message': f'Lỗi: {str(e)}'}), 500
+
+
 @app.route('/api/bills/<bill_id>/finalize', methods=['PUT'])
 @token_required
 @admin_required
@@ -278,8 +444,13 @@ def finalize_bill(current_user, bill_id):
     if electric_new is None or water_new is None:
         return jsonify({'message': 'Vui lòng nhập số điện và nước mới!'}), 400
     
+    error = tier_error(bill)
+    if error:
+        return jsonify({'message': error}), 400
+    
     # Calculate fees using utility function
     fees = calculate_finalize_fees(bill, electric_new, water_new, data.get('other_fee'))
+    warnings = detect_anomalies([(bill, electric_new, water_new)])[0]
     
     # Update bill
     update_data = {
@@ -287,38 +458,232 @@ def finalize_bill(current_user, bill_id):
         'status': 'pending',
         'updated_at': get_timestamp()
     }
+    reading = build_reading(bill, electric_new, water_new, datetime.datetime.utcnow())
     
-    bills_collection.update_one({'_id': bill_id}, {'$set': update_data})
-    
-    updated_bill = bills_collection.find_one({'_id': bill_id})
-    
-    # Send notification to user
-    send_notification(
-        updated_bill['user_id'],
+    # Notify user via outbox (delivered by background dispatcher)
+    notification = build_outbox_record(
+        bill['user_id'],
         "Hóa đơn điện nước",
-        f"Hóa đơn tháng {updated_bill['month']} đã được chốt số điện nước. Vui lòng kiểm tra và thanh toán.",
+        f"Hóa đơn tháng {bill['month']} đã được chốt số điện nước. Vui lòng kiểm tra và thanh toán.",
         "bill",
-        {"bill_id": updated_bill['_id']}
+        {"bill_id": bill_id}
     )
     
+    def write(session):
+        result = bills_collection.update_one(
+            {'_id': bill_id, 'status': 'draft'}, {'$set': update_data}, session=session
+        )
+        if result.matched_count == 0:
+            return False
+        update_room_meters([reading], session=session)
+        enqueue_notifications([notification], session=session)
+        return True
+    
+    if not run_in_transaction(write):
+        # Another request finalized or changed the bill after it was read
+        return jsonify({'message': 'Chỉ có thể cập nhật hóa đơn ở trạng thái draft!'}), 409
+    insert_readings([reading])
+    
+    updated_bill = bills_collection.find_one({'_id': bill_id})
+    
     return jsonify({
         'message': 'Cập nhật hóa đơn thành công! Đã chuyển sang trạng thái chờ thanh toán.',
-        'bill': format_bill(updated_bill)
+        'bill': format_bill(updated_bill),
+        'warnings': warnings
     }), 200
 
 
+@app.route('/api/bills/bulk-finalize', methods=['POST'])
+@token_required
+@admin_required
+# Finalize many draft bills at once from meter readings (JSON array or CSV).
+# Readings far outside a room's usage history are flagged; ?reject_anomalies=true skips them.
+def bulk_finalize_bills(current_user):
+    reject_anomalies = request.args.get('reject_anomalies', '').lower() == 'true'
+    upload = request.files.get('file')
+    if upload:
+        try:
+            readings = parse_readings_csv(upload.read().decode('utf-8-sig'))
+        except UnicodeDecodeError:
+            return jsonify({'message': 'File CSV phải được mã hóa UTF-8!'}), 400
+    elif 'csv' in (request.content_type or ''):
+        readings = parse_readings_csv(request.get_data(as_text=True))
+    else:
+        data = request.get_json(silent=True) or []
+        readings = data.get('readings', []) if isinstance(data, dict) else data
+
+    if not isinstance(readings, list) or not readings:
+        return jsonify({'message': 'Không có dữ liệu chỉ số điện nước!'}), 400
+
+    bill_ids = [r.get('bill_id') for r in readings if isinstance(r, dict) and isinstance(r.get('bill_id'), str)]
+    bills = {b['_id']: b for b in bills_collection.find({'_id': {'$in': bill_ids}})}
+
+    results = []
+    items = []
+    seen = set()
+
+    for index, reading in enumerate(readings):
+        bill_id = reading.get('bill_id') if isinstance(reading, dict) else None
+        if not bill_id:
+            results.append({'row': index, 'bill_id': None, 'success': False, 'message': 'Thiếu bill_id!'})
+            continue
+        if not isinstance(bill_id, str):
+            results.append({'row': index, 'bill_id': None, 'success': False, 'message': 'bill_id không hợp lệ!'})
+            continue
+        if bill_id in seen:
+            results.append({'row': index, 'bill_id': bill_id, 'success': False, 'message': 'Trùng bill_id trong danh sách!'})
+            continue
+        seen.add(bill_id)
+
+        item, error = prepare_finalize_row(reading, bills.get(bill_id))
+        if error:
+            results.append({'row': index, 'bill_id': bill_id, 'success': False, 'message': error})
+            continue
+        items.append((index, item))
+
+    # Check usage against each room's history in one vectorized pass
+    anomalies = detect_anomalies([(bill, e_new, w_new) for _, (bill, e_new, w_new, _) in items])
+    if reject_anomalies:
+        for (index, (bill, _, _, _)), flags in zip(items, anomalies):
+            if flags:
+                results.append({'row': index, 'bill_id': bill['_id'], 'success': False,
+                                'message': '; '.join(flags), 'warnings': flags})
+        kept = [(item, flags) for item, flags in zip(items, anomalies) if not flags]
+        items = [item for item, _ in kept]
+        anomalies = [flags for _, flags in kept]
+
+    # Compute fees for all valid rows in one vectorized pass
+    fees_list = calculate_finalize_fees_batch([item for _, item in items])
+
+    timestamp = get_timestamp()
+    recorded_at = datetime.datetime.utcnow()
+    # Marks the bills this request finalized (a row is skipped if another request changed it first)
+    finalize_id = uuid.uuid4().hex
+    operations = []
+    rows = []
+    for (index, (bill, e_new, w_new, _)), fees, flags in zip(items, fees_list, anomalies):
+        operations.append(UpdateOne(
+            {'_id': bill['_id'], 'status': 'draft'},
+            {'$set': {**fees, 'status': 'pending', 'updated_at': timestamp, 'finalize_id': finalize_id}}
+        ))
+        rows.append({
+            'row': index,
+            'bill_id': bill['_id'],
+            'total': fees['total'],
+            'warnings': flags,
+            'reading': build_reading(bill, e_new, w_new, recorded_at),
+            'notification': build_outbox_record(
+                bill['user_id'],
+                "Hóa đơn điện nước",
+                f"Hóa đơn tháng {bill['month']} đã được chốt số điện nước. Vui lòng kiểm tra và thanh toán.",
+                "bill",
+                {"bill_id": bill['_id']}
+            )
+        })
+
+    def write(session):
+        result = bills_collection.bulk_write(operations, ordered=False, session=session)
+        if result.modified_count == len(operations):
+            applied = {r['bill_id'] for r in rows}
+        else:
+            applied = {b['_id'] for b in bills_collection.find(
+                {'_id': {'$in': [r['bill_id'] for r in rows]}, 'finalize_id': finalize_id},
+                {'_id': 1}, session=session
+            )}
+        update_room_meters([r['reading'] for r in rows if r['bill_id'] in applied], session=session)
+        enqueue_notifications([r['notification'] for r in rows if r['bill_id'] in applied], session=session)
+        return applied
+
+    applied = set()
+    if operations:
+        try:
+            applied = run_in_transaction(write)
+        except Exception as e:
+            return jsonify({'message': f'Lỗi: {str(e)}'}), 500
+        insert_readings([r['reading'] for r in rows if r['bill_id'] in applied])
+
+    for r in rows:
+        if r['bill_id'] in applied:
+            results.append({'row': r['row'], 'bill_id': r['bill_id'], 'success': True,
+                            'total': r['total'], 'warnings': r['warnings']})
+        else:
+            results.append({'row': r['row'], 'bill_id': r['bill_id'], 'success': False,
+                            'message': 'Hóa đơn đã được cập nhật bởi yêu cầu khác!', 'warnings': r['warnings']})
+    results.sort(key=lambda r: r['row'])
+    modified = len(applied)
+
+    return jsonify({
+        'message': f'Đã chốt {modified}/{len(readings)} hóa đơn.',
+        'finalized': modified,
+        'failed': sum(1 for r in results if not r['success']),
+        'flagged': sum(1 for r in results if r.get('warnings')),
+        'results': results
+    }), 200
+
+
+@app.route('/api/bills/meter-readings/<room_id>', methods=['GET'])
+@token_required
+@admin_required
+# Meter reading history of a room (admin only), oldest first
+def get_room_meter_readings(current_user, room_id):
+    try:
+        limit = max(0, int(request.args.get('limit', 0)))
+    except ValueError:
+        return jsonify({'message': 'limit không hợp lệ!'}), 400
+    readings = room_history(room_id, limit or None)
+    for r in readings:
+        r['recorded_at'] = to_iso(r['recorded_at'])
+    return jsonify({'room_id': room_id, 'readings': readings, 'total': len(readings)}), 200
+
+
 # ============== Internal APIs ==============
 
 @app.route('/internal/bills/unpaid', methods=['GET'])
 @internal_api_required
-# Get unpaid bills for notification reminders
+# Get unpaid bills for notification reminders.
+# Optional due_from/due_to (YYYY-MM-DD, inclusive) window; pages with limit/cursor,
+# or streams every match as NDJSON with ?format=ndjson (or Accept: application/x-ndjson)
 def internal_get_unpaid_bills():
-    bills = list(bills_collection.find({
-        'status': {'$in': ['pending', 'partial']}
-    }))
+    query = {'status': {'$in': ['pending', 'partial']}}
+    
+    due_range = {}
+    if request.args.get('due_from'):
+        due_range['$gte'] = request.args['due_from']
+    if request.args.get('due_to'):
+        due_range['$lte'] = request.args['due_to']
+    if due_range:
+        query['due_date'] = due_range
+    
+    projection = {'contract_id': 1, 'room_id': 1, 'user_id': 1, 'total': 1, 'due_date': 1, 'status': 1}
+    order = [('due_date', 1), ('_id', 1)]
+    
+    wants_ndjson = (request.args.get('format') == 'ndjson'
+                    or 'application/x-ndjson' in request.headers.get('Accept', ''))
+    if wants_ndjson:
+        def generate():
+            for bill in bills_collection.find(query, projection).sort(order).batch_size(1000):
+                yield json.dumps(format_unpaid_bill(bill), ensure_ascii=False) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        due_date, _, bill_id = cursor.partition('|')
+        due_range = query.setdefault('due_date', {})
+        due_range['$gte'] = max(due_range.get('$gte', due_date), due_date)
+        query['$or'] = [{'due_date': {'$gt': due_date}}, {'_id': {'$gt': bill_id}}]
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', 1000)), 5000))
+    except ValueError:
+        return jsonify({'message': 'limit không hợp lệ!'}), 400
+    
+    bills = list(bills_collection.find(query, projection).sort(order).limit(limit + 1))
+    has_more = len(bills) > limit
+    bills = bills[:limit]
     
     return jsonify({
-        'bills': [format_unpaid_bill(b) for b in bills]
+        'bills': [format_unpaid_bill(b) for b in bills],
+        'next_cursor': f"{bills[-1].get('due_date', '')}|{bills[-1]['_id']}" if has_more else None
     }), 200
 
 
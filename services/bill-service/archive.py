@@ -0,0 +1,201 @@
+# Bill Service - Cold Archival
+# Bills paid more than BILL_ARCHIVE_AFTER_MONTHS ago move from the hot `bills` collection
+# into per-year archive collections (bills_archive_<period_year>). Per-month totals of the
+# archived bills are kept in bill_archive_rollups so revenue reports stay complete.
+#
+# Usage (inside the bill-service container):
+#   python archive.py            # archive now
+#   python archive.py --dry-run  # only count bills that would move
+import argparse
+import datetime
+import heapq
+import time
+
+from pymongo import ReplaceOne, UpdateOne
+
+from config import Config
+from model import (
+    bills_collection, archive_collection, archive_years, archive_rollups_collection, ensure_archive_indexes,
+    bump_bills_version
+)
+from outbox import run_in_transaction
+from utils import created_sort_key, get_timestamp
+
+
+# ============== Archival ==============
+
+# ISO paid_at cutoff: bills paid before it are archived
+def archive_cutoff(now=None):
+    now = now or datetime.datetime.utcnow()
+    months = now.year * 12 + now.month - 1 - Config.BILL_ARCHIVE_AFTER_MONTHS
+    return datetime.datetime(months // 12, months % 12 + 1, 1).isoformat()
+
+
+def _archive_query(cutoff):
+    return {
+        'status': 'paid',
+        'paid_at': {'$gt': '', '$lt': cutoff},
+        'period_year': {'$type': 'number'}
+    }
+
+
+# Recompute rollups of the given years from their archive collections (idempotent)
+def refresh_rollups(years):
+    operations = []
+    for year in years:
+        pipeline = [
+            {'$group': {
+                '_id': '$period_month',
+                'bills_count': {'$sum': 1},
+                'total': {'$sum': '$total'},
+                'room_fee': {'$sum': '$room_fee'},
+                'electric_fee': {'$sum': '$electric_fee'},
+                'water_fee': {'$sum': '$water_fee'},
+                'other_fee': {'$sum': '$other_fee'},
+                'late_fee': {'$sum': {'$ifNull': ['$late_fee', 0]}}
+            }}
+        ]
+        for row in archive_collection(year).aggregate(pipeline):
+            month = row.pop('_id')
+            operations.append(UpdateOne(
+                {'_id': f"{year}-{month:02d}"},
+                {'$set': {**row, 'period_year': year, 'period_month': month, 'updated_at': get_timestamp()}},
+                upsert=True
+            ))
+    if operations:
+        archive_rollups_collection.bulk_write(operations, ordered=False)
+
+
+def archive_paid_bills(dry_run=False, now=None):
+    cutoff = archive_cutoff(now)
+    query = _archive_query(cutoff)
+    if dry_run:
+        count = bills_collection.count_documents(query)
+        print(f"[ARCHIVE] {count} bills paid before {cutoff} would be archived (dry run)")
+        return {'archived': 0, 'eligible': count}
+
+    archived = 0
+    years = set()
+    while True:
+        bills = list(bills_collection.find(query).limit(Config.BILL_ARCHIVE_BATCH_SIZE))
+        if not bills:
+            break
+
+        by_year = {}
+        archived_at = datetime.datetime.utcnow()
+        for bill in bills:
+            by_year.setdefault(int(bill['period_year']), []).append({**bill, 'archived_at': archived_at})
+        ids = [b['_id'] for b in bills]
+
+        # Copy first (replace = safe to repeat), then delete from the hot collection
+        def move(session):
+            for year, docs in by_year.items():
+                archive_collection(year).bulk_write(
+                    [ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in docs],
+                    ordered=False, session=session
+                )
+            return bills_collection.delete_many({'_id': {'$in': ids}, 'status': 'paid'}, session=session).deleted_count
+
+        deleted = run_in_transaction(move)
+        archived += deleted
+        years.update(by_year)
+        if deleted == 0:
+            break
+
+    for year in years:
+        ensure_archive_indexes(year)
+    refresh_rollups(sorted(years))
+    if archived:
+        bump_bills_version()
+
+    print(f"[ARCHIVE] Archived {archived} bills paid before {cutoff} into years {sorted(years)}")
+    return {'archived': archived, 'years': sorted(years)}
+
+
+# ============== Reads ==============
+
+# Archive years a listing must consult: the requested year, or every year when include_all
+def years_for_request(year=None, include_all=False):
+    existing = archive_years()
+    if include_all:
+        return existing
+    if year is not None:
+        return [year] if year in existing else []
+    return []
+
+
+# Look up one bill in the archives, newest year first
+def find_archived_bill(bill_id):
+    for year in sorted(archive_years(), reverse=True):
+        bill = archive_collection(year).find_one({'_id': bill_id})
+        if bill:
+            return bill
+    return None
+
+
+# Count and total of archived bills (all paid): from the rollups for everyone, or one
+# indexed $group per archive year for a single tenant (rollups are not kept per user)
+def archived_paid_totals(user_id=None):
+    group = {'_id': None, 'count': {'$sum': 1}, 'total': {'$sum': {'$ifNull': ['$total', 0]}}}
+    if user_id is None:
+        sources = [(archive_rollups_collection, {})]
+        group = {'_id': None, 'count': {'$sum': '$bills_count'}, 'total': {'$sum': '$total'}}
+    else:
+        sources = [(archive_collection(y), {'user_id': user_id}) for y in archive_years()]
+
+    count, total = 0, 0
+    for collection, match in sources:
+        for row in collection.aggregate([{'$match': match}, {'$group': group}]):
+            count += row['count']
+            total += row['total']
+    return count, total
+
+
+# Whether the hot collection or the given archives still hold bills with a string or missing
+# created_at (not yet migrated by migrate_bills.py); the lookups are served by the created_at
+# indexes and the answer is cached for LEGACY_DATES_CHECK_SECONDS
+LEGACY_DATES_CHECK_SECONDS = 60
+_legacy_dates = {}
+
+
+def has_legacy_created_at(years):
+    key = tuple(years)
+    cached = _legacy_dates.get(key)
+    now = time.monotonic()
+    if cached and now - cached[1] < LEGACY_DATES_CHECK_SECONDS:
+        return cached[0]
+    sources = [bills_collection] + [archive_collection(y) for y in years]
+    found = any(
+        c.find_one(query, {'_id': 1}) is not None
+        for c in sources
+        for query in ({'created_at': {'$type': 'string'}}, {'created_at': None})
+    )
+    _legacy_dates[key] = (found, now)
+    return found
+
+
+# Run the same keyset query on the hot collection and the given archive years, merged in
+# (created_at desc, _id desc) order; returns at most `limit` bills
+def find_bills_with_archive(query, projection, limit, years):
+    sort = [('created_at', -1), ('_id', -1)]
+    sources = [bills_collection] + [archive_collection(y) for y in years]
+    pages = [list(c.find(query, projection).sort(sort).limit(limit)) for c in sources]
+
+    merged = []
+    seen = set()
+    for bill in heapq.merge(*pages, key=created_sort_key, reverse=True):
+        # A bill can briefly exist in both places while it is being moved
+        if bill['_id'] in seen:
+            continue
+        seen.add(bill['_id'])
+        merged.append(bill)
+        if len(merged) == limit:
+            break
+    return merged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive bills paid long ago')
+    parser.add_argument('--dry-run', action='store_true', help='Count bills without moving them')
+    args = parser.parse_args()
+    archive_paid_bills(dry_run=args.dry_run)
@@ -0,0 +1,332 @@
+# Bill Service - Tariff Engine
+# Evaluates electricity/water charges for whole batches of bills with NumPy.
+# A tariff is a list of tiers [{'limit': kWh or m3 upper bound, 'price': VND}, ...],
+# the last tier has limit None (unbounded). Rooms without tiers are charged a flat price.
+#
+# Usage (inside the bill-service container):
+#   python billing.py --check                    (vectorized vs per-bill scalar results, incl. tier edges)
+#   python billing.py --benchmark --bills 100000
+import argparse
+import random
+import time
+
+import numpy as np
+
+from config import Config
+
+
+DEFAULT_ELECTRIC_PRICE = 3500
+DEFAULT_WATER_PRICE = 15000
+
+
+# ============== Tariff Resolution ==============
+
+# Parse tariff string "50:1806,100:1866,:3151" into tier list
+def parse_tiers(spec):
+    tiers = []
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        limit, _, price = part.rpartition(':')
+        tiers.append({
+            'limit': float(limit) if limit.strip() else None,
+            'price': float(price)
+        })
+    return normalize_tiers(tiers)
+
+
+# Validate tier list; returns None when empty
+def normalize_tiers(tiers):
+    if not tiers:
+        return None
+    normalized = []
+    last_limit = 0.0
+    for i, tier in enumerate(tiers):
+        limit = tier.get('limit')
+        price = float(tier.get('price', 0))
+        if limit is None or i == len(tiers) - 1:
+            normalized.append({'limit': None, 'price': price})
+            break
+        limit = float(limit)
+        if limit <= last_limit:
+            raise ValueError('Bậc giá phải tăng dần!')
+        normalized.append({'limit': limit, 'price': price})
+        last_limit = limit
+    return normalized
+
+
+ELECTRIC_TIERS = parse_tiers(Config.ELECTRIC_TARIFF)
+WATER_TIERS = parse_tiers(Config.WATER_TARIFF)
+
+
+# Pick the tariff for one bill: bill/room override > service tariff > flat price.
+# Returns a tier list, or a float for a flat price.
+def resolve_tiers(data, kind):
+    override = data.get(f'{kind}_tiers')
+    if override:
+        return normalize_tiers(override)
+    default = ELECTRIC_TIERS if kind == 'electric' else WATER_TIERS
+    if default:
+        return default
+    fallback = DEFAULT_ELECTRIC_PRICE if kind == 'electric' else DEFAULT_WATER_PRICE
+    price = data.get(f'{kind}_price')
+    return float(fallback if price is None else price)
+
+
+# Error message for a row whose tier overrides are invalid, None when both resolve.
+# compute_bills() validates a whole batch at once, so callers check rows first.
+def tier_error(data):
+    try:
+        resolve_tiers(data, 'electric')
+        resolve_tiers(data, 'water')
+    except ValueError as e:
+        return str(e)
+    except (AttributeError, TypeError):
+        return 'Bậc giá không hợp lệ!'
+    return None
+
+
+# resolve_tiers() that normalizes each distinct override schedule once per batch
+def _cached_resolver():
+    cache = {}
+    # Rows built from the same room document share the override list object
+    by_object = {}
+
+    def resolve(data, kind):
+        override = data.get(f'{kind}_tiers')
+        if not override:
+            return resolve_tiers(data, kind)
+        tiers = by_object.get(id(override))
+        if tiers is None:
+            key = tuple((t.get('limit'), t.get('price')) for t in override)
+            if key not in cache:
+                cache[key] = normalize_tiers(override)
+            tiers = by_object[id(override)] = cache[key]
+        return tiers
+
+    return resolve
+
+
+# Fraction of the month billed (pro-rata first month), 1.0 when unknown
+def billing_ratio(data):
+    try:
+        days = float(data.get('billing_days') or 0)
+        total = float(data.get('days_in_month') or 0)
+    except (TypeError, ValueError):
+        return 1.0
+    if days <= 0 or total <= 0:
+        return 1.0
+    return min(days / total, 1.0)
+
+
+# ============== Vectorized Evaluation ==============
+
+# Charge usage[i] against the same tier schedule scaled by ratio[i]
+def tiered_charge(usage, tiers, ratio):
+    usage = np.asarray(usage, dtype=np.float64)
+    if len(tiers) == 1:
+        return usage * tiers[0]['price']
+
+    upper = np.array([t['limit'] if t['limit'] is not None else np.inf for t in tiers])
+    lower = np.concatenate(([0.0], upper[:-1]))
+    prices = np.array([t['price'] for t in tiers])
+
+    # EVN scales tier widths by the number of billed days
+    ratio = np.asarray(ratio, dtype=np.float64)[:, None]
+    upper = upper[None, :] * ratio
+    lower = lower[None, :] * ratio
+
+    in_tier = np.clip(usage[:, None] - lower, 0, upper - lower)
+    return in_tier @ prices
+
+
+# Charge every row's usage against its own tariff, grouping identical tier schedules
+def _charge_column(usage, tariffs, ratio):
+    flat = np.fromiter(
+        (t if isinstance(t, float) else np.nan for t in tariffs),
+        dtype=np.float64, count=len(tariffs)
+    )
+    charges = usage * np.nan_to_num(flat)
+
+    groups = {}
+    for i in np.flatnonzero(np.isnan(flat)):
+        groups.setdefault(id(tariffs[i]), []).append(i)
+
+    # Overrides are normalized per row, so merge groups with equal schedules
+    schedules = {}
+    for rows in groups.values():
+        tiers = tariffs[rows[0]]
+        key = tuple((t['limit'], t['price']) for t in tiers)
+        schedules.setdefault(key, (tiers, []))[1].extend(rows)
+
+    for tiers, rows in schedules.values():
+        rows = np.array(rows)
+        charges[rows] = tiered_charge(usage[rows], tiers, ratio[rows])
+    return charges
+
+
+# Compute usage, fees and totals for a batch of bill inputs.
+# Each row uses calculate_bill keys (electric_old/new, water_old/new, electric_price,
+# water_price, room_fee, other_fee) plus optional *_tiers, billing_days, days_in_month.
+def compute_bills(rows):
+    n = len(rows)
+    if n == 0:
+        return []
+
+    def column(key, default=0):
+        return np.fromiter(
+            (float(default if r.get(key) is None else r.get(key)) for r in rows),
+            dtype=np.float64, count=n
+        )
+
+    ratio = np.fromiter((billing_ratio(r) for r in rows), dtype=np.float64, count=n)
+    electric_usage = np.maximum(0, column('electric_new') - column('electric_old'))
+    water_usage = np.maximum(0, column('water_new') - column('water_old'))
+
+    resolve = _cached_resolver()
+    electric_fee = _charge_column(electric_usage, [resolve(r, 'electric') for r in rows], ratio)
+    water_fee = _charge_column(water_usage, [resolve(r, 'water') for r in rows], ratio)
+    room_fee = column('room_fee')
+    other_fee = column('other_fee')
+    total = room_fee + electric_fee + water_fee + other_fee
+
+    return [
+        {
+            'electric_usage': float(electric_usage[i]),
+            'electric_fee': float(electric_fee[i]),
+            'water_usage': float(water_usage[i]),
+            'water_fee': float(water_fee[i]),
+            'room_fee': float(room_fee[i]),
+            'other_fee': float(other_fee[i]),
+            'total': float(total[i])
+        }
+        for i in range(n)
+    ]
+
+
+# Pro-rata room fee for a batch of contracts, rounded to whole VND
+def prorate_room_fees(monthly_rents, billing_days, days_in_month):
+    rents = np.asarray(monthly_rents, dtype=np.float64)
+    days = np.asarray(billing_days, dtype=np.float64)
+    return np.round(rents * days / float(days_in_month), 0)
+
+
+# ============== Scalar Reference ==============
+
+# Per-bill evaluation of the same tariff rules, one tier at a time
+def scalar_charge(usage, tiers, ratio):
+    if isinstance(tiers, float):
+        return usage * tiers
+    charge = 0.0
+    lower = 0.0
+    for tier in tiers:
+        upper = tier['limit'] * ratio if tier['limit'] is not None else float('inf')
+        if usage <= lower:
+            break
+        charge += (min(usage, upper) - lower) * tier['price']
+        lower = upper
+    return charge
+
+
+def compute_bill_scalar(row):
+    def value(key):
+        return float(row.get(key) or 0)
+
+    ratio = billing_ratio(row)
+    electric_usage = max(0.0, value('electric_new') - value('electric_old'))
+    water_usage = max(0.0, value('water_new') - value('water_old'))
+    electric_fee = scalar_charge(electric_usage, resolve_tiers(row, 'electric'), ratio)
+    water_fee = scalar_charge(water_usage, resolve_tiers(row, 'water'), ratio)
+    return {
+        'electric_usage': electric_usage,
+        'electric_fee': electric_fee,
+        'water_usage': water_usage,
+        'water_fee': water_fee,
+        'room_fee': value('room_fee'),
+        'other_fee': value('other_fee'),
+        'total': value('room_fee') + electric_fee + water_fee + value('other_fee')
+    }
+
+
+# ============== Check / Benchmark ==============
+
+SAMPLE_ELECTRIC_TIERS = parse_tiers('50:1806,100:1866,200:2167,300:2729,400:3050,:3151')
+SAMPLE_WATER_TIERS = parse_tiers('10:5973,20:7052,30:8669,:15929')
+
+
+def _synthetic_rows(count, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            'electric_old': rng.randint(0, 5000),
+            'water_old': rng.randint(0, 500),
+            'electric_price': rng.choice([3000, 3500, 4000]),
+            'water_price': rng.choice([10000, 15000]),
+            'room_fee': rng.choice([2500000, 3000000, 3500000]),
+            'other_fee': rng.choice([0, 50000])
+        }
+        if i % 4:
+            row['electric_tiers'] = SAMPLE_ELECTRIC_TIERS
+            row['water_tiers'] = SAMPLE_WATER_TIERS
+        if i % 5 == 0:
+            row['billing_days'] = rng.randint(1, 30)
+            row['days_in_month'] = 30
+        ratio = billing_ratio(row)
+        # Usage on a tier boundary, just around one, or anywhere (incl. meter going backwards)
+        edge = rng.choice([l['limit'] for l in SAMPLE_ELECTRIC_TIERS[:-1]]) * ratio
+        row['electric_new'] = row['electric_old'] + rng.choice([
+            edge, edge - 0.5, edge + 0.5, 0, rng.uniform(0, 600), -rng.uniform(0, 10)
+        ])
+        edge = rng.choice([l['limit'] for l in SAMPLE_WATER_TIERS[:-1]]) * ratio
+        row['water_new'] = row['water_old'] + rng.choice([edge, edge - 0.5, edge + 0.5, 0, rng.uniform(0, 60)])
+        rows.append(row)
+    return rows
+
+
+# Rows whose vectorized result differs from the scalar reference: [(index, key, vectorized, scalar)]
+def check_equivalence(rows):
+    mismatches = []
+    for i, (vectorized, row) in enumerate(zip(compute_bills(rows), rows)):
+        scalar = compute_bill_scalar(row)
+        for key, expected in scalar.items():
+            if not np.isclose(vectorized[key], expected, rtol=1e-9, atol=1e-6):
+                mismatches.append((i, key, vectorized[key], expected))
+    return mismatches
+
+
+def benchmark(count):
+    rows = _synthetic_rows(count)
+
+    started = time.perf_counter()
+    compute_bills(rows)
+    vectorized_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for row in rows:
+        compute_bill_scalar(row)
+    scalar_ms = (time.perf_counter() - started) * 1000
+
+    print(f"[BENCHMARK] {count} bills")
+    print(f"  scalar loop   {scalar_ms:10.1f} ms")
+    print(f"  compute_bills {vectorized_ms:10.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tariff engine check and benchmark')
+    parser.add_argument('--check', action='store_true', help='Compare vectorized and scalar results')
+    parser.add_argument('--benchmark', action='store_true', help='Time vectorized vs scalar evaluation')
+    parser.add_argument('--bills', type=int, default=100000, help='Synthetic bills')
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches = check_equivalence(_synthetic_rows(min(args.bills, 20000)))
+        for index, key, vectorized, scalar in mismatches[:20]:
+            print(f"row {index} {key}: vectorized {vectorized} != scalar {scalar}")
+        print(f"[CHECK] {len(mismatches)} mismatches")
+        raise SystemExit(1 if mismatches else 0)
+    elif args.benchmark:
+        benchmark(args.bills)
+    else:
+        parser.print_help()
@@ -5,12 +5,45 @@ class Config:
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/bills_db')
     DB_NAME = 'bills_db'
     COLLECTION_NAME = 'bills'
+    OUTBOX_COLLECTION_NAME = 'notification_outbox'
+    REVENUE_OUTBOX_COLLECTION_NAME = 'revenue_outbox'
+    LATE_FEE_COLLECTION_NAME = 'late_fee_accruals'
+    SYNC_STATE_COLLECTION_NAME = 'sync_state'
+    METER_READINGS_COLLECTION_NAME = 'meter_readings'
+    ROOM_METERS_COLLECTION_NAME = 'room_meters'
+    ARCHIVE_COLLECTION_PREFIX = 'bills_archive_'
+    ARCHIVE_ROLLUP_COLLECTION_NAME = 'bill_archive_rollups'
+    VERSION_COLLECTION_NAME = 'data_versions'
     SERVICE_NAME = 'bill-service'
     SERVICE_PORT = int(os.getenv('SERVICE_PORT', '5007'))
     JWT_SECRET = os.getenv('JWT_SECRET', 'your-super-secret-key-change-this')
     CONSUL_HOST = os.getenv('CONSUL_HOST', 'localhost')
     CONSUL_PORT = int(os.getenv('CONSUL_PORT', '8500'))
     INTERNAL_API_KEY = os.getenv('INTERNAL_API_KEY', 'internal-secret-key')
+    # Tiered tariffs "limit:price,...,:price" (e.g. EVN "50:1806,100:1866,200:2167,300:2729,400:3050,:3151")
+    # Empty = flat electric_price/water_price per bill
+    ELECTRIC_TARIFF = os.getenv('ELECTRIC_TARIFF', '')
+    WATER_TARIFF = os.getenv('WATER_TARIFF', '')
+    # Late fee rules (JSON list), e.g. '[{"type": "per_day", "amount": 5000, "grace_days": 3, "cap": 200000}]'
+    # type: flat (VND once) | percentage (% of bill) | per_day (VND per overdue day); empty = disabled
+    LATE_FEE_RULES = os.getenv('LATE_FEE_RULES', '')
+    # Bill listing pagination
+    BILLS_PAGE_SIZE = int(os.getenv('BILLS_PAGE_SIZE', '50'))
+    BILLS_MAX_PAGE_SIZE = 200
+    # Notification / revenue event outbox dispatchers
+    OUTBOX_DISPATCH_INTERVAL = int(os.getenv('OUTBOX_DISPATCH_INTERVAL', '5'))  # seconds
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+    # Room price-change polling (recomputes draft bills)
+    ROOM_PRICE_SYNC_INTERVAL = int(os.getenv('ROOM_PRICE_SYNC_INTERVAL', '60'))  # seconds
+    ROOM_PRICE_SYNC_BATCH_SIZE = 500
+    # Meter reading anomaly check (robust z-score of monthly usage vs. the room's history)
+    READING_HISTORY_SIZE = 24  # months kept in room_meters
+    READING_MIN_HISTORY = 3
+    READING_ANOMALY_THRESHOLD = float(os.getenv('READING_ANOMALY_THRESHOLD', '4.0'))
+    # Cold archival of paid bills
+    BILL_ARCHIVE_AFTER_MONTHS = int(os.getenv('BILL_ARCHIVE_AFTER_MONTHS', '12'))
+    BILL_ARCHIVE_BATCH_SIZE = 1000
     DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
 
 MONGO_URI = Config.MONGO_URI
@@ -0,0 +1,136 @@
+# Bill Service - Late Fee Accrual
+# Daily batch job: one aggregation finds overdue unpaid bills with their days overdue,
+# fees are computed from LATE_FEE_RULES and applied with a single bulk_write.
+# Each bill is accrued at most once per day (late_fee_accrued_on) and every change is
+# recorded in the late_fee_accruals collection (_id = "<bill_id>:<date>").
+# A bill paid, re-statused or edited between the aggregation and the write is left alone
+# (the update is guarded on its status and total) and gets no history entry.
+import datetime
+import json
+import uuid
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import Config
+from model import bills_collection, late_fee_accruals_collection, bump_bills_version
+
+
+RULE_TYPES = ('flat', 'percentage', 'per_day')
+
+
+# Parse LATE_FEE_RULES, e.g. [{"type": "per_day", "amount": 5000, "grace_days": 3, "cap": 200000}]
+def load_rules(raw=None):
+    try:
+        rules = json.loads(raw if raw is not None else Config.LATE_FEE_RULES or '[]')
+    except ValueError as e:
+        print(f"[LATE FEE] Invalid LATE_FEE_RULES: {e}")
+        return []
+    return [r for r in rules if isinstance(r, dict) and r.get('type') in RULE_TYPES]
+
+
+# Late fee owed for a bill `days_overdue` days past due with amount `base` (total before late fees)
+def compute_late_fee(rules, base, days_overdue):
+    fee = 0.0
+    for rule in rules:
+        days = days_overdue - int(rule.get('grace_days', 0))
+        if days <= 0:
+            continue
+        amount = float(rule.get('amount', 0))
+        if rule['type'] == 'flat':
+            value = amount
+        elif rule['type'] == 'percentage':
+            value = base * amount / 100
+        else:
+            value = amount * days
+        if rule.get('cap') is not None:
+            value = min(value, float(rule['cap']))
+        fee += value
+    return round(fee, 0)
+
+
+# Overdue unpaid bills not yet accrued today, with days overdue computed server-side
+def _overdue_bills_pipeline(today):
+    today_str = today.strftime('%Y-%m-%d')
+    return [
+        {'$match': {
+            'status': {'$in': ['pending', 'partial']},
+            'due_date': {'$gt': '', '$lt': today_str},
+            'late_fee_accrued_on': {'$ne': today_str}
+        }},
+        {'$project': {
+            'total': 1,
+            'late_fee': {'$ifNull': ['$late_fee', 0]},
+            'days_overdue': {'$dateDiff': {
+                'startDate': {'$dateFromString': {'dateString': '$due_date', 'format': '%Y-%m-%d', 'onError': None}},
+                'endDate': datetime.datetime.combine(today, datetime.time()),
+                'unit': 'day'
+            }}
+        }},
+        {'$match': {'days_overdue': {'$gt': 0}}}
+    ]
+
+
+def accrue_late_fees(today=None):
+    rules = load_rules()
+    if not rules:
+        return {'processed': 0, 'updated': 0}
+
+    today = today or datetime.datetime.utcnow().date()
+    today_str = today.strftime('%Y-%m-%d')
+    now = datetime.datetime.utcnow()
+    # Marks the bills this run updated
+    run_id = uuid.uuid4().hex
+
+    operations = []
+    history = {}
+    processed = 0
+    for bill in bills_collection.aggregate(_overdue_bills_pipeline(today), allowDiskUse=True):
+        processed += 1
+        current = float(bill.get('late_fee') or 0)
+        base = float(bill.get('total') or 0) - current
+        fee = compute_late_fee(rules, base, bill['days_overdue'])
+
+        update = {'late_fee_accrued_on': today_str, 'late_fee_run': run_id}
+        if fee != current:
+            update['late_fee'] = fee
+            update['total'] = base + fee
+            history[bill['_id']] = {
+                '_id': f"{bill['_id']}:{today_str}",
+                'bill_id': bill['_id'],
+                'date': today_str,
+                'days_overdue': bill['days_overdue'],
+                'previous_fee': current,
+                'late_fee': fee,
+                'delta': fee - current,
+                'created_at': now
+            }
+        operations.append(UpdateOne(
+            {
+                '_id': bill['_id'],
+                'status': {'$in': ['pending', 'partial']},
+                'total': bill.get('total'),
+                'late_fee_accrued_on': {'$ne': today_str}
+            },
+            {'$set': update}
+        ))
+
+    updated = 0
+    if operations:
+        updated = bills_collection.bulk_write(operations, ordered=False).modified_count
+    if updated:
+        bump_bills_version()
+    if history and updated < len(operations):
+        # Keep history only for bills this run actually changed
+        applied = {b['_id'] for b in bills_collection.find(
+            {'_id': {'$in': list(history)}, 'late_fee_run': run_id}, {'_id': 1}
+        )}
+        history = {bill_id: h for bill_id, h in history.items() if bill_id in applied}
+    if history:
+        try:
+            late_fee_accruals_collection.insert_many(list(history.values()), ordered=False)
+        except BulkWriteError:
+            pass  # Already recorded today
+
+    print(f"[LATE FEE] {today_str}: {processed} overdue bills, {len(history)} fee changes")
+    return {'processed': processed, 'updated': updated, 'changed': len(history)}
@@ -0,0 +1,206 @@
+# Bill Service - Schema Migration
+# Normalizes legacy bills so every document carries numeric period_year/period_month,
+# a BSON created_at date and a single `total` field (legacy `total_amount` is folded in).
+#
+# Usage (inside the bill-service container):
+#   python migrate_bills.py            # migrate
+#   python migrate_bills.py --dry-run  # only count documents that would change
+#   python migrate_bills.py --benchmark --bills 1000000
+#       (legacy vs normalized revenue-by-month aggregation on synthetic bills in a scratch
+#        database, <DB_NAME>_benchmark, dropped afterwards)
+import argparse
+import datetime
+import random
+import time
+
+from pymongo import ASCENDING, MongoClient, UpdateOne
+
+from config import Config
+from model import bills_collection
+from utils import parse_period, to_datetime
+
+
+BATCH_SIZE = 1000
+
+
+# Bills still missing any canonical field
+LEGACY_QUERY = {'$or': [
+    {'period_year': {'$exists': False}},
+    {'period_month': {'$exists': False}},
+    {'created_at': {'$type': 'string'}},
+    {'total_amount': {'$exists': True}},
+    {'total': {'$exists': False}}
+]}
+
+PROJECTION = {'month': 1, 'year': 1, 'created_at': 1, 'total': 1, 'total_amount': 1,
+              'period_year': 1, 'period_month': 1}
+
+
+# Build the $set/$unset update for one legacy bill, or None if nothing to change
+def build_update(bill):
+    set_fields = {}
+    unset_fields = {}
+
+    if 'period_year' not in bill or 'period_month' not in bill:
+        year, month = parse_period(bill.get('month'), bill.get('year'))
+        if year is None:
+            created = to_datetime(bill.get('created_at'))
+            if created:
+                year, month = created.year, created.month
+        if year is not None:
+            set_fields['period_year'] = year
+            set_fields['period_month'] = month
+
+    if isinstance(bill.get('created_at'), str):
+        created = to_datetime(bill['created_at'])
+        if created:
+            set_fields['created_at'] = created
+
+    if 'total_amount' in bill:
+        if bill.get('total') is None:
+            set_fields['total'] = float(bill.get('total_amount') or 0)
+        unset_fields['total_amount'] = ''
+    elif 'total' not in bill:
+        set_fields['total'] = 0.0
+
+    update = {}
+    if set_fields:
+        update['$set'] = set_fields
+    if unset_fields:
+        update['$unset'] = unset_fields
+    return update or None
+
+
+def migrate(dry_run=False, collection=bills_collection):
+    scanned = 0
+    modified = 0
+    skipped = []
+    operations = []
+
+    for bill in collection.find(LEGACY_QUERY, PROJECTION).batch_size(BATCH_SIZE):
+        scanned += 1
+        update = build_update(bill)
+        if not update:
+            continue
+        if 'period_year' not in bill and 'period_year' not in update.get('$set', {}):
+            skipped.append(bill['_id'])
+        operations.append(UpdateOne({'_id': bill['_id']}, update))
+
+        if len(operations) >= BATCH_SIZE:
+            if not dry_run:
+                modified += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+
+    if operations and not dry_run:
+        modified += collection.bulk_write(operations, ordered=False).modified_count
+
+    print(f"[MIGRATE] Scanned {scanned} legacy bills, modified {modified}{' (dry run)' if dry_run else ''}")
+    if skipped:
+        print(f"[MIGRATE] {len(skipped)} bills have no parsable period: {skipped[:20]}")
+    return scanned, modified
+
+
+# ============== Benchmark ==============
+
+# Revenue by month before the migration: year matched by $regex / legacy year,
+# month parsed with $substr/$toInt, total with a total_amount fallback
+def legacy_revenue_pipeline(year):
+    return [
+        {'$match': {
+            'status': 'paid',
+            '$or': [{'month': {'$regex': f'^{year}'}}, {'year': int(year)}]
+        }},
+        {'$project': {
+            'total': {'$ifNull': ['$total', {'$ifNull': ['$total_amount', 0]}]},
+            'month_num': {'$cond': {
+                'if': {'$eq': [{'$type': '$month'}, 'string']},
+                'then': {'$toInt': {'$substr': ['$month', 5, 2]}},
+                'else': '$month'
+            }}
+        }},
+        {'$group': {'_id': '$month_num', 'revenue': {'$sum': '$total'}, 'bills_count': {'$sum': 1}}}
+    ]
+
+
+# Revenue by month on the normalized fields (report-service's get_revenue_by_month)
+def normalized_revenue_pipeline(year):
+    return [
+        {'$match': {'status': 'paid', 'period_year': int(year)}},
+        {'$group': {'_id': '$period_month', 'revenue': {'$sum': '$total'}, 'bills_count': {'$sum': 1}}}
+    ]
+
+
+def _legacy_bills(count):
+    rng = random.Random(42)
+    for i in range(count):
+        year, month = rng.randint(2019, 2026), rng.randint(1, 12)
+        bill = {
+            '_id': f"BENCH{i:07d}",
+            'status': rng.choice(['paid', 'paid', 'paid', 'pending', 'partial']),
+            'created_at': datetime.datetime(year, month, 1).isoformat()
+        }
+        # Half "YYYY-MM" + total (bill-service), half numeric month/year + total_amount (legacy)
+        if i % 2:
+            bill.update({'month': f"{year}-{month:02d}", 'total': float(rng.randint(2000, 6000) * 1000)})
+        else:
+            bill.update({'month': month, 'year': year, 'total_amount': float(rng.randint(2000, 6000) * 1000)})
+        yield bill
+
+
+def _timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def benchmark(count, repeat=5, year=2025):
+    client = MongoClient(Config.MONGO_URI)
+    scratch_db = f"{Config.DB_NAME}_benchmark"
+    client.drop_database(scratch_db)
+    collection = client[scratch_db][Config.COLLECTION_NAME]
+    try:
+        batch = []
+        for bill in _legacy_bills(count):
+            batch.append(bill)
+            if len(batch) == 10000:
+                collection.insert_many(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch)
+        # Indexes the legacy schema had
+        collection.create_index([('status', ASCENDING)])
+        collection.create_index([('month', ASCENDING), ('year', ASCENDING)])
+
+        before = list(collection.aggregate(legacy_revenue_pipeline(year)))
+        before_ms = _timed(lambda: list(collection.aggregate(legacy_revenue_pipeline(year))), repeat)
+
+        started = time.perf_counter()
+        migrate(collection=collection)
+        migrate_s = time.perf_counter() - started
+        collection.create_index([('status', ASCENDING), ('period_year', ASCENDING), ('period_month', ASCENDING)])
+
+        after = list(collection.aggregate(normalized_revenue_pipeline(year)))
+        after_ms = _timed(lambda: list(collection.aggregate(normalized_revenue_pipeline(year))), repeat)
+
+        same = sorted((r['_id'], r['revenue'], r['bills_count']) for r in before) == \
+            sorted((r['_id'], r['revenue'], r['bills_count']) for r in after)
+        print(f"[BENCHMARK] {count} bills, revenue by month for {year}")
+        print(f"  legacy ($regex/$substr/$ifNull)      {before_ms:10.1f} ms")
+        print(f"  normalized (status, period_year)     {after_ms:10.1f} ms")
+        print(f"  migration                            {migrate_s:10.1f} s")
+        print(f"  results identical: {same}")
+    finally:
+        client.drop_database(scratch_db)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Normalize bill period/date/total fields')
+    parser.add_argument('--dry-run', action='store_true', help='Count changes without writing')
+    parser.add_argument('--benchmark', action='store_true', help='Time legacy vs normalized aggregation')
+    parser.add_argument('--bills', type=int, default=1000000, help='Synthetic bills for --benchmark')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.bills)
+    else:
+        migrate(dry_run=args.dry_run)
@@ -1,5 +1,6 @@
 # Bill Service Database Models
 from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid
 from config import Config
 
 class Database:
@@ -11,21 +12,124 @@ class Database:
             cls._db = cls._client[Config.DB_NAME]
         return cls._instance
     
+    @property
+    def client(self):
+        return self._client
+    
     @property
     def bills(self):
         return self._db[Config.COLLECTION_NAME]
+    
+    @property
+    def notification_outbox(self):
+        return self._db[Config.OUTBOX_COLLECTION_NAME]
+    
+    @property
+    def revenue_outbox(self):
+        return self._db[Config.REVENUE_OUTBOX_COLLECTION_NAME]
+    
+    @property
+    def late_fee_accruals(self):
+        return self._db[Config.LATE_FEE_COLLECTION_NAME]
+    
+    @property
+    def sync_state(self):
+        return self._db[Config.SYNC_STATE_COLLECTION_NAME]
+    
+    @property
+    def meter_readings(self):
+        return self._db[Config.METER_READINGS_COLLECTION_NAME]
+    
+    @property
+    def room_meters(self):
+        return self._db[Config.ROOM_METERS_COLLECTION_NAME]
+    
+    @property
+    def archive_rollups(self):
+        return self._db[Config.ARCHIVE_ROLLUP_COLLECTION_NAME]
+    
+    @property
+    def data_versions(self):
+        return self._db[Config.VERSION_COLLECTION_NAME]
+    
+    # Per-year archive of settled bills
+    def archive(self, year):
+        return self._db[f"{Config.ARCHIVE_COLLECTION_PREFIX}{int(year)}"]
+    
+    def archive_years(self):
+        prefix = Config.ARCHIVE_COLLECTION_PREFIX
+        return sorted(
+            int(name[len(prefix):]) for name in self._db.list_collection_names()
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        )
+    
+    # Create meter_readings as a time-series collection (MongoDB 5.0+)
+    def ensure_meter_readings(self):
+        if Config.METER_READINGS_COLLECTION_NAME in self._db.list_collection_names():
+            return
+        try:
+            self._db.create_collection(
+                Config.METER_READINGS_COLLECTION_NAME,
+                timeseries={'timeField': 'recorded_at', 'metaField': 'room_id', 'granularity': 'hours'}
+            )
+        except CollectionInvalid:
+            pass
 
 _database = Database()
 bills_collection = _database.bills
+notification_outbox_collection = _database.notification_outbox
+revenue_outbox_collection = _database.revenue_outbox
+late_fee_accruals_collection = _database.late_fee_accruals
+sync_state_collection = _database.sync_state
+meter_readings_collection = _database.meter_readings
+room_meters_collection = _database.room_meters
+archive_rollups_collection = _database.archive_rollups
+archive_collection = _database.archive
+archive_years = _database.archive_years
+data_versions_collection = _database.data_versions
+
+# Indexes of the bills collection (query_plans.py checks the listing shapes against them)
+def create_bill_indexes(collection):
+    # Listing indexes: equality prefix + (created_at, _id) keyset order, no in-memory sort
+    collection.create_index([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+    collection.create_index([('room_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+    collection.create_index([('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+    collection.create_index([('created_at', DESCENDING), ('_id', DESCENDING)])
+    collection.create_index([('contract_id', ASCENDING), ('month', ASCENDING)])
+    collection.create_index([('status', ASCENDING), ('due_date', ASCENDING), ('_id', ASCENDING)])
+    collection.create_index([('status', ASCENDING), ('period_year', ASCENDING), ('period_month', ASCENDING)])
+    collection.create_index([('status', ASCENDING), ('paid_at', ASCENDING)])
 
 def init_indexes():
     try:
-        bills_collection.create_index([('user_id', ASCENDING)])
-        bills_collection.create_index([('room_id', ASCENDING)])
-        bills_collection.create_index([('status', ASCENDING)])
-        bills_collection.create_index([('created_at', DESCENDING)])
+        create_bill_indexes(bills_collection)
+        notification_outbox_collection.create_index([('status', ASCENDING), ('next_attempt_at', ASCENDING)])
+        # Drop delivered outbox records after 7 days
+        notification_outbox_collection.create_index([('sent_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600)
+        revenue_outbox_collection.create_index([('status', ASCENDING), ('next_attempt_at', ASCENDING)])
+        revenue_outbox_collection.create_index([('sent_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600)
+        late_fee_accruals_collection.create_index([('bill_id', ASCENDING), ('date', ASCENDING)])
+        _database.ensure_meter_readings()
+        meter_readings_collection.create_index([('room_id', ASCENDING), ('recorded_at', DESCENDING)])
         print("[DB] ✓ Bill indexes created")
     except Exception as e:
         print(f"[DB] Index: {e}")
 
 init_indexes()
+
+
+# Archive collections are created on demand, one per period year
+def ensure_archive_indexes(year):
+    collection = archive_collection(year)
+    collection.create_index([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+    collection.create_index([('room_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+    collection.create_index([('created_at', DESCENDING), ('_id', DESCENDING)])
+
+
+# Bills data version, read by report-service to invalidate cached reports
+def bump_bills_version():
+    data_versions_collection.update_one({'_id': 'bills'}, {'$inc': {'version': 1}}, upsert=True)
+
+
+def get_client():
+    return _database.client
@@ -0,0 +1,196 @@
+# Bill Service - Notification / Revenue Event Outbox
+# Notification intents and revenue events (bill paid / reverted) are stored in Mongo next to
+# the bill write and delivered by background dispatchers: notifications to
+# notification-service in batches, revenue events to report-service one by one (keyed by
+# event_id, which report-service de-duplicates).
+import datetime
+import uuid
+import requests
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from config import Config, INTERNAL_API_KEY
+from model import get_client, notification_outbox_collection, revenue_outbox_collection
+from utils import get_service_url
+
+
+# ============== Transactions ==============
+
+# Run callback(session) in a transaction; standalone Mongo (no replica set) runs it without one
+def run_in_transaction(callback):
+    try:
+        with get_client().start_session() as session:
+            return session.with_transaction(callback)
+    except OperationFailure as e:
+        # 20 = IllegalOperation: transactions need a replica set
+        if e.code != 20:
+            raise
+    return callback(None)
+
+
+# ============== Enqueue ==============
+
+# Build an outbox record; its _id is reused as the notification _id so redelivery is idempotent
+def build_outbox_record(user_id, title, message, notification_type, metadata=None):
+    now = datetime.datetime.utcnow()
+    return {
+        '_id': f"N{uuid.uuid4().hex[:10]}",
+        'user_id': str(user_id),
+        'title': title,
+        'message': message,
+        'type': notification_type,
+        'metadata': metadata or {},
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'last_error': None,
+        'created_at': now,
+        'sent_at': None
+    }
+
+
+# Store notification intents (use the same session as the bill write)
+def enqueue_notifications(records, session=None):
+    if records:
+        notification_outbox_collection.insert_many(records, ordered=False, session=session)
+
+
+# Revenue event for a bill paid (sign 1) or reverted (sign -1); None for bills without a period
+def build_revenue_event(bill, event_id, sign=1):
+    if bill.get('period_year') is None:
+        return None
+    now = datetime.datetime.utcnow()
+    return {
+        '_id': event_id,
+        'event': {
+            'event_id': event_id,
+            'source': 'bills',
+            'year': bill['period_year'],
+            'month': bill['period_month'],
+            'amount': sign * float(bill.get('total', 0)),
+            'count': sign
+        },
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'last_error': None,
+        'created_at': now,
+        'sent_at': None
+    }
+
+
+# Store revenue events (use the same session as the bill write); an event id is queued once
+def enqueue_revenue_events(records, session=None):
+    operations = [UpdateOne({'_id': r['_id']}, {'$setOnInsert': r}, upsert=True) for r in records if r]
+    if operations:
+        revenue_outbox_collection.bulk_write(operations, ordered=False, session=session)
+
+
+# ============== Dispatcher ==============
+
+def _backoff_seconds(attempts):
+    return min(5 * (2 ** attempts), 3600)
+
+
+# POST one batch to notification-service's bulk endpoint
+def _deliver(records):
+    payload = {
+        'notifications': [
+            {
+                '_id': r['_id'],
+                'user_id': r['user_id'],
+                'title': r['title'],
+                'message': r['message'],
+                'type': r['type'],
+                'metadata': r.get('metadata') or {}
+            }
+            for r in records
+        ]
+    }
+    response = requests.post(
+        f"{get_service_url('notification-service')}/api/notifications/bulk",
+        json=payload,
+        headers={'X-Internal-Api-Key': INTERNAL_API_KEY, 'Content-Type': 'application/json'},
+        timeout=10
+    )
+    if not response.ok:
+        raise RuntimeError(f"notification-service {response.status_code}: {response.text[:200]}")
+
+
+# Drain due outbox records in batches; failed batches are retried with exponential backoff
+def dispatch_notification_outbox():
+    delivered = 0
+    while True:
+        now = datetime.datetime.utcnow()
+        records = list(notification_outbox_collection.find(
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}}
+        ).sort('next_attempt_at', 1).limit(Config.OUTBOX_BATCH_SIZE))
+        if not records:
+            break
+
+        ids = [r['_id'] for r in records]
+        try:
+            _deliver(records)
+        except Exception as e:
+            print(f"[OUTBOX] Delivery failed for {len(records)} notifications: {e}")
+            for r in records:
+                attempts = r.get('attempts', 0) + 1
+                notification_outbox_collection.update_one({'_id': r['_id']}, {'$set': {
+                    'status': 'failed' if attempts >= Config.OUTBOX_MAX_ATTEMPTS else 'pending',
+                    'attempts': attempts,
+                    'next_attempt_at': now + datetime.timedelta(seconds=_backoff_seconds(attempts)),
+                    'last_error': str(e)
+                }})
+            break
+
+        notification_outbox_collection.update_many(
+            {'_id': {'$in': ids}},
+            {'$set': {'status': 'sent', 'sent_at': datetime.datetime.utcnow()}, '$inc': {'attempts': 1}}
+        )
+        delivered += len(records)
+
+    if delivered:
+        print(f"[OUTBOX] Delivered {delivered} notifications")
+    return delivered
+
+
+# Post due revenue events to report-service; failed events are retried with exponential backoff
+def dispatch_revenue_outbox():
+    delivered = 0
+    now = datetime.datetime.utcnow()
+    records = list(revenue_outbox_collection.find(
+        {'status': 'pending', 'next_attempt_at': {'$lte': now}}
+    ).sort('next_attempt_at', 1).limit(Config.OUTBOX_BATCH_SIZE))
+    if not records:
+        return 0
+
+    report_service_url = get_service_url('report-service')
+    for r in records:
+        try:
+            response = requests.post(
+                f"{report_service_url}/internal/reports/revenue-events",
+                json=r['event'],
+                headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+                timeout=10
+            )
+            if not response.ok:
+                raise RuntimeError(f"report-service {response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            attempts = r.get('attempts', 0) + 1
+            revenue_outbox_collection.update_one({'_id': r['_id']}, {'$set': {
+                'status': 'failed' if attempts >= Config.OUTBOX_MAX_ATTEMPTS else 'pending',
+                'attempts': attempts,
+                'next_attempt_at': now + datetime.timedelta(seconds=_backoff_seconds(attempts)),
+                'last_error': str(e)
+            }})
+            print(f"[OUTBOX] Revenue event {r['_id']} failed: {e}")
+            continue
+
+        revenue_outbox_collection.update_one({'_id': r['_id']}, {
+            '$set': {'status': 'sent', 'sent_at': datetime.datetime.utcnow()}, '$inc': {'attempts': 1}
+        })
+        delivered += 1
+
+    if delivered:
+        print(f"[OUTBOX] Delivered {delivered} revenue events")
+    return delivered
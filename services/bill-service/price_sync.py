@@ -0,0 +1,136 @@
+# Bill Service - Room Price Sync
+# Polls room-service's price-change feed and recomputes the affected draft bills
+# in one bulk_write. The feed cursor (prices_updated_at, _id) is kept in sync_state
+# so each change is applied once; re-applying a change is harmless.
+import requests
+from pymongo import UpdateOne
+
+from billing import compute_bills, normalize_tiers
+from config import Config, INTERNAL_API_KEY
+from model import bills_collection, sync_state_collection, bump_bills_version
+from utils import get_service_url, get_timestamp
+
+
+STATE_ID = 'room_prices'
+
+DRAFT_PROJECTION = {
+    'room_id': 1, 'room_fee': 1, 'other_fee': 1, 'late_fee': 1,
+    'electric_old': 1, 'electric_new': 1, 'water_old': 1, 'water_new': 1,
+    'billing_days': 1, 'days_in_month': 1
+}
+
+
+# Fetch one page of rooms whose prices changed after the cursor
+def fetch_price_changes(since, after_id, limit):
+    response = requests.get(
+        f"{get_service_url('room-service')}/internal/rooms/price-changes",
+        params={'since': since, 'after_id': after_id, 'limit': limit},
+        headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+# Rooms whose tier overrides the billing engine rejects are logged and skipped,
+# so one bad room does not hold back the feed cursor
+def _valid_rooms(rooms):
+    valid = {}
+    for room_id, room in rooms.items():
+        try:
+            normalize_tiers(room.get('electric_tiers'))
+            normalize_tiers(room.get('water_tiers'))
+        except (AttributeError, TypeError, ValueError) as e:
+            print(f"[PRICE SYNC] Skipping room {room_id}: invalid tiers ({e})")
+            continue
+        valid[room_id] = room
+    return valid
+
+
+# Build draft-bill updates for the given rooms ({room_id: price fields})
+def build_draft_updates(rooms):
+    rooms = _valid_rooms(rooms)
+    if not rooms:
+        return []
+    drafts = list(bills_collection.find(
+        {'room_id': {'$in': list(rooms)}, 'status': 'draft'}, DRAFT_PROJECTION
+    ))
+    if not drafts:
+        return []
+
+    rows = []
+    for bill in drafts:
+        room = rooms[bill['room_id']]
+        rows.append({
+            **bill,
+            'electric_price': room['electricity_price'],
+            'water_price': room['water_price'],
+            'electric_tiers': room.get('electric_tiers'),
+            'water_tiers': room.get('water_tiers')
+        })
+
+    now = get_timestamp()
+    operations = []
+    for bill, row, amounts in zip(drafts, rows, compute_bills(rows)):
+        update = {'$set': {
+            'electric_price': row['electric_price'],
+            'water_price': row['water_price'],
+            'electric_fee': amounts['electric_fee'],
+            'water_fee': amounts['water_fee'],
+            'total': amounts['total'] + float(bill.get('late_fee') or 0),
+            'updated_at': now
+        }}
+        # Rooms without tier overrides fall back to the service tariff
+        unset = {}
+        for kind in ('electric', 'water'):
+            if row[f'{kind}_tiers']:
+                update['$set'][f'{kind}_tiers'] = row[f'{kind}_tiers']
+            else:
+                unset[f'{kind}_tiers'] = ''
+        if unset:
+            update['$unset'] = unset
+        # Skip bills finalized since they were read
+        operations.append(UpdateOne({'_id': bill['_id'], 'status': 'draft'}, update))
+    return operations
+
+
+# Apply all pending room price changes to draft bills
+def sync_room_prices():
+    state = sync_state_collection.find_one({'_id': STATE_ID}) or {}
+    since = state.get('since', '')
+    after_id = state.get('after_id', '')
+    limit = Config.ROOM_PRICE_SYNC_BATCH_SIZE
+
+    rooms_changed = 0
+    bills_updated = 0
+    while True:
+        try:
+            page = fetch_price_changes(since, after_id, limit)
+        except Exception as e:
+            print(f"[PRICE SYNC] Error fetching room price changes: {e}")
+            break
+
+        rooms = page.get('rooms', [])
+        if not rooms:
+            break
+
+        operations = build_draft_updates({r['_id']: r for r in rooms})
+        if operations:
+            bills_updated += bills_collection.bulk_write(operations, ordered=False).modified_count
+        rooms_changed += len(rooms)
+
+        since = rooms[-1]['prices_updated_at']
+        after_id = rooms[-1]['_id']
+        sync_state_collection.update_one(
+            {'_id': STATE_ID},
+            {'$set': {'since': since, 'after_id': after_id}},
+            upsert=True
+        )
+        if not page.get('has_more'):
+            break
+
+    if bills_updated:
+        bump_bills_version()
+    if rooms_changed:
+        print(f"[PRICE SYNC] {rooms_changed} rooms changed, {bills_updated} draft bills recomputed")
+    return {'rooms': rooms_changed, 'updated': bills_updated}
@@ -0,0 +1,117 @@
+# Bill Service - Query Plan Check
+# Runs explain() for the supported bill query shapes and fails when a winning plan contains
+# a collection scan (COLLSCAN) or a blocking in-memory sort (SORT).
+# The check builds its own synthetic bills and the bills indexes in a scratch database,
+# <DB_NAME>_explain, which is dropped afterwards.
+#
+# Usage (inside the bill-service container):
+#   python query_plans.py
+#   python query_plans.py --bills 20000 --verbose
+import argparse
+import datetime
+import random
+
+from pymongo import MongoClient
+
+from config import Config
+from model import create_bill_indexes
+from utils import BILL_LIST_PROJECTION, cursor_condition, encode_cursor
+
+
+LIST_SORT = [('created_at', -1), ('_id', -1)]
+UNPAID_SORT = [('due_date', 1), ('_id', 1)]
+FORBIDDEN_STAGES = ('COLLSCAN', 'SORT')
+
+
+def _synthetic_bills(count):
+    rng = random.Random(7)
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        created = start + datetime.timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))
+        yield {
+            '_id': f"BILL{i:08d}",
+            'contract_id': f"C{i % 3000:05d}",
+            'room_id': f"R{i % 500:04d}",
+            'user_id': f"U{i % 3000:05d}",
+            'month': created.strftime('%Y-%m'),
+            'status': rng.choice(['draft', 'pending', 'partial', 'paid', 'paid', 'paid']),
+            'total': float(rng.randint(2000, 6000) * 1000),
+            'due_date': (created + datetime.timedelta(days=35)).strftime('%Y-%m-%d'),
+            'created_at': created
+        }
+
+
+# (name, cursor factory) for every query shape that must be served by an index
+def _query_shapes(collection):
+    first_page = list(collection.find({'user_id': 'U00001'}).sort(LIST_SORT).limit(2))
+    cursor = cursor_condition(encode_cursor(first_page[-1])) if first_page else {}
+    window = {'$gte': '2025-01-01', '$lte': '2025-03-31'}
+    return [
+        ('tenant list', lambda: collection.find({'user_id': 'U00001'}, BILL_LIST_PROJECTION).sort(LIST_SORT).limit(51)),
+        ('tenant list, next page', lambda: collection.find(
+            {'user_id': 'U00001', **cursor}, BILL_LIST_PROJECTION).sort(LIST_SORT).limit(51)),
+        ('room list', lambda: collection.find({'room_id': 'R0001'}, BILL_LIST_PROJECTION).sort(LIST_SORT).limit(51)),
+        ('admin list', lambda: collection.find({}, BILL_LIST_PROJECTION).sort(LIST_SORT).limit(51)),
+        ('admin list, next page', lambda: collection.find(cursor, BILL_LIST_PROJECTION).sort(LIST_SORT).limit(51)),
+        ('admin list by status', lambda: collection.find(
+            {'status': 'pending'}, BILL_LIST_PROJECTION).sort(LIST_SORT).limit(51)),
+        ('duplicate check (contract, month)', lambda: collection.find(
+            {'contract_id': 'C00001', 'month': '2025-01'}).limit(1)),
+        ('unpaid due window', lambda: collection.find(
+            {'status': {'$in': ['pending', 'partial']}, 'due_date': window}).sort(UNPAID_SORT).limit(1001)),
+    ]
+
+
+# Stage names of a winning plan (classic and slot-based explain output)
+def _stages(plan):
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += _stages(child)
+    return [s for s in stages if s]
+
+
+def check_query_plans(count, verbose=False):
+    client = MongoClient(Config.MONGO_URI)
+    scratch_db = f"{Config.DB_NAME}_explain"
+    client.drop_database(scratch_db)
+    collection = client[scratch_db][Config.COLLECTION_NAME]
+    failures = []
+    checked = 0
+    try:
+        create_bill_indexes(collection)
+        batch = []
+        for bill in _synthetic_bills(count):
+            batch.append(bill)
+            if len(batch) == 5000:
+                collection.insert_many(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch)
+
+        for name, query in _query_shapes(collection):
+            checked += 1
+            stages = _stages(query().explain()['queryPlanner']['winningPlan'])
+            bad = [s for s in stages if s in FORBIDDEN_STAGES]
+            if bad:
+                failures.append(name)
+            if bad or verbose:
+                print(f"  {'FAIL' if bad else 'ok  '} {name}: {' <- '.join(stages)}")
+    finally:
+        client.drop_database(scratch_db)
+
+    if failures:
+        print(f"[QUERY PLANS] {len(failures)} of {checked} shapes use a collection scan or in-memory sort")
+    else:
+        print(f"[QUERY PLANS] All {checked} shapes are index-backed")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check bill query plans with explain()')
+    parser.add_argument('--bills', type=int, default=5000, help='Synthetic bills in the scratch database')
+    parser.add_argument('--verbose', action='store_true', help='Print every plan')
+    args = parser.parse_args()
+    raise SystemExit(1 if check_query_plans(args.bills, args.verbose) else 0)
@@ -0,0 +1,197 @@
+# Bill Service - Meter Readings
+# Every finalized bill records its meter readings in two places:
+#   meter_readings - time-series collection (metaField room_id), full history per room
+#   room_meters    - one document per room with the latest reading and a capped array of
+#                    recent monthly usage, so latest-reading lookups and anomaly checks
+#                    are single _id reads
+#
+# Usage (inside the bill-service container):
+#   python readings.py --backfill   # rebuild history from already finalized bills
+import argparse
+
+import numpy as np
+from pymongo import UpdateOne
+
+from config import Config
+from model import bills_collection, meter_readings_collection, room_meters_collection
+from utils import to_datetime
+
+
+FINALIZED_STATUSES = ['pending', 'partial', 'paid']
+
+
+# ============== Recording ==============
+
+# Build the time-series document for one finalized bill
+def build_reading(bill, electric_new, water_new, recorded_at):
+    return {
+        'room_id': bill['room_id'],
+        'recorded_at': recorded_at,
+        'bill_id': bill['_id'],
+        'contract_id': bill.get('contract_id'),
+        'month': bill.get('month'),
+        'electric': float(electric_new),
+        'water': float(water_new),
+        'electric_usage': max(0.0, float(electric_new) - float(bill.get('electric_old') or 0)),
+        'water_usage': max(0.0, float(water_new) - float(bill.get('water_old') or 0))
+    }
+
+
+# Upsert the per-room latest reading and append to its recent usage arrays
+def build_room_meter_update(reading):
+    history = Config.READING_HISTORY_SIZE
+    return UpdateOne(
+        {'_id': reading['room_id']},
+        {
+            '$set': {
+                'electric': reading['electric'],
+                'water': reading['water'],
+                'bill_id': reading['bill_id'],
+                'recorded_at': reading['recorded_at']
+            },
+            '$push': {
+                'electric_usage': {'$each': [reading['electric_usage']], '$slice': -history},
+                'water_usage': {'$each': [reading['water_usage']], '$slice': -history}
+            }
+        },
+        upsert=True
+    )
+
+
+# Update room_meters for readings whose bill write applied (can join the bill transaction)
+def update_room_meters(readings, session=None):
+    if readings:
+        room_meters_collection.bulk_write(
+            [build_room_meter_update(r) for r in readings], ordered=True, session=session
+        )
+
+
+# Append readings to the time-series history (time-series writes cannot join a transaction)
+def insert_readings(readings):
+    if not readings:
+        return
+    try:
+        meter_readings_collection.insert_many(readings, ordered=False)
+    except Exception as e:
+        print(f"[READINGS] Failed to store meter history: {e}")
+
+
+# ============== Lookups ==============
+
+# Latest meter values per room: {room_id: (electric, water)}
+def latest_readings(room_ids):
+    return {
+        m['_id']: (m.get('electric', 0), m.get('water', 0))
+        for m in room_meters_collection.find(
+            {'_id': {'$in': list(room_ids)}}, {'electric': 1, 'water': 1}
+        )
+    }
+
+
+# Full reading history for one room, oldest first
+def room_history(room_id, limit=None):
+    cursor = meter_readings_collection.find(
+        {'room_id': room_id}, {'_id': 0}
+    ).sort('recorded_at', -1)
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(reversed(list(cursor)))
+
+
+# ============== Anomaly Detection ==============
+
+def _history_matrix(histories, size):
+    matrix = np.full((len(histories), size), np.nan)
+    for i, values in enumerate(histories):
+        if values:
+            values = values[-size:]
+            matrix[i, -len(values):] = values
+    return matrix
+
+
+# Robust z-scores of usage[i] against each room's history (median / MAD);
+# NaN where a room has fewer than READING_MIN_HISTORY past readings
+def usage_scores(usage, histories):
+    usage = np.asarray(usage, dtype=np.float64)
+    if len(usage) == 0:
+        return usage
+    matrix = _history_matrix(histories, Config.READING_HISTORY_SIZE)
+    counts = np.sum(~np.isnan(matrix), axis=1)
+    enough = counts >= Config.READING_MIN_HISTORY
+
+    scores = np.full(len(usage), np.nan)
+    if not enough.any():
+        return scores
+    rows = matrix[enough]
+    median = np.nanmedian(rows, axis=1)
+    mad = np.nanmedian(np.abs(rows - median[:, None]), axis=1) * 1.4826
+    # Flat histories have MAD 0: fall back to 10% of the median (at least 1 unit)
+    scale = np.maximum(mad, np.maximum(0.1 * median, 1.0))
+    scores[enough] = (usage[enough] - median) / scale
+    return scores
+
+
+# Flag readings far outside each room's history.
+# items: [(bill, electric_new, water_new), ...]; returns one list of reasons per item
+def detect_anomalies(items):
+    if not items:
+        return []
+    meters = {
+        m['_id']: m for m in room_meters_collection.find(
+            {'_id': {'$in': list({bill['room_id'] for bill, _, _ in items})}},
+            {'electric_usage': 1, 'water_usage': 1}
+        )
+    }
+    threshold = Config.READING_ANOMALY_THRESHOLD
+    flags = [[] for _ in items]
+
+    for kind, position, label in (('electric', 1, 'Số điện'), ('water', 2, 'Số nước')):
+        new = np.array([float(item[position]) for item in items])
+        old = np.array([float(item[0].get(f'{kind}_old') or 0) for item in items])
+        histories = [meters.get(bill['room_id'], {}).get(f'{kind}_usage') for bill, _, _ in items]
+        scores = usage_scores(np.maximum(new - old, 0), histories)
+
+        for i in np.flatnonzero(new < old):
+            flags[i].append(f'{label} mới nhỏ hơn số cũ')
+        for i in np.flatnonzero(np.abs(np.nan_to_num(scores)) > threshold):
+            direction = 'cao' if scores[i] > 0 else 'thấp'
+            flags[i].append(f'{label} tiêu thụ bất thường ({direction} hơn lịch sử, z={scores[i]:.1f})')
+    return flags
+
+
+# ============== Backfill ==============
+
+def backfill():
+    bills = list(bills_collection.find(
+        {'status': {'$in': FINALIZED_STATUSES}, 'electric_new': {'$ne': None}, 'water_new': {'$ne': None}},
+        {'room_id': 1, 'contract_id': 1, 'month': 1, 'electric_old': 1, 'electric_new': 1,
+         'water_old': 1, 'water_new': 1, 'created_at': 1, 'updated_at': 1}
+    ).sort([('created_at', 1), ('_id', 1)]))
+
+    readings = []
+    for bill in bills:
+        if not bill.get('room_id'):
+            continue
+        recorded_at = to_datetime(bill.get('updated_at')) or to_datetime(bill.get('created_at'))
+        if recorded_at:
+            readings.append(build_reading(bill, bill['electric_new'], bill['water_new'], recorded_at))
+
+    room_meters_collection.delete_many({})
+    meter_readings_collection.delete_many({})
+    for start in range(0, len(readings), 1000):
+        batch = readings[start:start + 1000]
+        update_room_meters(batch)
+        insert_readings(batch)
+
+    print(f"[READINGS] Backfilled {len(readings)} readings from {len(bills)} bills")
+    return len(readings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Meter reading history maintenance')
+    parser.add_argument('--backfill', action='store_true', help='Rebuild history from finalized bills')
+    args = parser.parse_args()
+    if args.backfill:
+        backfill()
+    else:
+        parser.print_help()
@@ -3,7 +3,9 @@ import datetime
 import requests
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from pymongo.errors import BulkWriteError
 from config import Config, INTERNAL_API_KEY, CONSUL_HOST, CONSUL_PORT
+from billing import prorate_room_fees
 
 
 def get_service_url(service_name):
@@ -44,7 +46,7 @@ def _compute_next_month_due_date(year, month, day=15):
 def generate_monthly_bills():
 # Generate draft bills for all active contracts on day 1 of each month
     
-    from model import bills_collection
+    from model import bills_collection, bump_bills_version
     
     now = datetime.datetime.utcnow()
     current_month = f"{now.year}-{now.month:02d}"
@@ -71,8 +73,14 @@ def generate_monthly_bills():
         
         print(f"[SCHEDULER] Found {len(active_contracts)} active contracts")
         
+        # Latest meter readings for every room in one lookup
+        from readings import latest_readings
+        meters = latest_readings(c.get('room_id') for c in active_contracts)
+        
         bills_created = 0
         bills_skipped = 0
+        new_bills = []
+        monthly_rents = []
         
         for contract in active_contracts:
             contract_id = contract.get('_id')
@@ -103,14 +111,16 @@ def generate_monthly_bills():
             except:
                 room = {}
             
-            # Get previous bill for old meter readings
-            prev_bill = bills_collection.find_one(
-                {'contract_id': contract_id},
-                sort=[('created_at', -1)]
-            )
-            
-            electric_old = prev_bill.get('electric_new', 0) if prev_bill else 0
-            water_old = prev_bill.get('water_new', 0) if prev_bill else 0
+            # Old meter readings: room's latest recorded reading, else the previous bill
+            if room_id in meters:
+                electric_old, water_old = meters[room_id]
+            else:
+                prev_bill = bills_collection.find_one(
+                    {'contract_id': contract_id},
+                    sort=[('created_at', -1)]
+                )
+                electric_old = prev_bill.get('electric_new', 0) if prev_bill else 0
+                water_old = prev_bill.get('water_new', 0) if prev_bill else 0
             
             # Calculate billing days (pro-rata for first month)
             import calendar
@@ -128,12 +138,9 @@ def generate_monthly_bills():
             except Exception as e:
                 print(f"[SCHEDULER] Error parsing start_date: {e}")
             
-            # Calculate pro-rata room fee
-            room_fee = float(monthly_rent) * billing_days / days_in_month
-            
-            # Create draft bill
+            # Create draft bill (room fee filled in below for the whole batch)
             import uuid
-            timestamp = datetime.datetime.utcnow().isoformat() + 'Z'
+            timestamp = datetime.datetime.utcnow()
             bill_id = f"BILL{uuid.uuid4().hex[:8].upper()}"
             
             new_bill = {
@@ -142,9 +149,11 @@ def generate_monthly_bills():
                 'room_id': room_id,
                 'user_id': user_id,
                 'month': current_month,
+                'period_year': now.year,
+                'period_month': now.month,
                 'billing_days': billing_days,
                 'days_in_month': days_in_month,
-                'room_fee': round(room_fee, 0),
+                'room_fee': 0,
                 'electric_old': electric_old,
                 'electric_new': None,  # Admin fills this
                 'electric_price': room.get('electricity_price', room.get('electric_price', 3500)),
@@ -154,7 +163,7 @@ def generate_monthly_bills():
                 'water_price': room.get('water_price', 15000),
                 'water_fee': 0,
                 'other_fee': 0,
-                'total': round(room_fee, 0),  # Initial = room rent only
+                'total': 0,  # Initial = room rent only
                 'status': 'draft',  # Draft until admin updates meters
                 # Due date is day 5 of NEXT month
                 'due_date': _compute_next_month_due_date(now.year, now.month, 5),
@@ -163,9 +172,41 @@ def generate_monthly_bills():
                 'auto_generated': True
             }
             
-            bills_collection.insert_one(new_bill)
-            bills_created += 1
-            print(f"[SCHEDULER] Created draft bill {bill_id} for contract {contract_id} ({billing_days} days)")
+            # Per-room tiered tariff overrides
+            for kind in ('electric', 'water'):
+                tiers = room.get(f'{kind}_tiers')
+                if tiers:
+                    new_bill[f'{kind}_tiers'] = tiers
+            
+            new_bills.append(new_bill)
+            monthly_rents.append(float(monthly_rent))
+        
+        if new_bills:
+            # Calculate pro-rata room fees for all drafts at once
+            room_fees = prorate_room_fees(
+                monthly_rents,
+                [b['billing_days'] for b in new_bills],
+                days_in_month
+            )
+            for new_bill, room_fee in zip(new_bills, room_fees):
+                new_bill['room_fee'] = float(room_fee)
+                new_bill['total'] = float(room_fee)
+            
+            try:
+                bills_collection.insert_many(new_bills, ordered=False)
+                bills_created = len(new_bills)
+            except BulkWriteError as e:
+                # Unordered insert: the other drafts are stored even if some rows fail
+                bills_created = e.details.get('nInserted', 0)
+                errors = e.details.get('writeErrors', [])
+                for err in errors:
+                    print(f"[SCHEDULER] Failed to create draft bill {new_bills[err['index']]['_id']}: {err.get('errmsg')}")
+                failed = {err['index'] for err in errors}
+                new_bills = [b for i, b in enumerate(new_bills) if i not in failed]
+            if bills_created:
+                bump_bills_version()
+            for new_bill in new_bills:
+                print(f"[SCHEDULER] Created draft bill {new_bill['_id']} for contract {new_bill['contract_id']} ({new_bill['billing_days']} days)")
         
         print(f"\n[SCHEDULER] Summary: {bills_created} created, {bills_skipped} skipped (already exist)")
         
@@ -187,6 +228,65 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # Accrue late fees on overdue bills daily at 00:30 UTC
+    from late_fees import accrue_late_fees
+    scheduler.add_job(
+        accrue_late_fees,
+        CronTrigger(hour=0, minute=30),
+        id='late_fees',
+        name='Accrue late fees',
+        replace_existing=True
+    )
+    
+    # Move long-settled bills to the yearly archives on day 2 of each month at 01:00 UTC
+    from archive import archive_paid_bills
+    scheduler.add_job(
+        archive_paid_bills,
+        CronTrigger(day=2, hour=1, minute=0),
+        id='bill_archive',
+        name='Archive paid bills',
+        replace_existing=True
+    )
+    
+    # Deliver queued bill notifications
+    from outbox import dispatch_notification_outbox
+    scheduler.add_job(
+        dispatch_notification_outbox,
+        'interval',
+        seconds=Config.OUTBOX_DISPATCH_INTERVAL,
+        id='notification_outbox',
+        name='Dispatch notification outbox',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Deliver queued revenue events (bill paid / reverted) to report-service
+    from outbox import dispatch_revenue_outbox
+    scheduler.add_job(
+        dispatch_revenue_outbox,
+        'interval',
+        seconds=Config.OUTBOX_DISPATCH_INTERVAL,
+        id='revenue_outbox',
+        name='Dispatch revenue event outbox',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Recompute draft bills when room prices change
+    from price_sync import sync_room_prices
+    scheduler.add_job(
+        sync_room_prices,
+        'interval',
+        seconds=Config.ROOM_PRICE_SYNC_INTERVAL,
+        id='room_price_sync',
+        name='Sync room prices into draft bills',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
     scheduler.start()
     print("[SCHEDULER] Started - Bills will be generated on day 1 of each month at 00:05 UTC")
     
@@ -1,9 +1,13 @@
 # Bill Service - Utility Functions
+import base64
+import csv
 import datetime
+import io
 import uuid
 import requests
-from config import CONSUL_HOST, CONSUL_PORT, INTERNAL_API_KEY
+from config import CONSUL_HOST, CONSUL_PORT
 from model import bills_collection
+from billing import compute_bills, tier_error
 
 
 # ============== ID & Timestamp ==============
@@ -21,61 +25,118 @@ def get_timestamp():
     return datetime.datetime.utcnow().isoformat()
 
 
+# ============== Period & Date Normalization ==============
+
+# Canonical (period_year, period_month) from "YYYY-MM" or legacy numeric month + year
+def parse_period(month, year=None):
+    try:
+        if isinstance(month, str) and '-' in month:
+            y, m = month.split('-')[:2]
+            y, m = int(y), int(m)
+        elif month not in (None, '') and year not in (None, ''):
+            y, m = int(year), int(month)
+        else:
+            return None, None
+    except (TypeError, ValueError):
+        return None, None
+    if not 1 <= m <= 12:
+        return None, None
+    return y, m
+
+
+# Convert ISO string (optionally with 'Z') to naive UTC datetime; datetimes pass through
+def to_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+# Serialize BSON dates back to ISO strings for API responses
+def to_iso(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
 # ============== Bill Calculation ==============
 
 # Calculate electric, water and total costs from meter readings
 def calculate_bill(data):
-    electric_old = float(data.get('electric_old', 0))
-    electric_new = float(data.get('electric_new', 0))
-    water_old = float(data.get('water_old', 0))
-    water_new = float(data.get('water_new', 0))
-    electric_price = float(data.get('electric_price', 3500))
-    water_price = float(data.get('water_price', 15000))
-    room_fee = float(data.get('room_fee', 0))
-    other_fee = float(data.get('other_fee', 0))
-    
-    electric_usage = max(0, electric_new - electric_old)
-    water_usage = max(0, water_new - water_old)
-    
-    electric_fee = electric_usage * electric_price
-    water_fee = water_usage * water_price
-    total = room_fee + electric_fee + water_fee + other_fee
-    
-    return {
-        'electric_usage': electric_usage,
-        'electric_fee': electric_fee,
-        'water_usage': water_usage,
-        'water_fee': water_fee,
-        'room_fee': room_fee,
-        'other_fee': other_fee,
-        'total': total
-    }
+    return compute_bills([data])[0]
 
 
 # Calculate fees for finalize draft bill
 def calculate_finalize_fees(bill, electric_new, water_new, other_fee=None):
-    electric_old = float(bill.get('electric_old', 0))
-    water_old = float(bill.get('water_old', 0))
-    electric_price = float(bill.get('electric_price', 3500))
-    water_price = float(bill.get('water_price', 15000))
-    room_fee = float(bill.get('room_fee', 0))
-    other = float(other_fee if other_fee is not None else bill.get('other_fee', 0))
-    
-    electric_usage = max(0, float(electric_new) - electric_old)
-    water_usage = max(0, float(water_new) - water_old)
-    
-    electric_fee = electric_usage * electric_price
-    water_fee = water_usage * water_price
-    total = room_fee + electric_fee + water_fee + other
-    
-    return {
-        'electric_new': float(electric_new),
-        'electric_fee': electric_fee,
-        'water_new': float(water_new),
-        'water_fee': water_fee,
-        'other_fee': other,
-        'total': total
-    }
+    return calculate_finalize_fees_batch([(bill, electric_new, water_new, other_fee)])[0]
+
+
+# Calculate finalize fees for many (bill, electric_new, water_new, other_fee) items in one pass
+def calculate_finalize_fees_batch(items):
+    rows = []
+    for bill, electric_new, water_new, other_fee in items:
+        rows.append({
+            **bill,
+            'electric_new': float(electric_new),
+            'water_new': float(water_new),
+            'other_fee': float(other_fee if other_fee is not None else bill.get('other_fee', 0))
+        })
+
+    return [
+        {
+            'electric_new': row['electric_new'],
+            'electric_fee': amounts['electric_fee'],
+            'water_new': row['water_new'],
+            'water_fee': amounts['water_fee'],
+            'other_fee': amounts['other_fee'],
+            'total': amounts['total']
+        }
+        for row, amounts in zip(rows, compute_bills(rows))
+    ]
+
+
+# Parse meter readings from CSV text (header: bill_id,electric_new,water_new[,other_fee])
+def parse_readings_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    readings = []
+    for row in reader:
+        reading = {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+        if not reading.get('other_fee'):
+            reading.pop('other_fee', None)
+        readings.append(reading)
+    return readings
+
+
+# Validate one reading row against its draft bill; returns ((bill, electric_new, water_new, other_fee), error)
+def prepare_finalize_row(reading, bill):
+    if not bill:
+        return None, 'Hóa đơn không tồn tại!'
+    if bill['status'] != 'draft':
+        return None, 'Chỉ có thể cập nhật hóa đơn ở trạng thái draft!'
+
+    electric_new = reading.get('electric_new')
+    water_new = reading.get('water_new')
+    if electric_new in (None, '') or water_new in (None, ''):
+        return None, 'Vui lòng nhập số điện và nước mới!'
+
+    other_fee = reading.get('other_fee')
+    try:
+        electric_new = float(electric_new)
+        water_new = float(water_new)
+        other_fee = float(other_fee) if other_fee not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, 'Chỉ số điện nước không hợp lệ!'
+
+    # An invalid tier override would fail the whole batch in compute_bills()
+    error = tier_error(bill)
+    if error:
+        return None, error
+    return (bill, electric_new, water_new, other_fee), None
 
 
 # ============== Bill Formatting ==============
@@ -96,14 +157,100 @@ def format_bill(bill):
         'water_new': bill.get('water_new', 0),
         'water_fee': bill.get('water_fee', 0),
         'other_fee': bill.get('other_fee', 0),
+        'late_fee': bill.get('late_fee', 0),
         'total': bill.get('total', 0),
         'status': bill.get('status', 'pending'),
         'due_date': bill.get('due_date', ''),
         'paid_at': bill.get('paid_at'),
-        'created_at': bill.get('created_at')
+        'created_at': to_iso(bill.get('created_at'))
     }
 
 
+# Projection matching format_bill fields
+BILL_LIST_PROJECTION = {
+    'contract_id': 1, 'room_id': 1, 'user_id': 1, 'month': 1, 'room_fee': 1,
+    'electric_old': 1, 'electric_new': 1, 'electric_fee': 1,
+    'water_old': 1, 'water_new': 1, 'water_fee': 1, 'other_fee': 1, 'late_fee': 1,
+    'total': 1, 'status': 1, 'due_date': 1, 'paid_at': 1, 'created_at': 1
+}
+
+
+# ============== Keyset Pagination ==============
+
+# created_at is a BSON date, or an ISO string on bills migrate_bills.py has not converted yet.
+# MongoDB sorts mixed types by BSON type (null < string < date), so in (created_at desc, _id desc)
+# order every dated bill comes before the string-dated ones. Sort keys and cursors follow the
+# same order, so merges and pages never compare a string with a date.
+CREATED_NULL, CREATED_STRING, CREATED_DATE = 'n', 's', 'd'
+
+
+def _created_kind(value):
+    if isinstance(value, datetime.datetime):
+        return CREATED_DATE
+    if isinstance(value, str):
+        return CREATED_STRING
+    return CREATED_NULL
+
+
+# Python sort key matching MongoDB's (created_at, _id) order
+def created_sort_key(bill):
+    created = bill.get('created_at')
+    kind = _created_kind(created)
+    return (
+        (CREATED_NULL, CREATED_STRING, CREATED_DATE).index(kind),
+        created if kind != CREATED_NULL else '',
+        bill['_id']
+    )
+
+
+# Encode the (created_at, _id) position of the last bill on a page
+def encode_cursor(bill):
+    created = bill.get('created_at')
+    raw = f"{_created_kind(created)}|{to_iso(created) or ''}|{bill['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+# Build the query condition for bills after the cursor in (created_at desc, _id desc) order.
+# mixed_types: string-dated or undated bills exist, so pages after a dated (or string-dated)
+# bill must also return every bill of the lower BSON types
+def cursor_condition(cursor, mixed_types=False):
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 2)
+    except Exception:
+        return None
+    if len(parts) == 2:
+        # Cursors issued before the type prefix always pointed at a date
+        parts = [CREATED_DATE] + parts
+    if len(parts) != 3:
+        return None
+    kind, created_str, bill_id = parts
+
+    if kind == CREATED_NULL:
+        return {'created_at': None, '_id': {'$lt': bill_id}}
+    if kind == CREATED_STRING:
+        created_at = created_str
+        lower_types = [{'created_at': None}]
+    elif kind == CREATED_DATE:
+        created_at = to_datetime(created_str)
+        if created_at is None:
+            return None
+        lower_types = [{'created_at': {'$type': 'string'}}, {'created_at': None}]
+    else:
+        return None
+
+    # The $lte range keeps index bounds on created_at; $or only breaks ties on _id
+    condition = {
+        'created_at': {'$lte': created_at},
+        '$or': [
+            {'created_at': {'$lt': created_at}},
+            {'_id': {'$lt': bill_id}}
+        ]
+    }
+    if not mixed_types:
+        return condition
+    return {'$or': [condition] + lower_types}
+
+
 # Format unpaid bill for internal API
 def format_unpaid_bill(bill):
     return {
@@ -121,13 +268,15 @@ def format_unpaid_bill(bill):
 
 # Create new bill document from data
 def create_bill_document(data, amounts):
-    timestamp = get_timestamp()
+    period_year, period_month = parse_period(data['month'])
     return {
         '_id': generate_bill_id(),
         'contract_id': data['contract_id'],
         'room_id': data['room_id'],
         'user_id': data['user_id'],
         'month': data['month'],
+        'period_year': period_year,
+        'period_month': period_month,
         'room_fee': amounts['room_fee'],
         'electric_old': float(data['electric_old']),
         'electric_new': float(data['electric_new']),
@@ -140,7 +289,7 @@ def create_bill_document(data, amounts):
         'status': 'pending',
         'due_date': data.get('due_date', ''),
         'paid_at': None,
-        'created_at': timestamp
+        'created_at': datetime.datetime.utcnow()
     }
 
 
@@ -196,34 +345,3 @@ def get_service_url(service_name):
     import os
     fallback_port = os.getenv(f"{service_name.upper().replace('-', '_')}_PORT", "80")
     return f"http://{service_name}:{fallback_port}"
-
-
-def send_notification(user_id, title, message, notification_type, metadata=None):
-    try:
-        notification_service_url = get_service_url('notification-service')
-        if not notification_service_url:
-            print("Notification service URL not found")
-            return False
-            
-        payload = {
-            'user_id': str(user_id),
-            'title': title,
-            'message': message,
-            'type': notification_type,
-            'metadata': metadata or {}
-        }
-        
-        response = requests.post(
-            f"{notification_service_url}/api/notifications",
-            json=payload,
-            headers={'X-Internal-Api-Key': INTERNAL_API_KEY, 'Content-Type': 'application/json'},
-            timeout=5
-        )
-        
-        if not response.ok:
-            print(f"Failed to send notification: {response.text}")
-        return response.ok
-    except Exception as exc:
-        print(f"Error sending notification: {exc}")
-        return False
-
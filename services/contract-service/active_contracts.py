@@ -0,0 +1,119 @@
+# Contract Service - Active Contract Maintenance
+# Users may have at most one active contract (partial unique index on user_id where
+# status == 'active'). The index cannot be built while duplicates exist; --duplicates lists them.
+#
+# Usage (inside the contract-service container):
+#   python active_contracts.py --duplicates
+#   python active_contracts.py --benchmark --contracts 50000
+#       (times the previous check - full /internal/contracts list scanned by the caller -
+#        against /internal/contracts/active and its batch variant; the script re-runs itself
+#        against a scratch database, <DB_NAME>_benchmark, which is dropped afterwards, so the
+#        live contracts and report-service's read-model sync never see the synthetic contracts)
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from config import Config
+from model import contracts_collection, get_client
+
+
+# Users with more than one active contract: [{'user_id', 'contract_ids'}]
+def find_duplicate_active_contracts():
+    pipeline = [
+        {'$match': {'status': 'active'}},
+        {'$group': {'_id': '$user_id', 'contract_ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ]
+    return [
+        {'user_id': row['_id'], 'contract_ids': row['contract_ids']}
+        for row in contracts_collection.aggregate(pipeline)
+    ]
+
+
+# ============== Benchmark ==============
+
+BENCHMARK_DB_SUFFIX = '_benchmark'
+
+
+def _timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def benchmark(count, repeat):
+    from app import app
+
+    # Never against the live database
+    assert Config.DB_NAME.endswith(BENCHMARK_DB_SUFFIX), Config.DB_NAME
+
+    run = f"BENCH{int(time.time())}"
+    batch = []
+    for i in range(count):
+        batch.append({
+            '_id': f"{run}C{i:06d}",
+            'user_id': f"{run}U{i:06d}",
+            'room_id': f"{run}R{i % 2000:04d}",
+            'status': 'active' if i % 3 == 0 else 'expired',
+            'start_date': '2025-01-01', 'end_date': '2026-01-01',
+            'monthly_rent': 3000000.0, 'deposit_amount': 3000000.0,
+            'created_at': f"2025-01-01T00:00:{i % 60:02d}", 'benchmark': True
+        })
+        if len(batch) == 5000:
+            contracts_collection.insert_many(batch)
+            batch = []
+    if batch:
+        contracts_collection.insert_many(batch)
+
+    client = app.test_client()
+    headers = {'X-Internal-Api-Key': Config.INTERNAL_API_KEY}
+    user_id = f"{run}U{(count - 1) // 3 * 3:06d}"
+
+    def previous_check():
+        contracts = client.get('/internal/contracts', headers=headers).get_json()['contracts']
+        return any(c.get('user_id') == user_id and c.get('status') == 'active' for c in contracts)
+
+    def active_check():
+        return client.get('/internal/contracts/active', query_string={'user_id': user_id},
+                          headers=headers).get_json()['has_active_contract']
+
+    batch_users = [f"{run}U{i:06d}" for i in range(0, min(count, 1000))]
+
+    def batch_check():
+        return client.post('/internal/contracts/active/batch', json={'user_ids': batch_users},
+                           headers=headers).get_json()['total_active']
+
+    try:
+        assert previous_check() and active_check()
+        print(f"[BENCHMARK] {count} contracts")
+        print(f"  full list + scan          {_timed(previous_check, max(1, repeat // 10)):10.2f} ms")
+        print(f"  /active?user_id=          {_timed(active_check, repeat):10.2f} ms")
+        print(f"  /active/batch ({len(batch_users)} users) {_timed(batch_check, max(1, repeat // 10)):10.2f} ms")
+    finally:
+        get_client().drop_database(Config.DB_NAME)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Active contract maintenance')
+    parser.add_argument('--duplicates', action='store_true', help='List users with several active contracts')
+    parser.add_argument('--benchmark', action='store_true', help='Time the active-contract checks')
+    parser.add_argument('--contracts', type=int, default=50000, help='Synthetic contracts for --benchmark')
+    parser.add_argument('--repeat', type=int, default=100, help='Requests per timed check')
+    args = parser.parse_args()
+
+    if args.duplicates:
+        duplicates = find_duplicate_active_contracts()
+        for d in duplicates:
+            print(f"{d['user_id']}: {', '.join(d['contract_ids'])}")
+        print(f"{len(duplicates)} users with several active contracts")
+    elif args.benchmark:
+        if not Config.DB_NAME.endswith(BENCHMARK_DB_SUFFIX):
+            # Collections are bound at import, so run again with DB_NAME set to the scratch database
+            env = {**os.environ, 'DB_NAME': f"{Config.DB_NAME}{BENCHMARK_DB_SUFFIX}"}
+            raise SystemExit(subprocess.call([sys.executable, *sys.argv], env=env))
+        benchmark(args.contracts, args.repeat)
+    else:
+        parser.print_help()
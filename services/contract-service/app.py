@@ -3,9 +3,10 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import requests
 import atexit
+from pymongo.errors import DuplicateKeyError
 
 from config import Config
-from model import contracts_collection
+from model import contracts_collection, bump_contracts_version, get_contracts_version
 from decorators import token_required, admin_required, internal_api_required
 from service_registry import register_service, deregister_service
 from utils import (
@@ -16,6 +17,7 @@ from utils import (
     format_contract,
     validate_contract_dates,
     check_existing_active_contract,
+    get_active_contract_ids,
     check_contract_exists,
     create_contract_document,
     create_auto_contract_document,
@@ -29,6 +31,24 @@ CORS(app)
 atexit.register(deregister_service)
 
 
+# ============== Data Version ==============
+
+# POST endpoints that only read contracts
+READ_ONLY_ENDPOINTS = {'get_active_contracts_batch_internal'}
+
+
+@app.after_request
+# Every successful write changes contract data
+def bump_version_after_write(response):
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400 \
+            and request.endpoint not in READ_ONLY_ENDPOINTS:
+        try:
+            bump_contracts_version()
+        except Exception as e:
+            print(f"[DB] Failed to bump contracts version: {e}")
+    return response
+
+
 # ============== Health Check ==============
 
 @app.route('/health', methods=['GET'])
@@ -49,6 +69,10 @@ def get_contracts_internal():
     if request.args.get('room_id'):
         query['room_id'] = request.args.get('room_id')
     
+    # Only the number of matching contracts (e.g. active contracts for report snapshots)
+    if request.args.get('count_only', 'false').lower() == 'true':
+        return jsonify({'total': contracts_collection.count_documents(query)}), 200
+    
     contracts = list(contracts_collection.find(query).sort('created_at', -1))
     
     return jsonify({
@@ -57,6 +81,51 @@ def get_contracts_internal():
     }), 200
 
 
+MAX_BATCH_USERS = 1000
+
+
+@app.route('/internal/contracts/active', methods=['GET'])
+@internal_api_required
+# Whether a user has an active contract (indexed lookup, no contract list)
+def get_active_contract_internal():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'message': 'Thiếu user_id!'}), 400
+    
+    contract = contracts_collection.find_one({'user_id': user_id, 'status': 'active'}, {'_id': 1})
+    return jsonify({
+        'user_id': user_id,
+        'has_active_contract': contract is not None,
+        'contract_id': contract['_id'] if contract else None
+    }), 200
+
+
+@app.route('/internal/contracts/version', methods=['GET'])
+@internal_api_required
+# Counter that changes whenever contract data changes (used for report cache invalidation)
+def internal_contracts_version():
+    return jsonify({'version': get_contracts_version()}), 200
+
+
+@app.route('/internal/contracts/active/batch', methods=['POST'])
+@internal_api_required
+# Active contract of many users: body {"user_ids": [...]}
+def get_active_contracts_batch_internal():
+    data = request.get_json() or {}
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list) or not user_ids:
+        return jsonify({'message': 'Thiếu danh sách user_ids!'}), 400
+    if len(user_ids) > MAX_BATCH_USERS:
+        return jsonify({'message': f'Tối đa {MAX_BATCH_USERS} user_ids mỗi lần!'}), 400
+    
+    user_ids = [str(u) for u in user_ids]
+    active = get_active_contract_ids(user_ids)
+    return jsonify({
+        'contracts': {u: active.get(u) for u in user_ids},
+        'total_active': len(active)
+    }), 200
+
+
 # ============== External API (JWT required) ==============
 
 @app.route('/api/contracts', methods=['GET'])
@@ -73,6 +142,10 @@ def get_contracts(current_user):
     if request.args.get('room_id'):
         query['room_id'] = request.args.get('room_id')
     
+    # Only the number of matching contracts (e.g. active contracts for report snapshots)
+    if request.args.get('count_only', 'false').lower() == 'true':
+        return jsonify({'total': contracts_collection.count_documents(query)}), 200
+    
     contracts = list(contracts_collection.find(query).sort('created_at', -1))
     
     return jsonify({
@@ -124,6 +197,8 @@ def create_contract(current_user):
             'message': 'Tạo hợp đồng thành công!',
             'contract': format_contract(new_contract)
         }), 201
+    except DuplicateKeyError:
+        return jsonify({'message': 'Người dùng đã có hợp đồng đang hoạt động!'}), 400
     except Exception as e:
         return jsonify({'message': f'Lỗi: {str(e)}'}), 500
 
@@ -207,6 +282,8 @@ def create_contract_from_reservation(current_user):
 
     try:
         contracts_collection.insert_one(new_contract)
+    except DuplicateKeyError:
+        return jsonify({'message': 'Người dùng đã có hợp đồng đang hoạt động!'}), 400
     except Exception as e:
         return jsonify({'message': f'Lỗi tạo hợp đồng: {str(e)}'}), 500
 
@@ -393,6 +470,8 @@ def auto_create_contract():
 
     try:
         contracts_collection.insert_one(new_contract)
+    except DuplicateKeyError:
+        return jsonify({'message': 'User already has an active contract'}), 400
     except Exception as e:
         return jsonify({'message': f'Error creating contract: {str(e)}'}), 500
 
@@ -5,6 +5,7 @@ class Config:
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/contracts_db')
     DB_NAME = os.getenv('DB_NAME', 'contracts_db')
     COLLECTION_NAME = 'contracts'
+    VERSION_COLLECTION_NAME = 'data_versions'
     SERVICE_NAME = 'contract-service'
     SERVICE_PORT = int(os.getenv('SERVICE_PORT', '5006'))
     JWT_SECRET = os.getenv('JWT_SECRET', 'your-super-secret-key-change-this')
@@ -11,12 +11,25 @@ class Database:
             cls._db = cls._client[Config.DB_NAME]
         return cls._instance
     
+    @property
+    def client(self):
+        return self._client
+    
     @property
     def contracts(self):
         return self._db[Config.COLLECTION_NAME]
 
+    @property
+    def data_versions(self):
+        return self._db[Config.VERSION_COLLECTION_NAME]
+
 _database = Database()
 contracts_collection = _database.contracts
+data_versions_collection = _database.data_versions
+
+
+def get_client():
+    return _database.client
 
 def init_indexes():
     try:
@@ -27,5 +40,26 @@ def init_indexes():
         print("[DB] ✓ Contract indexes created")
     except Exception as e:
         print(f"[DB] Index creation: {e}")
+    
+    # At most one active contract per user; also serves the active-contract lookups
+    try:
+        contracts_collection.create_index(
+            [('user_id', ASCENDING)],
+            name='user_id_active_unique',
+            unique=True,
+            partialFilterExpression={'status': 'active'}
+        )
+    except Exception as e:
+        print(f"[DB] Active contract index: {e} (list duplicates: python active_contracts.py --duplicates)")
+
+
+# Contract data version: bumped on every contract write so report caches can tell when contract data changed
+def bump_contracts_version():
+    data_versions_collection.update_one({'_id': 'contracts'}, {'$inc': {'version': 1}}, upsert=True)
+
+
+def get_contracts_version():
+    doc = data_versions_collection.find_one({'_id': 'contracts'})
+    return doc.get('version', 0) if doc else 0
 
 init_indexes()
@@ -94,6 +94,15 @@ def check_existing_active_contract(user_id):
     })
 
 
+# Active contract ids of many users at once: {user_id: contract_id}
+def get_active_contract_ids(user_ids):
+    cursor = contracts_collection.find(
+        {'user_id': {'$in': list(user_ids)}, 'status': 'active'},
+        {'user_id': 1}
+    )
+    return {c['user_id']: c['_id'] for c in cursor}
+
+
 def check_contract_exists(room_id, user_id):
     return contracts_collection.find_one({
         'room_id': room_id,
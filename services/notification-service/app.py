@@ -8,9 +8,9 @@ from config import Config
 from model import notifications_collection
 from decorators import token_required, admin_required, internal_api_required
 from utils import (
-    get_timestamp, create_notification_document,
+    get_timestamp, create_notification_document, create_notification_documents,
     format_notification, get_user_id, check_duplicate_notification,
-    fetch_unpaid_bills
+    fetch_unpaid_bills, get_last_job_run, set_last_job_run
 )
 from service_registry import register_service, deregister_service
 
@@ -138,6 +138,32 @@ def create_notification():
     }), 201
 
 
+# ============== Internal API: Bulk Create Notifications ==============
+
+@app.route('/api/notifications/bulk', methods=['POST'])
+@internal_api_required
+def create_notifications_bulk():
+# Create many notifications at once (internal API, used by outbox dispatchers)
+    
+    data = request.get_json() or {}
+    items = data.get('notifications')
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Thiếu danh sách notifications!'}), 400
+    
+    required = ['user_id', 'title', 'message', 'type']
+    for index, item in enumerate(items):
+        missing = [f for f in required if f not in item]
+        if missing:
+            return jsonify({'message': f"Thông báo #{index} thiếu trường: {', '.join(missing)}"}), 400
+    
+    ids, inserted = create_notification_documents(items)
+    return jsonify({
+        'message': f'Đã tạo {inserted} thông báo!',
+        'ids': ids,
+        'inserted': inserted
+    }), 201
+
+
 # ============== Internal API: Welcome Notification ==============
 
 @app.route('/api/notifications/welcome', methods=['POST'])
@@ -323,52 +349,65 @@ def mark_all_as_read(current_user):
 def run_rent_reminders():
 # Generate rent reminder notifications
     
-    bills = fetch_unpaid_bills()
     today = datetime.date.today()
+    started_at = datetime.datetime.utcnow()
+    
+    # Only bills due within 3 days, or that became overdue since the last run
+    # (older overdue bills were already reminded; duplicates are still skipped below)
+    last_run = get_last_job_run('rent_reminders')
+    due_from = (last_run.date() - datetime.timedelta(days=1)).isoformat() if last_run else None
+    due_to = (today + datetime.timedelta(days=3)).isoformat()
+    bills = fetch_unpaid_bills(due_from, due_to)
     created = []
     
-    for bill in bills:
-        due_date_str = bill.get('due_date')
-        if not due_date_str:
-            continue
-        
-        try:
-            due_date = datetime.datetime.strptime(due_date_str, "%Y-%m-%d").date()
-        except ValueError:
-            continue
-        
-        days_diff = (due_date - today).days
-        
-        # Determine notification type
-        if days_diff == 0:
-            notif_type = 'rent_due_today'
-            message = f"Hôm nay là hạn thanh toán hóa đơn {bill.get('_id')} ({bill.get('total_amount', 0):,.0f} VND)."
-        elif 1 <= days_diff <= 3:
-            notif_type = 'rent_due_soon'
-            message = f"Hóa đơn {bill.get('_id')} sẽ đến hạn vào {due_date_str}."
-        elif days_diff < 0:
-            notif_type = 'rent_overdue'
-            message = f"Hóa đơn {bill.get('_id')} đã quá hạn {abs(days_diff)} ngày."
-        else:
-            continue
-        
-        # Check duplicate
-        if check_duplicate_notification(notif_type, bill.get('_id')):
-            continue
-        
-        # Create notification
-        notification = create_notification_document({
-            'user_id': bill.get('user_id'),
-            'title': 'Nhắc nhở thanh toán tiền nhà',
-            'message': message,
-            'type': notif_type,
-            'metadata': {
-                'bill_id': bill.get('_id'),
-                'due_date': due_date_str,
-                'days_diff': days_diff
-            }
-        })
-        created.append(notification['_id'])
+    try:
+        for bill in bills:
+            due_date_str = bill.get('due_date')
+            if not due_date_str:
+                continue
+            
+            try:
+                due_date = datetime.datetime.strptime(due_date_str, "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            
+            days_diff = (due_date - today).days
+            
+            # Determine notification type
+            if days_diff == 0:
+                notif_type = 'rent_due_today'
+                message = f"Hôm nay là hạn thanh toán hóa đơn {bill.get('_id')} ({bill.get('total_amount', 0):,.0f} VND)."
+            elif 1 <= days_diff <= 3:
+                notif_type = 'rent_due_soon'
+                message = f"Hóa đơn {bill.get('_id')} sẽ đến hạn vào {due_date_str}."
+            elif days_diff < 0:
+                notif_type = 'rent_overdue'
+                message = f"Hóa đơn {bill.get('_id')} đã quá hạn {abs(days_diff)} ngày."
+            else:
+                continue
+            
+            # Check duplicate
+            if check_duplicate_notification(notif_type, bill.get('_id')):
+                continue
+            
+            # Create notification
+            notification = create_notification_document({
+                'user_id': bill.get('user_id'),
+                'title': 'Nhắc nhở thanh toán tiền nhà',
+                'message': message,
+                'type': notif_type,
+                'metadata': {
+                    'bill_id': bill.get('_id'),
+                    'due_date': due_date_str,
+                    'days_diff': days_diff
+                }
+            })
+            created.append(notification['_id'])
+    except Exception as e:
+        print(f"Error fetching unpaid bills: {e}")
+        return jsonify({'message': f'Lỗi lấy hóa đơn chưa thanh toán: {str(e)}', 'created': created}), 502
+    
+    set_last_job_run('rent_reminders', started_at)
     
     return jsonify({
         'message': 'Đã chạy nhắc nhở tiền nhà',
@@ -14,9 +14,14 @@ class Database:
     @property
     def notifications(self):
         return self._db[Config.COLLECTION_NAME]
+    
+    @property
+    def job_runs(self):
+        return self._db['job_runs']
 
 _database = Database()
 notifications_collection = _database.notifications
+job_runs_collection = _database.job_runs
 
 def init_indexes():
     try:
@@ -24,6 +29,7 @@ def init_indexes():
         notifications_collection.create_index([('status', ASCENDING)])
         notifications_collection.create_index([('created_at', DESCENDING)])
         notifications_collection.create_index([('type', ASCENDING)])
+        notifications_collection.create_index([('type', ASCENDING), ('metadata.bill_id', ASCENDING)])
         print("[DB] ✓ Notification indexes created")
     except Exception as e:
         print(f"[DB] Index: {e}")
@@ -1,9 +1,11 @@
 # Notification Service - Utility Functions
 import datetime
+import json
 import uuid
 import os
 import requests
-from model import notifications_collection
+from pymongo.errors import BulkWriteError
+from model import notifications_collection, job_runs_collection
 from config import CONSUL_HOST, CONSUL_PORT, INTERNAL_API_KEY
 
 
@@ -27,20 +29,39 @@ def get_service_url(service_name):
     return f"http://{service_name}:{fallback_port}"
 
 
-def fetch_unpaid_bills():
-    """Fetch unpaid bills from bill-service."""
-    try:
-        bill_service_url = get_service_url('bill-service')
-        response = requests.get(
-            f"{bill_service_url}/internal/bills/unpaid",
-            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
-            timeout=10
-        )
-        if response.ok:
-            return response.json().get('bills', [])
-    except Exception as e:
-        print(f"Error fetching unpaid bills: {e}")
-    return []
+def fetch_unpaid_bills(due_from=None, due_to=None):
+    """Stream unpaid bills from bill-service, optionally only those due in [due_from, due_to]."""
+    params = {'format': 'ndjson'}
+    if due_from:
+        params['due_from'] = due_from
+    if due_to:
+        params['due_to'] = due_to
+    # Errors propagate so the caller does not advance its last-run marker
+    bill_service_url = get_service_url('bill-service')
+    with requests.get(
+        f"{bill_service_url}/internal/bills/unpaid",
+        params=params,
+        headers={'X-Internal-Api-Key': INTERNAL_API_KEY, 'Accept': 'application/x-ndjson'},
+        timeout=10,
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def get_last_job_run(job_id):
+# Get the last successful run time of a scheduled job (naive UTC datetime or None)
+    
+    run = job_runs_collection.find_one({'_id': job_id})
+    return run.get('last_run_at') if run else None
+
+
+def set_last_job_run(job_id, run_at):
+# Record a successful job run
+    
+    job_runs_collection.update_one({'_id': job_id}, {'$set': {'last_run_at': run_at}}, upsert=True)
 
 def get_timestamp():
     return datetime.datetime.utcnow().isoformat()
@@ -71,6 +92,33 @@ def create_notification_document(data):
     return notification
 
 
+def create_notification_documents(items):
+# Create many notifications in one write; items with an existing _id are skipped (idempotent redelivery)
+    
+    timestamp = get_timestamp()
+    notifications = [{
+        '_id': data.get('_id') or generate_notification_id(),
+        'user_id': str(data['user_id']),
+        'title': data['title'],
+        'message': data['message'],
+        'type': data.get('type', 'general'),
+        'status': 'unread',
+        'metadata': data.get('metadata', {}),
+        'created_at': timestamp,
+        'read_at': None
+    } for data in items]
+    
+    try:
+        result = notifications_collection.insert_many(notifications, ordered=False)
+        inserted = len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Only duplicate keys (already delivered) are tolerated
+        if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+            raise
+        inserted = e.details.get('nInserted', 0)
+    return [n['_id'] for n in notifications], inserted
+
+
 def format_notification(notification):
 # Format notification for API response
     
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import atexit
 import datetime
 import os
 import uuid
@@ -8,9 +9,13 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 
 from config import Config
-from model import payments_collection
+from model import payments_collection, payment_outbox_collection
+from balances import apply_payment_update, release_payment, reserve_payment
+from outbox import retry_dead_effect
+from idempotency import idempotent
+from payment_summary import SUMMARY_GROUPS, summary_match, summary_pipeline
 from service_registry import register_service
-from decorators import token_required, admin_required
+from decorators import token_required, admin_required, internal_api_required
 from utils import (
     calculate_total_paid,
     fetch_service_data,
@@ -44,6 +49,7 @@ def health_check():
 
 @app.route("/api/payments", methods=["POST"])
 @token_required
+@idempotent
 def create_payment(current_user):
     data = request.get_json() or {}
 
@@ -95,9 +101,13 @@ def create_payment(current_user):
         return jsonify({"message": "Hóa đơn đã được thanh toán đầy đủ!"}), 400
 
     bill_total = float(bill.get("total_amount") or bill.get("total") or 0)
-    total_paid = calculate_total_paid(bill_id)
-    remaining_amount = bill_total - float(total_paid)
-    if amount > remaining_amount:
+    # Completed payments are counted in the bill balance up front (atomic check + $inc)
+    if status == "completed":
+        fits = reserve_payment(bill_id, amount, bill_total) is not None
+    else:
+        fits = amount <= bill_total - float(calculate_total_paid(bill_id))
+    if not fits:
+        remaining_amount = bill_total - float(calculate_total_paid(bill_id))
         return (
             jsonify(
                 {
@@ -133,13 +143,16 @@ def create_payment(current_user):
 
     try:
         payments_collection.insert_one(new_payment)
-        if status == "completed":
-            update_bill_status_if_paid(bill_id, bill_total)
-        new_payment["id"] = new_payment["_id"]
-        return jsonify({"message": "Tạo thanh toán thành công!", "payment": new_payment}), 201
     except Exception as e:
+        if status == "completed":
+            release_payment(bill_id, amount)
         return jsonify({"message": f"Lỗi tạo thanh toán: {str(e)}"}), 500
 
+    if status == "completed":
+        update_bill_status_if_paid(bill_id, bill_total)
+    new_payment["id"] = new_payment["_id"]
+    return jsonify({"message": "Tạo thanh toán thành công!", "payment": new_payment}), 201
+
 
 @app.route("/api/payments", methods=["GET"])
 @token_required
@@ -284,8 +297,7 @@ def update_payment(current_user, payment_id):
 
     update_fields["updated_at"] = _utc_now_iso()
 
-    payments_collection.update_one({"_id": payment_id}, {"$set": update_fields})
-    updated = payments_collection.find_one({"_id": payment_id})
+    updated = apply_payment_update(payment_id, update_fields)
     updated["id"] = updated.get("_id")
 
     if update_fields.get("status") == "completed" and updated.get("bill_id"):
@@ -371,6 +383,7 @@ def get_payment_statistics(current_user):
 
 @app.route("/api/payments/deposit", methods=["POST"])
 @token_required
+@idempotent
 def create_deposit_payment(current_user):
     data = request.get_json() or {}
 
@@ -423,7 +436,88 @@ def create_deposit_payment(current_user):
     return jsonify({"message": "Tạo payment tiền cọc thành công!", "payment": new_payment}), 201
 
 
+# ---------------------------
+# Payment side-effect outbox (admin)
+# ---------------------------
+
+
+OUTBOX_STATUSES = ["pending", "running", "done", "dead"]
+
+
+@app.route("/api/payments/outbox", methods=["GET"])
+@token_required
+@admin_required
+def list_outbox_effects(current_user):
+    status = request.args.get("status", "dead")
+    if status not in OUTBOX_STATUSES:
+        return jsonify({"message": f"Status không hợp lệ! Chỉ chấp nhận: {', '.join(OUTBOX_STATUSES)}"}), 400
+
+    query: dict = {"status": status}
+    if request.args.get("payment_id"):
+        query["payment_id"] = request.args["payment_id"]
+
+    effects = list(payment_outbox_collection.find(query).sort("created_at", -1).limit(100))
+    for e in effects:
+        for field in ("next_attempt_at", "locked_until", "created_at", "done_at"):
+            if e.get(field):
+                e[field] = e[field].isoformat()
+    return jsonify({"effects": effects, "total": len(effects)}), 200
+
+
+@app.route("/api/payments/outbox/<effect_id>/retry", methods=["POST"])
+@token_required
+@admin_required
+def retry_outbox_effect(current_user, effect_id):
+    if not retry_dead_effect(effect_id):
+        return jsonify({"message": "Không tìm thấy tác vụ lỗi cần chạy lại!"}), 404
+    return jsonify({"message": "Đã đưa tác vụ vào hàng đợi!", "id": effect_id}), 200
+
+
+# ---------------------------
+# Internal APIs
+# ---------------------------
+
+
+@app.route("/internal/payments/summary", methods=["GET"])
+@internal_api_required
+def internal_payment_summary():
+    """Sum payments server-side: ?year=&group_by=month|payment_type|none&payment_type=&status=completed."""
+    group_by = request.args.get("group_by", "month")
+    if group_by not in SUMMARY_GROUPS:
+        return jsonify({"message": "group_by phải là month, payment_type hoặc none!"}), 400
+
+    status = request.args.get("status", "completed")
+    payment_type = request.args.get("payment_type")
+    year = request.args.get("year")
+    if year:
+        try:
+            year = int(year)
+        except ValueError:
+            return jsonify({"message": "year không hợp lệ!"}), 400
+
+    match = summary_match(status, payment_type, year)
+    groups = [
+        {group_by: g["_id"], "total": g["total"], "count": g["count"]} if group_by != "none"
+        else {"total": g["total"], "count": g["count"]}
+        for g in payments_collection.aggregate(summary_pipeline(match, group_by))
+    ]
+
+    return jsonify({
+        "year": year or None,
+        "group_by": group_by,
+        "payment_type": payment_type,
+        "status": match["status"],
+        "groups": groups,
+        "total": sum(g["total"] for g in groups),
+        "count": sum(g["count"] for g in groups),
+    }), 200
+
+
 if __name__ == "__main__":
+    from scheduler import start_scheduler
+    scheduler = start_scheduler()
+    atexit.register(scheduler.shutdown)
+
     register_service()
     debug_mode = os.getenv("FLASK_DEBUG", "false").lower() == "true"
     app.run(host="0.0.0.0", port=Config.SERVICE_PORT, debug=debug_mode)
@@ -0,0 +1,137 @@
+# Payment Service - Bill Balances
+# bill_balances keeps one document per bill (_id = bill_id) with the sum of its completed
+# payments, so remaining-amount checks read a single document instead of aggregating payments.
+#   apply_payment_update()  every payment write that can change status or amount; the balance
+#                           is $inc'd by the change in the payment's completed amount
+#   reserve_payment()       completed payments created directly: conditional $inc
+#                           (paid <= total - amount), so two concurrent payments cannot both
+#                           fit into the same remaining amount
+# A bill's balance is built from its payments the first time it is needed.
+#
+# Usage (recompute balances from payments, e.g. after a crash between a payment write and
+# its $inc; run while no payments are being confirmed):
+#   python balances.py --rebuild
+#   python balances.py --rebuild --bill-id B001
+import argparse
+import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from model import payments_collection, bill_balances_collection
+
+
+def _completed_amount(payment):
+    if payment.get('bill_id') and payment.get('status') == 'completed':
+        return float(payment.get('amount') or 0)
+    return 0.0
+
+
+def _aggregate_total_paid(bill_id):
+    pipeline = [
+        {'$match': {'bill_id': bill_id, 'status': 'completed'}},
+        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
+    ]
+    result = list(payments_collection.aggregate(pipeline))
+    return float(result[0]['total']) if result else 0.0
+
+
+def _inc(bill_id, amount, session=None):
+    bill_balances_collection.update_one(
+        {'_id': bill_id},
+        {'$inc': {'paid': amount}, '$set': {'updated_at': datetime.datetime.utcnow()}},
+        session=session
+    )
+
+
+# Balance document of a bill, built from its payments when missing
+def ensure_balance(bill_id):
+    balance = bill_balances_collection.find_one({'_id': bill_id})
+    if balance is None:
+        balance = {'_id': bill_id, 'paid': _aggregate_total_paid(bill_id), 'updated_at': datetime.datetime.utcnow()}
+        try:
+            bill_balances_collection.insert_one(balance)
+        except DuplicateKeyError:
+            balance = bill_balances_collection.find_one({'_id': bill_id})
+    return balance
+
+
+def get_total_paid(bill_id):
+    return ensure_balance(bill_id)['paid']
+
+
+# Count `amount` as paid if it fits into the bill's remaining amount; returns the balance
+# after the $inc, or None when it does not fit
+def reserve_payment(bill_id, amount, bill_total):
+    ensure_balance(bill_id)
+    return bill_balances_collection.find_one_and_update(
+        {'_id': bill_id, 'paid': {'$lte': bill_total - amount}},
+        {'$inc': {'paid': amount}, '$set': {'updated_at': datetime.datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+# Undo reserve_payment() when the payment could not be stored
+def release_payment(bill_id, amount):
+    _inc(bill_id, -amount)
+
+
+# $set fields on a payment and move its bill's balance by the change in completed amount.
+# The previous state comes from the same atomic write, so repeated confirmations
+# (IPN retries, return + verify) count once. Returns the updated payment, or None.
+# With a session, the payment and balance writes join the caller's transaction.
+def apply_payment_update(payment_id, fields, session=None):
+    payment = payments_collection.find_one({'_id': payment_id}, {'bill_id': 1})
+    if payment is None:
+        return None
+    if payment.get('bill_id'):
+        ensure_balance(payment['bill_id'])
+
+    before = payments_collection.find_one_and_update(
+        {'_id': payment_id}, {'$set': fields}, return_document=ReturnDocument.BEFORE, session=session
+    )
+    if before is None:
+        return None
+    after = {**before, **fields}
+    delta = _completed_amount(after) - _completed_amount(before)
+    if delta:
+        _inc(before['bill_id'], delta, session)
+    return after
+
+
+# ============== Rebuild ==============
+
+def rebuild_balances(bill_id=None):
+    match = {'status': 'completed', 'bill_id': bill_id if bill_id else {'$nin': [None, '']}}
+    totals = {
+        row['_id']: float(row['total'])
+        for row in payments_collection.aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$bill_id', 'total': {'$sum': '$amount'}}}
+        ])
+    }
+    # Bills whose completed payments were all reverted
+    stale = bill_balances_collection.find({'_id': bill_id} if bill_id else {}, {'_id': 1})
+    for balance in stale:
+        totals.setdefault(balance['_id'], 0.0)
+
+    now = datetime.datetime.utcnow()
+    operations = [
+        UpdateOne({'_id': bid}, {'$set': {'paid': paid, 'updated_at': now}}, upsert=True)
+        for bid, paid in totals.items()
+    ]
+    if operations:
+        bill_balances_collection.bulk_write(operations, ordered=False)
+    print(f"[BALANCES] Rebuilt {len(operations)} bill balances")
+    return len(operations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bill balance maintenance')
+    parser.add_argument('--rebuild', action='store_true', help='Recompute balances from completed payments')
+    parser.add_argument('--bill-id', help='Only this bill')
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild_balances(args.bill_id)
+    else:
+        parser.print_help()
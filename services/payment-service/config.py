@@ -5,8 +5,11 @@ import os
 class Config:
     # MongoDB
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/payments_db')
-    DB_NAME = 'payments_db'
+    DB_NAME = os.getenv('DB_NAME', 'payments_db')
     COLLECTION_NAME = 'payments'
+    BILL_BALANCE_COLLECTION_NAME = 'bill_balances'
+    OUTBOX_COLLECTION_NAME = 'payment_outbox'
+    IDEMPOTENCY_COLLECTION_NAME = 'idempotency_keys'
     
     # Service Info
     SERVICE_NAME = 'payment-service'
@@ -38,6 +41,17 @@ class Config:
             default_url = cls.VNPAY_URL.replace('/paymentv2/vpcpay.html', '/merchant_webapi/api/transaction')
         return os.getenv('VNPAY_API_URL', default_url).strip()
     
+    # Payment side-effect outbox (downstream calls after a payment is confirmed)
+    OUTBOX_DISPATCH_INTERVAL = int(os.getenv('OUTBOX_DISPATCH_INTERVAL', '2'))  # seconds
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '100'))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+    OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', '60'))
+    
+    # Idempotency-Key on payment creation endpoints
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))  # seconds a response is replayed
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10'))
+    
     # Debug
     DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
 
@@ -46,6 +60,9 @@ class Config:
 MONGO_URI = Config.MONGO_URI
 DB_NAME = Config.DB_NAME
 COLLECTION_NAME = Config.COLLECTION_NAME
+BILL_BALANCE_COLLECTION_NAME = Config.BILL_BALANCE_COLLECTION_NAME
+OUTBOX_COLLECTION_NAME = Config.OUTBOX_COLLECTION_NAME
+IDEMPOTENCY_COLLECTION_NAME = Config.IDEMPOTENCY_COLLECTION_NAME
 SERVICE_NAME = Config.SERVICE_NAME
 SERVICE_PORT = Config.SERVICE_PORT
 JWT_SECRET = Config.JWT_SECRET
@@ -0,0 +1,114 @@
+# Payment Service - Idempotency Keys
+# Payment creation endpoints accept an `Idempotency-Key` header. The first request with a key
+# stores its response in idempotency_keys (TTL: IDEMPOTENCY_TTL seconds); retries and
+# double-clicks with the same key get that response replayed (header Idempotent-Replayed)
+# instead of creating another payment and another room hold.
+#   - keys are scoped per user and endpoint
+#   - the same key with a different body is rejected (422)
+#   - a duplicate arriving while the first is still running waits for its response (up to
+#     IDEMPOTENCY_WAIT_SECONDS, then 409); a request whose worker died releases the key
+#     after IDEMPOTENCY_LOCK_SECONDS
+#   - 5xx responses are not stored, so the client can retry them with the same key
+import datetime
+import hashlib
+import time
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from pymongo.errors import DuplicateKeyError
+
+from config import Config
+from model import idempotency_keys_collection
+
+
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 0.1
+
+
+def _fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(record):
+    stored = record['response']
+    response = Response(stored['body'], status=stored['status'], mimetype=stored['mimetype'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+# Insert the in-progress record, or take over one whose lock expired; True when we own the key
+def _acquire(record_id, fingerprint, now):
+    lock = now + datetime.timedelta(seconds=Config.IDEMPOTENCY_LOCK_SECONDS)
+    try:
+        idempotency_keys_collection.insert_one({
+            '_id': record_id,
+            'fingerprint': fingerprint,
+            'status': 'in_progress',
+            'locked_until': lock,
+            'created_at': now,
+            'expires_at': now + datetime.timedelta(seconds=Config.IDEMPOTENCY_TTL)
+        })
+        return True
+    except DuplicateKeyError:
+        pass
+    taken = idempotency_keys_collection.update_one(
+        {'_id': record_id, 'status': 'in_progress', 'fingerprint': fingerprint, 'locked_until': {'$lt': now}},
+        {'$set': {'locked_until': lock}}
+    )
+    return taken.modified_count == 1
+
+
+def _execute(record_id, fn, args, kwargs):
+    try:
+        response = make_response(fn(*args, **kwargs))
+    except Exception:
+        idempotency_keys_collection.delete_one({'_id': record_id})
+        raise
+
+    if response.status_code >= 500 or response.direct_passthrough:
+        idempotency_keys_collection.delete_one({'_id': record_id})
+        return response
+    idempotency_keys_collection.update_one({'_id': record_id}, {'$set': {
+        'status': 'done',
+        'response': {
+            'status': response.status_code,
+            'body': response.get_data(as_text=True),
+            'mimetype': response.mimetype
+        },
+        'locked_until': None
+    }})
+    return response
+
+
+def idempotent(fn):
+    # Decorator (below token_required): replay the stored response for a repeated Idempotency-Key
+    @wraps(fn)
+    def decorated(current_user, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return fn(current_user, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'Idempotency-Key tối đa {MAX_KEY_LENGTH} ký tự!'}), 400
+
+        user_id = current_user.get('user_id') or current_user.get('_id')
+        record_id = f"{user_id}:{request.path}:{key}"
+        fingerprint = _fingerprint()
+        deadline = time.monotonic() + Config.IDEMPOTENCY_WAIT_SECONDS
+
+        while True:
+            if _acquire(record_id, fingerprint, datetime.datetime.utcnow()):
+                return _execute(record_id, fn, (current_user, *args), kwargs)
+
+            record = idempotency_keys_collection.find_one({'_id': record_id})
+            if record is None:
+                # The first request failed and released the key
+                continue
+            if record['fingerprint'] != fingerprint:
+                return jsonify({'message': 'Idempotency-Key đã được dùng cho một yêu cầu khác!'}), 422
+            if record['status'] == 'done':
+                return _replay(record)
+            if time.monotonic() >= deadline:
+                return jsonify({'message': 'Yêu cầu với Idempotency-Key này đang được xử lý, vui lòng thử lại sau!'}), 409
+            time.sleep(POLL_SECONDS)
+
+    return decorated
@@ -26,10 +26,32 @@ class Database:
     @property
     def payments(self):
         return self._db[Config.COLLECTION_NAME]
+    
+    @property
+    def bill_balances(self):
+        return self._db[Config.BILL_BALANCE_COLLECTION_NAME]
+    
+    @property
+    def payment_outbox(self):
+        return self._db[Config.OUTBOX_COLLECTION_NAME]
+    
+    @property
+    def idempotency_keys(self):
+        return self._db[Config.IDEMPOTENCY_COLLECTION_NAME]
 
 
 _database = Database()
 payments_collection = _database.payments
+bill_balances_collection = _database.bill_balances
+payment_outbox_collection = _database.payment_outbox
+idempotency_keys_collection = _database.idempotency_keys
+
+
+# /internal/payments/summary sums amount, falling back to amount_vnd
+SUMMARY_INDEX_KEYS = [
+    ('status', ASCENDING), ('payment_type', ASCENDING), ('created_at', ASCENDING),
+    ('amount', ASCENDING), ('amount_vnd', ASCENDING)
+]
 
 
 # Initialize indexes
@@ -51,6 +73,18 @@ def init_indexes():
         # Compound indexes
         payments_collection.create_index([('payment_type', ASCENDING), ('booking_id', ASCENDING)])
         payments_collection.create_index([('bill_id', ASCENDING), ('status', ASCENDING)])
+        # Covers /internal/payments/summary (match + $group need no document fetch)
+        payments_collection.create_index(SUMMARY_INDEX_KEYS)
+        
+        # Outbox: due records, expired leases, per-payment lookup
+        payment_outbox_collection.create_index([('status', ASCENDING), ('next_attempt_at', ASCENDING)])
+        payment_outbox_collection.create_index([('status', ASCENDING), ('locked_until', ASCENDING)])
+        payment_outbox_collection.create_index([('payment_id', ASCENDING)])
+        # Drop executed outbox records after 7 days (dead letters are kept)
+        payment_outbox_collection.create_index([('done_at', ASCENDING)], expireAfterSeconds=7 * 24 * 3600)
+        
+        # Idempotency keys expire at expires_at
+        idempotency_keys_collection.create_index([('expires_at', ASCENDING)], expireAfterSeconds=0)
         
         print("[DB] ✓ Payment indexes created")
     except Exception as e:
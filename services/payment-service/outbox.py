@@ -0,0 +1,376 @@
+# Payment Service - Side-Effect Outbox
+# Confirming a payment (IPN, return URL, verify) only writes the new payment state and one
+# outbox record per downstream effect, in the same transaction, and answers right away.
+# A background dispatcher then runs the effects:
+#   booking_deposit_paid      booking-service   mark the booking deposit paid
+#   room_reservation_confirm  room-service      confirm the held room (+ booking record)
+#   room_reservation_release  room-service      release the held room after a failed payment
+#   deposit_revenue_event     report-service    revenue rollup event
+#   bill_status               bill-service      mark the bill paid once fully paid
+#   notification              notification-service
+# Record ids are "<payment_id>:<effect>", so repeated confirmations enqueue an effect once.
+# Records are claimed with a lease (OUTBOX_LEASE_SECONDS), retried with exponential backoff
+# and dead-lettered (status "dead") after OUTBOX_MAX_ATTEMPTS; every effect is safe to
+# repeat (downstream calls are keyed by payment id / notification id).
+#
+# Usage (IPN response time against slow stub services; the script re-runs itself against a
+# scratch database, <DB_NAME>_benchmark, which is dropped afterwards, so the running service's
+# dispatcher never sees the benchmark's payments or outbox records):
+#   python outbox.py --requests 200 --delay 0.5
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+
+from config import Config, INTERNAL_API_KEY
+from model import get_client, payments_collection, payment_outbox_collection
+from utils import (
+    calculate_total_paid,
+    confirm_room_reservation,
+    get_service_url,
+    publish_deposit_revenue_event,
+    release_room_reservation,
+    update_bill_status_if_paid,
+    update_booking_deposit_status,
+)
+
+
+# ============== Transactions ==============
+
+# Run callback(session) in a transaction; standalone Mongo (no replica set) runs it without one
+def run_in_transaction(callback):
+    try:
+        with get_client().start_session() as session:
+            return session.with_transaction(callback)
+    except OperationFailure as e:
+        # 20 = IllegalOperation: transactions need a replica set
+        if e.code != 20:
+            raise
+    return callback(None)
+
+
+# ============== Enqueue ==============
+
+def build_effect(payment_id, effect, payload=None):
+    now = datetime.datetime.utcnow()
+    return {
+        '_id': f"{payment_id}:{effect}",
+        'payment_id': payment_id,
+        'effect': effect,
+        'payload': payload or {},
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'locked_until': None,
+        'last_error': None,
+        'created_at': now,
+        'done_at': None
+    }
+
+
+# Effects of a completed payment
+def success_effects(payment, transaction_id=None):
+    payment_id = payment['_id']
+    payment_type = payment.get('payment_type')
+    user_id = payment.get('user_id')
+    effects = []
+
+    if payment_type in ('booking', 'booking_deposit') and payment.get('booking_id'):
+        effects.append(build_effect(payment_id, 'booking_deposit_paid', {
+            'booking_id': payment['booking_id'], 'transaction_id': transaction_id
+        }))
+
+    if payment_type == 'room_reservation_deposit' and payment.get('room_id'):
+        effects.append(build_effect(payment_id, 'room_reservation_confirm', {'room_id': payment['room_id']}))
+        effects.append(build_effect(payment_id, 'deposit_revenue_event'))
+        if user_id:
+            effects.append(build_effect(payment_id, 'notification', {
+                'user_id': user_id,
+                'title': "Đặt cọc thành công",
+                'message': "Bạn đã đặt cọc phòng thành công. Vui lòng vào 'Phòng của tôi' để xem chi tiết.",
+                'type': "payment",
+                'metadata': {'room_id': payment['room_id'], 'payment_id': payment_id, 'type': 'room_deposit'}
+            }))
+
+    if payment_type == 'bill_payment' and payment.get('bill_id'):
+        effects.append(build_effect(payment_id, 'bill_status', {
+            'bill_id': payment['bill_id'],
+            'bill_total': float(payment.get('bill_total') or payment.get('amount') or 0)
+        }))
+        if user_id:
+            effects.append(build_effect(payment_id, 'notification', {
+                'user_id': user_id,
+                'title': "Thanh toán thành công",
+                'message': f"Hóa đơn {payment['bill_id']} đã được thanh toán thành công.",
+                'type': "payment",
+                'metadata': {'bill_id': payment['bill_id'], 'payment_id': payment_id}
+            }))
+
+    return effects
+
+
+# Effects of a failed payment
+def failure_effects(payment):
+    if payment.get('payment_type') == 'room_reservation_deposit' and payment.get('room_id'):
+        return [build_effect(payment['_id'], 'room_reservation_release', {'room_id': payment['room_id']})]
+    return []
+
+
+# Store effects (use the same session as the payment write); already queued ones are kept
+def enqueue_effects(records, session=None):
+    if records:
+        payment_outbox_collection.bulk_write([
+            UpdateOne({'_id': r['_id']}, {'$setOnInsert': {k: v for k, v in r.items() if k != '_id'}}, upsert=True)
+            for r in records
+        ], ordered=False, session=session)
+
+
+# ============== Effects ==============
+
+def _booking_deposit_paid(record):
+    payload = record['payload']
+    return update_booking_deposit_status(
+        payload['booking_id'], 'paid', payload.get('transaction_id'), payment_id=record['payment_id']
+    )
+
+
+def _room_reservation_confirm(record):
+    return confirm_room_reservation(record['payload']['room_id'], record['payment_id'])
+
+
+def _room_reservation_release(record):
+    return release_room_reservation(record['payload']['room_id'], record['payment_id'])
+
+
+def _deposit_revenue_event(record):
+    payment = payments_collection.find_one({'_id': record['payment_id']})
+    return bool(payment) and publish_deposit_revenue_event(payment)
+
+
+def _bill_status(record):
+    payload = record['payload']
+    # Not fully paid yet: nothing to do
+    if calculate_total_paid(payload['bill_id']) < payload['bill_total']:
+        return True
+    return update_bill_status_if_paid(payload['bill_id'], payload['bill_total'])
+
+
+# Bulk endpoint with the record id as notification _id, so redelivery creates it once
+def _notification(record):
+    payload = record['payload']
+    response = requests.post(
+        f"{get_service_url('notification-service')}/api/notifications/bulk",
+        json={'notifications': [{'_id': record['_id'], **payload}]},
+        headers={'X-Internal-Api-Key': INTERNAL_API_KEY, 'Content-Type': 'application/json'},
+        timeout=5
+    )
+    return response.ok
+
+
+EFFECT_HANDLERS = {
+    'booking_deposit_paid': _booking_deposit_paid,
+    'room_reservation_confirm': _room_reservation_confirm,
+    'room_reservation_release': _room_reservation_release,
+    'deposit_revenue_event': _deposit_revenue_event,
+    'bill_status': _bill_status,
+    'notification': _notification,
+}
+
+
+# ============== Dispatcher ==============
+
+def _backoff_seconds(attempts):
+    return min(5 * (2 ** attempts), 3600)
+
+
+# Lease the next due record (or one whose lease expired: its worker died)
+def _claim(now):
+    return payment_outbox_collection.find_one_and_update(
+        {'$or': [
+            {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+            {'status': 'running', 'locked_until': {'$lte': now}}
+        ]},
+        {'$set': {'status': 'running', 'locked_until': now + datetime.timedelta(seconds=Config.OUTBOX_LEASE_SECONDS)}},
+        sort=[('next_attempt_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _run(record):
+    handler = EFFECT_HANDLERS.get(record['effect'])
+    if handler is None:
+        raise RuntimeError(f"Unknown effect {record['effect']}")
+    if not handler(record):
+        raise RuntimeError(f"{record['effect']} was not accepted downstream")
+
+
+# Run up to OUTBOX_BATCH_SIZE due effects; failures are retried with exponential backoff
+def dispatch_payment_outbox():
+    executed = 0
+    for _ in range(Config.OUTBOX_BATCH_SIZE):
+        now = datetime.datetime.utcnow()
+        record = _claim(now)
+        if record is None:
+            break
+
+        try:
+            _run(record)
+        except Exception as e:
+            attempts = record.get('attempts', 0) + 1
+            dead = attempts >= Config.OUTBOX_MAX_ATTEMPTS
+            payment_outbox_collection.update_one({'_id': record['_id']}, {'$set': {
+                'status': 'dead' if dead else 'pending',
+                'attempts': attempts,
+                'next_attempt_at': now + datetime.timedelta(seconds=_backoff_seconds(attempts)),
+                'locked_until': None,
+                'last_error': str(e)
+            }})
+            if dead:
+                print(f"[OUTBOX] {record['_id']} dead-lettered after {attempts} attempts: {e}")
+            continue
+
+        payment_outbox_collection.update_one({'_id': record['_id']}, {
+            '$set': {'status': 'done', 'done_at': datetime.datetime.utcnow(), 'locked_until': None},
+            '$inc': {'attempts': 1}
+        })
+        executed += 1
+
+    if executed:
+        print(f"[OUTBOX] Executed {executed} payment effects")
+    return executed
+
+
+# Queue a dead-lettered effect again; returns False when it is not dead
+def retry_dead_effect(effect_id):
+    result = payment_outbox_collection.update_one({'_id': effect_id, 'status': 'dead'}, {'$set': {
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.datetime.utcnow(),
+        'last_error': None
+    }})
+    return result.modified_count == 1
+
+
+# ============== Benchmark ==============
+
+BENCHMARK_DB_SUFFIX = '_benchmark'
+
+
+def _start_stub_server(delay):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(delay)
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _signed_ipn_params(payment_id, amount_vnd):
+    from vnpay import _sorted_query, sign_hmac_sha512
+
+    params = {
+        'vnp_TxnRef': payment_id,
+        'vnp_Amount': str(amount_vnd * 100),
+        'vnp_ResponseCode': '00',
+        'vnp_TransactionNo': uuid.uuid4().hex[:12],
+        'vnp_TmnCode': Config.VNPAY_TMN_CODE,
+    }
+    params['vnp_SecureHash'] = sign_hmac_sha512(_sorted_query(params), Config.VNPAY_HASH_SECRET)
+    return params
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def benchmark(count, delay):
+    import utils
+    from app import app
+
+    # Never against the live database: the service's own dispatcher would run these effects
+    assert Config.DB_NAME.endswith(BENCHMARK_DB_SUFFIX), Config.DB_NAME
+
+    # Every downstream service (and the Consul lookup) answers after `delay` seconds
+    server = _start_stub_server(delay)
+    stub_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def slow_service_url(service_name):
+        time.sleep(delay)
+        return stub_url
+
+    utils.get_service_url = globals()['get_service_url'] = slow_service_url
+
+    run = uuid.uuid4().hex[:6]
+    payments = [{
+        '_id': f"BENCH{run}{i:05d}", 'payment_type': 'bill_payment', 'bill_id': f"BENCH{run}B{i:05d}",
+        'user_id': 'benchmark', 'amount': 1000.0, 'amount_vnd': 1000, 'bill_total': 1000.0,
+        'method': 'vnpay', 'status': 'pending', 'benchmark': True,
+        'created_at': datetime.datetime.utcnow().isoformat() + 'Z'
+    } for i in range(count)]
+    payments_collection.insert_many(payments)
+
+    client = app.test_client()
+    latencies = []
+    try:
+        for payment in payments:
+            params = _signed_ipn_params(payment['_id'], payment['amount_vnd'])
+            started = time.perf_counter()
+            response = client.get('/api/vnpay/ipn', query_string=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.get_json()['RspCode'] == '00', response.get_json()
+
+        started = time.perf_counter()
+        executed = 0
+        while True:
+            batch = dispatch_payment_outbox()
+            if not batch:
+                break
+            executed += batch
+        effects_ms = (time.perf_counter() - started) * 1000
+
+        print(f"[BENCHMARK] {count} IPNs, downstream delay {delay * 1000:.0f} ms per call")
+        print(f"  IPN response     p50 {_percentile(latencies, 50):8.1f} ms   "
+              f"p95 {_percentile(latencies, 95):8.1f} ms   max {max(latencies):8.1f} ms")
+        print(f"  effects (worker) {executed} executed, {effects_ms / count:8.1f} ms per payment "
+              f"(previously spent inside the IPN request)")
+    finally:
+        get_client().drop_database(Config.DB_NAME)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='IPN latency benchmark with slow downstream services')
+    parser.add_argument('--requests', type=int, default=200, help='Number of IPN callbacks')
+    parser.add_argument('--delay', type=float, default=0.5, help='Seconds each downstream call takes')
+    args = parser.parse_args()
+    if not Config.DB_NAME.endswith(BENCHMARK_DB_SUFFIX):
+        # Collections are bound at import, so run again with DB_NAME set to the scratch database
+        env = {**os.environ, 'DB_NAME': f"{Config.DB_NAME}{BENCHMARK_DB_SUFFIX}"}
+        raise SystemExit(subprocess.call([sys.executable, *sys.argv], env=env))
+    benchmark(args.requests, args.delay)
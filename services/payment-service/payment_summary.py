@@ -0,0 +1,142 @@
+# Payment Service - Payment Summary
+# /internal/payments/summary sums payments with one $group, served by the covering
+# SUMMARY_INDEX_KEYS index. Older payments only carry amount_vnd, so the amount summed is
+# amount, falling back to amount_vnd.
+#
+# Usage (times the previous approach - every completed payment downloaded with its
+# vnpay_response and summed per month in Python - against the summary pipeline; runs in a
+# scratch database, <DB_NAME>_benchmark, which is dropped afterwards):
+#   python payment_summary.py --benchmark --payments 100000
+import argparse
+import datetime
+import random
+import time
+
+from pymongo import MongoClient
+
+from config import Config
+from model import SUMMARY_INDEX_KEYS
+
+
+SUMMARY_GROUPS = {
+    # created_at is an ISO string: "YYYY-MM-..."
+    "month": {"$toInt": {"$substrCP": ["$created_at", 5, 2]}},
+    "payment_type": "$payment_type",
+    "none": None,
+}
+
+
+def summary_match(status, payment_type=None, year=None):
+    match = {"status": status}
+    if payment_type:
+        match["payment_type"] = payment_type
+    if year:
+        # ISO strings sort chronologically, so the year is an index range on created_at
+        match["created_at"] = {"$gte": f"{year:04d}-", "$lt": f"{year + 1:04d}-"}
+    return match
+
+
+def summary_pipeline(match, group_by):
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": SUMMARY_GROUPS[group_by],
+            "total": {"$sum": {"$ifNull": ["$amount", "$amount_vnd"]}},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+# ============== Benchmark ==============
+
+PAYMENT_TYPES = ("room_reservation_deposit", "booking_deposit", "bill_payment")
+
+
+def _synthetic_payments(count):
+    rng = random.Random(7)
+    start = datetime.datetime(2023, 1, 1)
+    for i in range(count):
+        created = start + datetime.timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))
+        amount = rng.randint(500, 5000) * 1000
+        payment = {
+            "_id": f"PAY{i:08d}",
+            "user_id": f"U{i % 3000:05d}",
+            "payment_type": rng.choice(PAYMENT_TYPES),
+            "status": rng.choice(["completed", "completed", "completed", "pending", "failed"]),
+            "amount_vnd": amount,
+            "vnpay_response": {f"vnp_Field{k}": "x" * 40 for k in range(12)},
+            "created_at": created.isoformat() + "Z",
+        }
+        # Every tenth payment predates the amount field
+        if i % 10:
+            payment["amount"] = float(amount)
+        yield payment
+
+
+# The previous report-service loop over GET /api/payments?status=completed
+def _python_deposits_by_month(collection, year):
+    deposits_by_month = {}
+    for payment in collection.find({"status": "completed"}):
+        if payment.get("payment_type") != "room_reservation_deposit":
+            continue
+        created = datetime.datetime.fromisoformat(payment["created_at"].replace("Z", "+00:00"))
+        if created.year == year:
+            amount = float(payment.get("amount", payment.get("amount_vnd", 0)))
+            deposits_by_month[created.month] = deposits_by_month.get(created.month, 0) + amount
+    return deposits_by_month
+
+
+def _pipeline_deposits_by_month(collection, year):
+    match = summary_match("completed", "room_reservation_deposit", year)
+    return {g["_id"]: g["total"] for g in collection.aggregate(summary_pipeline(match, "month"))}
+
+
+def _timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def benchmark(count, repeat):
+    client = MongoClient(Config.MONGO_URI)
+    scratch_db = f"{Config.DB_NAME}_benchmark"
+    client.drop_database(scratch_db)
+    collection = client[scratch_db][Config.COLLECTION_NAME]
+    try:
+        collection.create_index(SUMMARY_INDEX_KEYS)
+        batch = []
+        for payment in _synthetic_payments(count):
+            batch.append(payment)
+            if len(batch) == 5000:
+                collection.insert_many(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch)
+
+        year = 2024
+        python_ms, python_result = _timed(lambda: _python_deposits_by_month(collection, year), repeat)
+        pipeline_ms, pipeline_result = _timed(lambda: _pipeline_deposits_by_month(collection, year), repeat)
+        mismatches = [
+            month for month in set(python_result) | set(pipeline_result)
+            if abs(python_result.get(month, 0) - pipeline_result.get(month, 0)) > 0.01
+        ]
+        print(f"[BENCHMARK] {count} payments, deposits per month of {year}")
+        print(f"  full list + Python loop   {python_ms:10.2f} ms")
+        print(f"  summary $group            {pipeline_ms:10.2f} ms")
+        print(f"  months that differ        {len(mismatches):10d}")
+        return mismatches
+    finally:
+        client.drop_database(scratch_db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Payment summary benchmark")
+    parser.add_argument("--benchmark", action="store_true", help="Time the summary against the Python loop")
+    parser.add_argument("--payments", type=int, default=100000, help="Synthetic payments for --benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per timed approach")
+    args = parser.parse_args()
+    if args.benchmark:
+        raise SystemExit(1 if benchmark(args.payments, args.repeat) else 0)
+    parser.print_help()
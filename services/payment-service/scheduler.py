@@ -0,0 +1,27 @@
+# Payment Service - Background Scheduler
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from config import Config
+from outbox import dispatch_payment_outbox
+
+
+def start_scheduler():
+# Start the background scheduler
+    
+    scheduler = BackgroundScheduler()
+    
+    # Run queued payment side effects (booking, room, bill, notification calls)
+    scheduler.add_job(
+        dispatch_payment_outbox,
+        'interval',
+        seconds=Config.OUTBOX_DISPATCH_INTERVAL,
+        id='payment_outbox',
+        name='Dispatch payment outbox',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    scheduler.start()
+    print(f"[SCHEDULER] Started - payment outbox dispatched every {Config.OUTBOX_DISPATCH_INTERVAL}s")
+    return scheduler
@@ -1,6 +1,8 @@
+import datetime
 import requests
 from config import CONSUL_HOST, CONSUL_PORT, INTERNAL_API_KEY
 from model import payments_collection
+from balances import get_total_paid
 
 # Helper function: Get service URL from Consul (dynamic discovery)
 def get_service_url(service_name):
@@ -36,15 +38,13 @@ def check_user_has_active_contract(user_id):
     try:
         service_url = get_service_url('contract-service')
         response = requests.get(
-            f"{service_url}/internal/contracts",
+            f"{service_url}/internal/contracts/active",
+            params={'user_id': str(user_id)},
             headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
-            timeout=10
+            timeout=5
         )
         if response.ok:
-            contracts = response.json().get('contracts', [])
-            for contract in contracts:
-                if contract.get('user_id') == str(user_id) and contract.get('status') == 'active':
-                    return True
+            return bool(response.json().get('has_active_contract'))
         return False
     except Exception as e:
         print(f"Error checking user contract: {e}")
@@ -271,14 +271,33 @@ def send_notification(user_id, title, message, notification_type, metadata=None)
         print(f"Error sending notification: {exc}")
         return False
 
-# Helper function: Tính tổng thanh toán đã hoàn thành của một bill
+# Report a completed room deposit to report-service's revenue rollups (keyed by payment id,
+# so repeated confirmations count once). Best effort: report-service reconciles periodically.
+def publish_deposit_revenue_event(payment):
+    created_str = payment.get('created_at') or payment.get('updated_at') or ''
+    try:
+        created = datetime.datetime.fromisoformat(created_str.replace('Z', '+00:00'))
+        response = requests.post(
+            f"{get_service_url('report-service')}/internal/reports/revenue-events",
+            json={
+                'event_id': f"deposit:{payment['_id']}",
+                'source': 'deposits',
+                'year': created.year,
+                'month': created.month,
+                'amount': float(payment.get('amount', payment.get('amount_vnd', 0))),
+                'count': 1
+            },
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=3
+        )
+        return response.ok
+    except Exception as exc:
+        print(f"Error publishing deposit revenue event: {exc}")
+        return False
+
+# Helper function: Tính tổng thanh toán đã hoàn thành của một bill (từ bill_balances)
 def calculate_total_paid(bill_id):
-    pipeline = [
-        {'$match': {'bill_id': bill_id, 'status': 'completed'}},
-        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
-    ]
-    result = list(payments_collection.aggregate(pipeline))
-    return result[0]['total'] if result else 0
+    return get_total_paid(bill_id)
 
 # Helper function: Cập nhật bill status nếu thanh toán đủ
 def update_bill_status_if_paid(bill_id, total_amount):
@@ -12,16 +12,15 @@ from flask import Blueprint, jsonify, redirect, request
 
 from config import Config
 from model import payments_collection
+from balances import apply_payment_update
+from outbox import enqueue_effects, failure_effects, run_in_transaction, success_effects
 from decorators import token_required
+from idempotency import idempotent
 from utils import (
     check_user_has_active_contract,
-    confirm_room_reservation,
     fetch_service_data,
     hold_room_reservation,
     release_room_reservation,
-    update_bill_status_if_paid,
-    update_booking_deposit_status,
-    send_notification,
     calculate_total_paid,
 )
 from vnpay import build_payment_url, querydr_verify_transaction, validate_return_or_ipn
@@ -43,6 +42,28 @@ def _get_client_ip() -> str:
     )
 
 
+# Persist the payment's new state together with its downstream effects (run by the outbox
+# dispatcher), so confirmations answer without waiting for other services
+def _complete_payment(payment, set_fields, transaction_id=None):
+    effects = success_effects(payment, transaction_id)
+
+    def write(session):
+        apply_payment_update(payment["_id"], {**set_fields, "status": "completed"}, session=session)
+        enqueue_effects(effects, session=session)
+
+    run_in_transaction(write)
+
+
+def _fail_payment(payment, set_fields):
+    effects = failure_effects(payment)
+
+    def write(session):
+        apply_payment_update(payment["_id"], {**set_fields, "status": "failed"}, session=session)
+        enqueue_effects(effects, session=session)
+
+    run_in_transaction(write)
+
+
 # ---------------------------
 # VNPay deposit flow (booking)
 # ---------------------------
@@ -50,6 +71,7 @@ def _get_client_ip() -> str:
 
 @vnpay_bp.route("/booking-deposit", methods=["POST"])
 @token_required
+@idempotent
 def vnpay_create_deposit(current_user):
     data = request.get_json() or {}
     booking_id = data.get("booking_id")
@@ -110,6 +132,7 @@ def vnpay_create_deposit(current_user):
 
 @vnpay_bp.route("/bill", methods=["POST"])
 @token_required
+@idempotent
 def vnpay_create_bill_payment(current_user):
     data = request.get_json() or {}
     bill_id = data.get("bill_id") or data.get("billId")
@@ -181,6 +204,7 @@ def vnpay_create_bill_payment(current_user):
 
 @vnpay_bp.route("/room-deposit", methods=["POST"])
 @token_required
+@idempotent
 def vnpay_create_room_deposit(current_user):
     data = request.get_json() or {}
     room_id = data.get("room_id")
@@ -287,78 +311,25 @@ def vnpay_ipn():
 
     expected_amount_vnd = int(round(float(payment.get("amount_vnd") or payment.get("amount") or 0)))
     if expected_amount_vnd <= 0 or amount_received_vnd != expected_amount_vnd:
-        payments_collection.update_one(
-            {"_id": payment_id},
+        apply_payment_update(
+            payment_id,
             {
-                "$set": {
-                    "status": "failed",
-                    "provider": "vnpay",
-                    "provider_txn_id": transaction_id,
-                    "transaction_id": transaction_id,
-                    "provider_response_code": response_code,
-                    "amount_received_vnd": amount_received_vnd,
-                    "vnpay_response": vnp_params,
-                    "updated_at": _utc_now_iso(),
-                }
+                "status": "failed",
+                "provider": "vnpay",
+                "provider_txn_id": transaction_id,
+                "transaction_id": transaction_id,
+                "provider_response_code": response_code,
+                "amount_received_vnd": amount_received_vnd,
+                "vnpay_response": vnp_params,
+                "updated_at": _utc_now_iso(),
             },
         )
         return jsonify({"RspCode": "04", "Message": "Invalid amount"})
 
     if response_code == "00":
-        payments_collection.update_one(
-            {"_id": payment_id},
+        _complete_payment(
+            payment,
             {
-                "$set": {
-                    "status": "completed",
-                    "transaction_id": transaction_id,
-                    "provider": "vnpay",
-                    "provider_txn_id": transaction_id,
-                    "provider_response_code": response_code,
-                    "amount_received_vnd": amount_received_vnd,
-                    "vnpay_response": vnp_params,
-                    "updated_at": _utc_now_iso(),
-                }
-            },
-        )
-
-        if payment.get("payment_type") in ["booking", "booking_deposit"] and payment.get("booking_id"):
-            update_booking_deposit_status(
-                payment["booking_id"],
-                "paid",
-                transaction_id,
-                payment_id=payment_id,
-            )
-
-        if payment.get("payment_type") == "room_reservation_deposit" and payment.get("room_id"):
-            confirm_room_reservation(payment["room_id"], payment_id)
-            if payment.get("user_id"):
-                send_notification(
-                    payment.get("user_id"),
-                    "Đặt cọc thành công",
-                    f"Bạn đã đặt cọc phòng thành công. Vui lòng vào 'Phòng của tôi' để xem chi tiết.",
-                    "payment",
-                    {"room_id": payment.get("room_id"), "payment_id": payment_id, "type": "room_deposit"},
-                )
-
-        if payment.get("payment_type") == "bill_payment" and payment.get("bill_id"):
-            bill_total = payment.get("bill_total") or payment.get("amount") or amount_received_vnd
-            update_bill_status_if_paid(payment["bill_id"], bill_total)
-            if payment.get("user_id"):
-                send_notification(
-                    payment.get("user_id"),
-                    "Thanh toán thành công",
-                    f"Hóa đơn {payment.get('bill_id')} đã được thanh toán thành công.",
-                    "payment",
-                    {"bill_id": payment.get("bill_id"), "payment_id": payment_id},
-                )
-
-        return jsonify({"RspCode": "00", "Message": "Confirm Success"})
-
-    payments_collection.update_one(
-        {"_id": payment_id},
-        {
-            "$set": {
-                "status": "failed",
                 "transaction_id": transaction_id,
                 "provider": "vnpay",
                 "provider_txn_id": transaction_id,
@@ -366,13 +337,24 @@ def vnpay_ipn():
                 "amount_received_vnd": amount_received_vnd,
                 "vnpay_response": vnp_params,
                 "updated_at": _utc_now_iso(),
-            }
+            },
+            transaction_id,
+        )
+        return jsonify({"RspCode": "00", "Message": "Confirm Success"})
+
+    _fail_payment(
+        payment,
+        {
+            "transaction_id": transaction_id,
+            "provider": "vnpay",
+            "provider_txn_id": transaction_id,
+            "provider_response_code": response_code,
+            "amount_received_vnd": amount_received_vnd,
+            "vnpay_response": vnp_params,
+            "updated_at": _utc_now_iso(),
         },
     )
 
-    if payment.get("payment_type") == "room_reservation_deposit" and payment.get("room_id"):
-        release_room_reservation(payment["room_id"], payment_id)
-
     return jsonify({"RspCode": "00", "Message": "Confirm Success"})
 
 
@@ -411,14 +393,14 @@ def vnpay_return():
 
         if not signature_ok:
             set_fields["status"] = "failed"
-            payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
+            apply_payment_update(txn_ref, set_fields)
         else:
             if response_code == "00":
                 payment = payments_collection.find_one({"_id": txn_ref})
 
                 if mode == "ipn":
                     set_fields["status"] = "pending"
-                    payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
+                    apply_payment_update(txn_ref, set_fields)
 
                 elif mode == "return":
                     if payment:
@@ -436,17 +418,11 @@ def vnpay_return():
 
                         if expected_amount_vnd > 0 and amount_received_vnd == expected_amount_vnd:
                             verified = True
-                            set_fields["status"] = "completed"
-                            payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
-
-                            _process_successful_payment(payment, transaction_id, txn_ref, amount_received_vnd)
+                            _complete_payment(payment, set_fields, transaction_id)
                         else:
-                            set_fields["status"] = "failed"
-                            payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
-                            if payment.get("payment_type") == "room_reservation_deposit" and payment.get("room_id"):
-                                release_room_reservation(payment["room_id"], txn_ref)
+                            _fail_payment(payment, set_fields)
                     else:
-                        payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
+                        apply_payment_update(txn_ref, set_fields)
 
                 else:  # querydr mode
                     if payment:
@@ -488,17 +464,15 @@ def vnpay_return():
                             set_fields["amount_received_vnd"] = amount_received_vnd
 
                         if verified and expected_amount_vnd > 0 and amount_received_vnd == expected_amount_vnd:
-                            set_fields["status"] = "completed"
-                            payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
-                            _process_successful_payment(payment, transaction_id, txn_ref, amount_received_vnd)
+                            _complete_payment(payment, set_fields, transaction_id)
                         else:
                             set_fields["status"] = "pending"
-                            payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
+                            apply_payment_update(txn_ref, set_fields)
                     else:
-                        payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
+                        apply_payment_update(txn_ref, set_fields)
             else:
                 set_fields["status"] = "failed"
-                payments_collection.update_one({"_id": txn_ref}, {"$set": set_fields})
+                apply_payment_update(txn_ref, set_fields)
 
     # Get payment info for redirect
     booking_id = ""
@@ -575,38 +549,6 @@ def vnpay_return():
     return redirect(f"{frontend_redirect_base}?vnpay=failed&code={response_code}&{suffix}")
 
 
-def _process_successful_payment(payment, transaction_id, payment_id, amount_received_vnd):
-    """Helper function to process successful payment side effects."""
-    if payment.get("payment_type") in ["booking", "booking_deposit"] and payment.get("booking_id"):
-        update_booking_deposit_status(
-            payment["booking_id"],
-            "paid",
-            transaction_id,
-            payment_id=payment_id,
-        )
-    if payment.get("payment_type") == "bill_payment" and payment.get("bill_id"):
-        bill_total = payment.get("bill_total") or payment.get("amount") or amount_received_vnd
-        update_bill_status_if_paid(payment["bill_id"], bill_total)
-        if payment.get("user_id"):
-            send_notification(
-                payment.get("user_id"),
-                "Thanh toán thành công",
-                f"Hóa đơn {payment.get('bill_id')} đã được thanh toán thành công.",
-                "payment",
-                {"bill_id": payment.get("bill_id"), "payment_id": payment_id},
-            )
-    if payment.get("payment_type") == "room_reservation_deposit" and payment.get("room_id"):
-        confirm_room_reservation(payment["room_id"], payment_id)
-        if payment.get("user_id"):
-            send_notification(
-                payment.get("user_id"),
-                "Đặt cọc thành công",
-                f"Bạn đã đặt cọc phòng thành công. Vui lòng vào 'Phòng của tôi' để xác nhận nhận phòng.",
-                "payment",
-                {"room_id": payment.get("room_id"), "payment_id": payment_id, "type": "room_deposit"},
-            )
-
-
 # ---------------------------
 # VNPay Verify Payment (Polling)
 # ---------------------------
@@ -625,20 +567,12 @@ def vnpay_verify_payment(current_user, payment_id):
             return jsonify({"message": "Không có quyền!"}), 403
 
     if payment.get("status") in ("completed", "failed"):
+        # Make sure the side effects are queued (no-op when they already are)
         if payment.get("status") == "completed":
-            if payment.get("payment_type") in ("booking_deposit", "booking") and payment.get("booking_id"):
-                update_booking_deposit_status(
-                    payment["booking_id"],
-                    "paid",
-                    payment.get("transaction_id"),
-                    payment_id=payment_id,
-                )
-            if payment.get("payment_type") == "room_reservation_deposit" and payment.get("room_id"):
-                confirm_room_reservation(payment["room_id"], payment_id)
+            enqueue_effects(success_effects(payment, payment.get("transaction_id")))
 
         if payment.get("status") == "failed":
-            if payment.get("payment_type") == "room_reservation_deposit" and payment.get("room_id"):
-                release_room_reservation(payment["room_id"], payment_id)
+            enqueue_effects(failure_effects(payment))
 
         return jsonify({
             "payment_id": payment_id,
@@ -674,20 +608,9 @@ def vnpay_verify_payment(current_user, payment_id):
                     set_fields["transaction_id"] = transaction_id
                     set_fields["provider_txn_id"] = transaction_id
 
-                payments_collection.update_one({"_id": payment_id}, {"$set": set_fields})
+                _complete_payment(payment, set_fields, transaction_id)
                 updated = payments_collection.find_one({"_id": payment_id}) or payment
 
-                if updated.get("payment_type") in ("booking_deposit", "booking") and updated.get("booking_id"):
-                    update_booking_deposit_status(
-                        updated["booking_id"],
-                        "paid",
-                        transaction_id,
-                        payment_id=payment_id,
-                    )
-
-                if updated.get("payment_type") == "room_reservation_deposit" and updated.get("room_id"):
-                    confirm_room_reservation(updated["room_id"], payment_id)
-
                 return jsonify({
                     "payment_id": payment_id,
                     "booking_id": updated.get("booking_id"),
@@ -769,23 +692,14 @@ def vnpay_verify_payment(current_user, payment_id):
     else:
         set_fields["status"] = "pending"
 
-    payments_collection.update_one({"_id": payment_id}, {"$set": set_fields})
+    if set_fields["status"] == "completed":
+        _complete_payment(payment, set_fields, payment.get("transaction_id") or vnp_return.get("vnp_TransactionNo"))
+    else:
+        apply_payment_update(payment_id, set_fields)
 
     updated = payments_collection.find_one({"_id": payment_id}) or payment
     status = updated.get("status")
 
-    if status == "completed" and updated.get("payment_type") in ("booking_deposit", "booking") and updated.get("booking_id"):
-        transaction_id = updated.get("transaction_id") or vnp_return.get("vnp_TransactionNo")
-        update_booking_deposit_status(
-            updated["booking_id"],
-            "paid",
-            transaction_id,
-            payment_id=payment_id,
-        )
-
-    if status == "completed" and updated.get("payment_type") == "room_reservation_deposit" and updated.get("room_id"):
-        confirm_room_reservation(updated["room_id"], payment_id)
-
     return jsonify({
         "payment_id": payment_id,
         "booking_id": updated.get("booking_id"),
@@ -0,0 +1,309 @@
+# Report Service - Columnar Analytics Snapshot (optional, ANALYTICS_ENABLED=true)
+# Bills (hot + yearly archives) are loaded periodically into NumPy columns:
+#   dates     int64 epoch days (NO_DAY when missing)
+#   amounts   float64
+#   ids       dictionary-encoded int32 codes (rooms, tenants, statuses)
+# Revenue per month, debt aging and per-room statistics are then group-by sums
+# (np.bincount) over boolean masks, served from memory without touching MongoDB.
+# Deposits are not loaded: payments live in payment-service's database, and the deposit
+# revenue already comes from the revenue rollups.
+#
+# Usage (synthetic benchmark: memory footprint and query latency, optionally compared with
+# the aggregation pipelines run on the same bills in a scratch database, <DB_NAME>_benchmark,
+# which is dropped afterwards):
+#   python analytics.py --rows 1000000
+#   python analytics.py --rows 1000000 --compare
+import argparse
+import datetime
+import threading
+import time
+
+import numpy as np
+
+
+NO_DAY = np.iinfo(np.int64).min
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+OPEN_STATUSES = ('pending', 'unpaid', 'partial')
+AGING_EDGES = [1, 31, 61, 91]  # days overdue starting 1_30, 31_60, 61_90, 90_plus
+AGING_NAMES = ['current', '1_30', '31_60', '61_90', '90_plus']
+BILL_FIELDS = {
+    'room_id': 1, 'user_id': 1, 'status': 1, 'total': 1, 'paid_amount': 1, 'debt_amount': 1,
+    'period_year': 1, 'period_month': 1, 'due_date': 1
+}
+CHUNK_ROWS = 50000
+
+
+def to_day(value):
+    if isinstance(value, datetime.datetime):
+        return value.date().toordinal() - EPOCH
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return datetime.date.fromisoformat(value[:10]).toordinal() - EPOCH
+        except ValueError:
+            pass
+    return NO_DAY
+
+
+class Dictionary:
+    """Dictionary encoding of a categorical column: value <-> int32 code."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def code(self, value):
+        return self.codes.get(value, -1)
+
+
+class BillColumns:
+    """Columnar snapshot of all bills."""
+
+    COLUMNS = (
+        ('room', np.int32), ('user', np.int32), ('status', np.int8),
+        ('year', np.int16), ('month', np.int8), ('due_day', np.int64),
+        ('total', np.float64), ('outstanding', np.float64)
+    )
+
+    def __init__(self, columns, rooms, users, statuses, loaded_at, load_seconds):
+        self.columns = columns
+        self.rooms = rooms
+        self.users = users
+        self.statuses = statuses
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        self._masks = {}
+
+    # Build from an iterable of bill dicts, converting CHUNK_ROWS rows at a time
+    @classmethod
+    def from_bills(cls, bills):
+        started = time.time()
+        rooms, users, statuses = Dictionary(), Dictionary(), Dictionary()
+        chunks = {name: [] for name, _ in cls.COLUMNS}
+        buffer = {name: [] for name, _ in cls.COLUMNS}
+
+        def flush():
+            for name, dtype in cls.COLUMNS:
+                chunks[name].append(np.array(buffer[name], dtype=dtype))
+                buffer[name].clear()
+
+        for bill in bills:
+            total = float(bill.get('total') or 0)
+            if bill.get('debt_amount') is not None:
+                outstanding = float(bill['debt_amount'])
+            else:
+                outstanding = max(0.0, total - float(bill.get('paid_amount') or 0))
+            buffer['room'].append(rooms.encode(bill.get('room_id')))
+            buffer['user'].append(users.encode(bill.get('user_id')))
+            buffer['status'].append(statuses.encode(bill.get('status')))
+            buffer['year'].append(int(bill.get('period_year') or 0))
+            buffer['month'].append(int(bill.get('period_month') or 0))
+            buffer['due_day'].append(to_day(bill.get('due_date')))
+            buffer['total'].append(total)
+            buffer['outstanding'].append(outstanding)
+            if len(buffer['total']) == CHUNK_ROWS:
+                flush()
+        flush()
+
+        columns = {name: np.concatenate(chunks[name]) for name, _ in cls.COLUMNS}
+        return cls(columns, rooms, users, statuses, datetime.datetime.utcnow(), time.time() - started)
+
+    def __len__(self):
+        return len(self.columns['total'])
+
+    def memory_bytes(self):
+        return sum(c.nbytes for c in self.columns.values())
+
+    # Boolean mask of rows in the given statuses (the snapshot never changes, so masks are kept)
+    def status_mask(self, *statuses):
+        if statuses not in self._masks:
+            codes = [self.statuses.code(s) for s in statuses]
+            self._masks[statuses] = np.isin(self.columns['status'], codes)
+        return self._masks[statuses]
+
+    # ============== Queries ==============
+
+    # Paid bill revenue per month of a year: [{'_id': month, 'revenue', 'bills_count'}]
+    def revenue_by_month(self, year):
+        mask = self.status_mask('paid') & (self.columns['year'] == int(year))
+        months = self.columns['month'][mask]
+        revenue = np.bincount(months, weights=self.columns['total'][mask], minlength=13)
+        counts = np.bincount(months, minlength=13)
+        return [
+            {'_id': m, 'revenue': float(revenue[m]), 'bills_count': int(counts[m])}
+            for m in range(1, 13) if counts[m]
+        ]
+
+    # Outstanding debt per aging bucket as of `today`
+    def debt_aging(self, today):
+        mask = self.status_mask(*OPEN_STATUSES)
+        due = self.columns['due_day'][mask]
+        overdue = np.where(due == NO_DAY, 0, (today.toordinal() - EPOCH) - due)
+        buckets = np.searchsorted(AGING_EDGES, overdue, side='right')
+        amounts = np.bincount(buckets, weights=self.columns['outstanding'][mask], minlength=len(AGING_NAMES))
+        counts = np.bincount(buckets, minlength=len(AGING_NAMES))
+        return {
+            'as_of': today.isoformat(),
+            'total_debt': float(amounts.sum()),
+            'total_bills': int(counts.sum()),
+            'buckets': [
+                {'bucket': name, 'bills': int(counts[i]), 'amount': float(amounts[i])}
+                for i, name in enumerate(AGING_NAMES)
+            ]
+        }
+
+    # Per-room bill count, revenue and debt (all rooms, or one room)
+    def room_stats(self, room_id=None):
+        rooms = self.columns['room']
+        paid = self.status_mask('paid')
+        open_ = self.status_mask(*OPEN_STATUSES)
+
+        if room_id is not None:
+            code = self.rooms.code(room_id)
+            if code < 0:
+                return []
+            room = rooms == code
+            return [{
+                'room_id': room_id,
+                'total_bills': int(room.sum()),
+                'total_revenue': float(self.columns['total'][room & paid].sum()),
+                'total_debt': float(self.columns['outstanding'][room & open_].sum())
+            }]
+
+        size = len(self.rooms.values)
+        counts = np.bincount(rooms, minlength=size)
+        revenue = np.bincount(rooms[paid], weights=self.columns['total'][paid], minlength=size)
+        debt = np.bincount(rooms[open_], weights=self.columns['outstanding'][open_], minlength=size)
+        return [{
+            'room_id': self.rooms.values[c],
+            'total_bills': int(counts[c]),
+            'total_revenue': float(revenue[c]),
+            'total_debt': float(debt[c])
+        } for c in range(size) if self.rooms.values[c] is not None]
+
+    def info(self):
+        return {
+            'rows': len(self),
+            'memory_bytes': self.memory_bytes(),
+            'rooms': len(self.rooms.values),
+            'tenants': len(self.users.values),
+            'loaded_at': self.loaded_at.isoformat(),
+            'load_seconds': round(self.load_seconds, 3)
+        }
+
+
+# ============== Snapshot ==============
+
+_snapshot = {'bills': None}
+_load_lock = threading.Lock()
+
+
+def _iter_all_bills():
+    from model import bills_collection, archive_collection, archive_years
+
+    for collection in [bills_collection] + [archive_collection(y) for y in archive_years()]:
+        yield from collection.find({}, BILL_FIELDS).batch_size(5000)
+
+
+def _load():
+    snapshot = BillColumns.from_bills(_iter_all_bills())
+    _snapshot['bills'] = snapshot
+    print(f"[ANALYTICS] Loaded {len(snapshot)} bills, {snapshot.memory_bytes() / 1024 / 1024:.1f} MB "
+          f"in {snapshot.load_seconds:.1f}s")
+    return snapshot
+
+
+# Rebuild the snapshot; the previous one keeps serving until the new one is ready
+def refresh_snapshot():
+    with _load_lock:
+        return _load()
+
+
+# Current snapshot (loaded on first use)
+def get_snapshot():
+    snapshot = _snapshot['bills']
+    if snapshot is None:
+        with _load_lock:
+            snapshot = _snapshot['bills'] or _load()
+    return snapshot
+
+
+# ============== Benchmark ==============
+
+def _synthetic_bills(rows):
+    rng = np.random.default_rng(42)
+    statuses = np.array(['paid', 'paid', 'paid', 'pending', 'partial'])
+    status = statuses[rng.integers(0, len(statuses), rows)]
+    rooms = rng.integers(0, 2000, rows)
+    years = rng.integers(2019, 2027, rows)
+    months = rng.integers(1, 13, rows)
+    totals = rng.uniform(2_000_000, 6_000_000, rows).round()
+    for i in range(rows):
+        yield {
+            'room_id': f'R{rooms[i]:04d}', 'user_id': f'U{rooms[i]:04d}', 'status': status[i],
+            'total': totals[i], 'paid_amount': totals[i] / 2 if status[i] == 'partial' else 0,
+            'period_year': years[i], 'period_month': months[i],
+            'due_date': f'{years[i]}-{months[i]:02d}-05'
+        }
+
+
+def _timed(fn, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def benchmark(rows, compare=False):
+    snapshot = BillColumns.from_bills(_synthetic_bills(rows))
+    today = datetime.date(2026, 6, 1)
+    print(f"[ANALYTICS] {rows} bills: columns {snapshot.memory_bytes() / 1024 / 1024:.1f} MB, "
+          f"built in {snapshot.load_seconds:.1f}s")
+    print(f"  revenue_by_month  {_timed(lambda: snapshot.revenue_by_month(2025)):8.2f} ms")
+    print(f"  debt_aging        {_timed(lambda: snapshot.debt_aging(today)):8.2f} ms")
+    print(f"  room_stats (all)  {_timed(lambda: snapshot.room_stats()):8.2f} ms")
+    print(f"  room_stats (one)  {_timed(lambda: snapshot.room_stats('R0001')):8.2f} ms")
+
+    if compare:
+        # Same queries through the aggregation pipelines, on a scratch copy of the synthetic
+        # bills so the live bills collection (and its jobs) never sees them
+        from pymongo import MongoClient
+        from config import Config
+        from reports import debt_aging_pipeline
+        from utils import revenue_by_month_pipeline
+
+        client = MongoClient(Config.MONGO_URI)
+        scratch_db = f"{Config.DB_NAME}_benchmark"
+        client.drop_database(scratch_db)
+        scratch = client[scratch_db][Config.COLLECTION_NAME]
+        batch = []
+        for bill in _synthetic_bills(rows):
+            batch.append({**bill, 'total': float(bill['total']), 'period_year': int(bill['period_year']),
+                          'period_month': int(bill['period_month']), 'status': str(bill['status'])})
+            if len(batch) == 10000:
+                scratch.insert_many(batch)
+                batch = []
+        if batch:
+            scratch.insert_many(batch)
+        try:
+            print(f"  [aggregation] revenue_by_month  "
+                  f"{_timed(lambda: list(scratch.aggregate(revenue_by_month_pipeline(2025)))):8.2f} ms")
+            print(f"  [aggregation] debt_aging        "
+                  f"{_timed(lambda: list(scratch.aggregate(debt_aging_pipeline(today, 50), allowDiskUse=True))):8.2f} ms")
+        finally:
+            client.drop_database(scratch_db)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Columnar analytics benchmark')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of synthetic bills')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also time the aggregation pipelines (on a scratch database)')
+    args = parser.parse_args()
+    benchmark(args.rows, args.compare)
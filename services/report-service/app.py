@@ -1,20 +1,26 @@
 # Report Service - Main Application
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import datetime
 import atexit
 
 from config import Config
-from model import bills_collection
-from decorators import token_required, admin_required
-from utils import (
-    get_timestamp, format_bill, calculate_bill_amounts,
-    get_bill_stats, get_total_revenue, get_total_debt,
-    get_revenue_by_month, get_deposits_by_month,
-    get_room_stats, get_contracts, get_contract_detail,
-    get_room_contracts, get_room_detail, get_payments
-)
+from model import bills_collection, bump_data_version
+from decorators import token_required, admin_required, internal_api_required
+from utils import get_timestamp, format_bill, calculate_bill_amounts, parse_period
 from service_registry import register_service, deregister_service
+from rollups import parse_revenue_event, apply_revenue_event, reconcile_year, get_year_rollups
+from cache import report_cache, cache_key
+from reports import (
+    build_overview, build_revenue, build_debt, build_room_report, build_debt_aging,
+    EXPORT_COLUMNS, parse_export_request, export_filename, export_rows
+)
+from export import MIMETYPES, xlsx_available, iter_export
+from forecast import build_forecast
+from read_models import sync_room_read_models
+from snapshots import TREND_INTERVALS, take_snapshot, pick_interval, get_occupancy_trend
+from analytics import get_snapshot as get_analytics_snapshot, refresh_snapshot as refresh_analytics_snapshot
+from jobs import submit_job, get_job, list_jobs, format_job, iter_artifact, fail_interrupted_jobs
 
 
 app = Flask(__name__)
@@ -23,6 +29,17 @@ CORS(app)
 atexit.register(deregister_service)
 
 
+# ============== Data Version ==============
+
+@app.after_request
+# Legacy bill writes in this service change bill data too
+def bump_version_after_write(response):
+    if request.path.startswith('/api/bills') and request.path != '/api/bills/calculate' \
+            and request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        bump_data_version('bills')
+    return response
+
+
 # ============== Health Check ==============
 
 @app.route('/health', methods=['GET'])
@@ -40,20 +57,28 @@ def create_bill(current_user):
     
     data = request.get_json() or {}
     
-    required = ['contract_id', 'room_id', 'month', 'year', 'electric_old', 'electric_new', 'water_old', 'water_new']
+    required = ['contract_id', 'room_id', 'month', 'electric_old', 'electric_new', 'water_old', 'water_new']
     missing = [f for f in required if f not in data]
     if missing:
         return jsonify({'message': f"Thiếu trường: {', '.join(missing)}"}), 400
     
+    # month: "YYYY-MM" (as bill-service) or numeric month + year
+    period_year, period_month = parse_period(data['month'], data.get('year'))
+    if period_year is None:
+        return jsonify({'message': 'Tháng/năm hóa đơn không hợp lệ!'}), 400
+    
     # Check duplicate
     if bills_collection.find_one({
         'contract_id': data['contract_id'],
-        'month': data['month'],
-        'year': data['year']
+        'period_year': period_year,
+        'period_month': period_month
     }):
         return jsonify({'message': 'Hóa đơn tháng này đã tồn tại!'}), 400
     
-    amounts = calculate_bill_amounts(data)
+    try:
+        amounts = calculate_bill_amounts(data)
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Chỉ số điện nước hoặc đơn giá không hợp lệ!'}), 400
     bill_count = bills_collection.count_documents({})
     
     new_bill = {
@@ -62,7 +87,9 @@ def create_bill(current_user):
         'room_id': data['room_id'],
         'user_id': data.get('user_id', ''),
         'month': data['month'],
-        'year': data['year'],
+        'year': data.get('year', period_year),
+        'period_year': period_year,
+        'period_month': period_month,
         'electric_old': data['electric_old'],
         'electric_new': data['electric_new'],
         'electric_used': amounts['electric_used'],
@@ -75,13 +102,13 @@ def create_bill(current_user):
         'water_cost': amounts['water_cost'],
         'room_rent': amounts['room_rent'],
         'other_fees': amounts['other_fees'],
-        'total_amount': amounts['total_amount'],
+        'total': amounts['total_amount'],
         'paid_amount': 0,
         'debt_amount': amounts['total_amount'],
         'status': 'unpaid',
         'due_date': data.get('due_date', ''),
         'notes': data.get('notes', ''),
-        'created_at': get_timestamp(),
+        'created_at': datetime.datetime.utcnow(),
         'updated_at': get_timestamp()
     }
     
@@ -112,7 +139,7 @@ def pay_bill(current_user, bill_id):
     
     amount = float(data['amount'])
     new_paid = bill['paid_amount'] + amount
-    new_debt = max(0, bill['total_amount'] - new_paid)
+    new_debt = max(0, bill.get('total', 0) - new_paid)
     
     status = 'paid' if new_debt <= 0 else ('partial' if new_paid > 0 else 'unpaid')
     
@@ -124,6 +151,15 @@ def pay_bill(current_user, bill_id):
             'payment_date': get_timestamp() if status == 'paid' else bill.get('payment_date', ''),
             'updated_at': get_timestamp()
         }})
+        if status == 'paid' and bill.get('status') != 'paid' and bill.get('period_year'):
+            apply_revenue_event({
+                '_id': f"{bill_id}:paid:{bill.get('updated_at', '')}",
+                'source': 'bills',
+                'year': bill['period_year'],
+                'month': bill['period_month'],
+                'amount': float(bill.get('total', 0)),
+                'count': 1
+            })
         return jsonify({
             'message': 'Thanh toán thành công!',
             'paid_amount': new_paid,
@@ -146,7 +182,7 @@ def get_bills(current_user):
             query[param] = request.args.get(param)
     for param in ['month', 'year']:
         if request.args.get(param):
-            query[param] = int(request.args.get(param))
+            query[f'period_{param}'] = int(request.args.get(param))
     
     bills = list(bills_collection.find(query).sort('created_at', -1))
     for b in bills:
@@ -157,6 +193,15 @@ def get_bills(current_user):
 
 # ============== Report APIs ==============
 
+def cached_report(name, params, sources, build):
+# Serve a report through the report cache; X-Cache tells HIT / STALE / MISS
+    
+    value, status = report_cache.get_or_compute(cache_key(name, params), sources, build)
+    response = jsonify(value)
+    response.headers['X-Cache'] = status
+    return response, 200
+
+
 @app.route('/api/reports/overview', methods=['GET'])
 @token_required
 @admin_required
@@ -166,43 +211,7 @@ def get_overview(current_user):
     token = request.headers.get('Authorization')
     year = request.args.get('year', datetime.datetime.now().year)
     
-    rooms = get_room_stats(token) or {'total': 0, 'available': 0, 'occupied': 0, 'occupancy_rate': 0}
-    active_contracts = get_contracts(token, 'active')
-    all_contracts = get_contracts(token)
-    
-    bill_stats = get_bill_stats()
-    revenue_bills = get_total_revenue(year)  # Pass year filter
-    
-    # Calculate deposit revenue from completed payments (filtered by year)
-    deposit_revenue = 0
-    payments_data = get_payments(token, 'completed')
-    if payments_data and payments_data.get('payments'):
-        for p in payments_data['payments']:
-            if p.get('payment_type') == 'room_reservation_deposit':
-                # Filter by year
-                created_str = p.get('created_at', p.get('updated_at', ''))
-                if created_str:
-                    try:
-                        created = datetime.datetime.fromisoformat(created_str.replace('Z', '+00:00'))
-                        if created.year == int(year):
-                            deposit_revenue += float(p.get('amount', 0))
-                    except:
-                        pass
-    
-    total_revenue = revenue_bills + deposit_revenue
-    total_debt = get_total_debt()
-    
-    return jsonify({
-        'year': int(year),
-        'rooms': rooms,
-        'contracts': {'active': active_contracts['total'] if active_contracts else 0},
-        'bills': bill_stats,
-        'finance': {
-            'total_revenue': total_revenue,
-            'total_debt': total_debt,
-            'collection_rate': round((total_revenue / (total_revenue + total_debt) * 100) if (total_revenue + total_debt) > 0 else 0, 2)
-        }
-    }), 200
+    return cached_report('overview', {'year': year}, ('bills', 'payments', 'rooms', 'contracts'), lambda: build_overview(year, token))
 
 
 @app.route('/api/reports/revenue', methods=['GET'])
@@ -212,34 +221,22 @@ def get_revenue(current_user):
 # Get monthly revenue report
     
     year = request.args.get('year', datetime.datetime.now().year)
-    token = request.headers.get('Authorization')
     
-    bills_by_month = get_revenue_by_month(year)
-    
-    # Get payments for deposits calculation
-    payments_data = get_payments(token, 'completed')
-    payments_list = payments_data.get('payments', []) if payments_data else []
-    deposits = get_deposits_by_month(payments_list, year)
-    
-    monthly_data = []
-    for month in range(1, 13):
-        month_bills = next((m for m in bills_by_month if m['_id'] == month), None)
-        bills_rev = month_bills['revenue'] if month_bills else 0
-        deps_rev = deposits.get(month, 0)
-        
-        monthly_data.append({
-            'month': month,
-            'revenue': bills_rev + deps_rev,
-            'bills_revenue': bills_rev,
-            'deposits_revenue': deps_rev,
-            'bills_count': month_bills['bills_count'] if month_bills else 0
-        })
+    return cached_report('revenue', {'year': year}, ('bills', 'payments'), lambda: build_revenue(year))
+
+
+@app.route('/api/reports/revenue/reconcile', methods=['POST'])
+@token_required
+@admin_required
+def reconcile_revenue(current_user):
+# Rebuild revenue rollups of a year from bills and payment summaries
     
-    return jsonify({
-        'year': int(year),
-        'total_revenue': sum(m['revenue'] for m in monthly_data),
-        'monthly_data': monthly_data
-    }), 200
+    year = request.args.get('year', datetime.datetime.now().year)
+    try:
+        reconcile_year(int(year))
+    except Exception as e:
+        return jsonify({'message': f'Lỗi: {str(e)}'}), 500
+    return jsonify({'message': 'Đã đối soát doanh thu!', 'year': int(year)}), 200
 
 
 @app.route('/api/reports/debt', methods=['GET'])
@@ -250,40 +247,22 @@ def get_debt(current_user):
     
     token = request.headers.get('Authorization')
     
-    debt_bills = list(bills_collection.find({
-        'status': {'$in': ['unpaid', 'partial']}
-    }).sort('due_date', 1))
-    
-    now = datetime.datetime.now()
-    overdue_count = 0
-    
-    for bill in debt_bills:
-        format_bill(bill)
-        
-        # Get user info from contract
-        if bill.get('contract_id'):
-            contract = get_contract_detail(bill['contract_id'], token)
-            if contract:
-                bill['user_name'] = contract.get('user_info', {}).get('name', '')
-                bill['user_phone'] = contract.get('user_info', {}).get('phone', '')
-        
-        # Calculate overdue days
-        if bill.get('due_date'):
-            try:
-                due = datetime.datetime.fromisoformat(bill['due_date'])
-                days = (now - due).days
-                bill['days_overdue'] = days if days > 0 else 0
-                if days > 0:
-                    overdue_count += 1
-            except:
-                bill['days_overdue'] = 0
+    return cached_report('debt', {}, ('bills',), lambda: build_debt(token))
+
+
+@app.route('/api/reports/debt/aging', methods=['GET'])
+@token_required
+@admin_required
+def get_debt_aging(current_user):
+# Debt aging buckets with per-tenant and per-room breakdowns (?limit= rows per breakdown)
     
-    return jsonify({
-        'total_debt': sum(b['debt_amount'] for b in debt_bills),
-        'total_bills': len(debt_bills),
-        'overdue_bills': overdue_count,
-        'details': debt_bills
-    }), 200
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        return jsonify({'message': 'limit không hợp lệ!'}), 400
+    today = datetime.datetime.utcnow().date()
+    
+    return cached_report('debt_aging', {'date': today, 'limit': limit}, ('bills',), lambda: build_debt_aging(today, limit))
 
 
 @app.route('/api/reports/room/<room_id>', methods=['GET'])
@@ -294,40 +273,271 @@ def get_room_report(current_user, room_id):
     
     token = request.headers.get('Authorization')
     
-    room = get_room_detail(room_id, token)
-    contracts = get_room_contracts(room_id, token)
-    bills = list(bills_collection.find({'room_id': room_id}).sort('created_at', -1))
+    return cached_report('room', {'room_id': room_id}, ('bills', 'rooms', 'contracts'), lambda: build_room_report(room_id, token))
+
+
+@app.route('/api/reports/forecast', methods=['GET'])
+@token_required
+@admin_required
+def get_forecast(current_user):
+# Projected bill revenue of the next months from active contracts and room utility history
+# ?months=12&renewal_rate=0..1
     
-    for b in bills:
-        format_bill(b)
+    try:
+        months = int(request.args.get('months', 12))
+        renewal_rate = float(request.args.get('renewal_rate', 0))
+    except ValueError:
+        return jsonify({'message': 'months hoặc renewal_rate không hợp lệ!'}), 400
+    if not 1 <= months <= Config.FORECAST_MAX_MONTHS or not 0 <= renewal_rate <= 1:
+        return jsonify({'message': f'months phải từ 1 đến {Config.FORECAST_MAX_MONTHS}, renewal_rate từ 0 đến 1!'}), 400
+    
+    today = datetime.datetime.utcnow().date()
+    params = {'date': today, 'months': months, 'renewal_rate': renewal_rate}
+    try:
+        return cached_report('forecast', params, ('bills', 'contracts'), lambda: build_forecast(months, renewal_rate, today))
+    except RuntimeError as e:
+        return jsonify({'message': str(e)}), 503
+
+
+@app.route('/api/reports/occupancy-trend', methods=['GET'])
+@token_required
+@admin_required
+def get_occupancy_trend_report(current_user):
+# Occupancy over time from daily snapshots
+# ?from=YYYY-MM-DD&to=YYYY-MM-DD (default: last 30 days)&interval=day|week|month (default: by range)
+    
+    try:
+        end = datetime.date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.datetime.utcnow().date()
+        start = datetime.date.fromisoformat(request.args['from']) if request.args.get('from') else end - datetime.timedelta(days=29)
+    except ValueError:
+        return jsonify({'message': 'Ngày không hợp lệ (YYYY-MM-DD)!'}), 400
+    if start > end:
+        return jsonify({'message': 'from phải trước to!'}), 400
+    
+    interval = request.args.get('interval') or pick_interval(start, end)
+    if interval not in TREND_INTERVALS:
+        return jsonify({'message': 'interval phải là day, week hoặc month!'}), 400
     
     return jsonify({
-        'room': room,
-        'contracts': contracts.get('contracts', []) if contracts else [],
-        'bills': bills,
-        'statistics': {
-            'total_bills': len(bills),
-            'total_revenue': sum(b['total_amount'] for b in bills if b['status'] == 'paid'),
-            'total_debt': sum(b['debt_amount'] for b in bills if b['status'] in ['unpaid', 'partial'])
-        }
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'interval': interval,
+        'points': get_occupancy_trend(start, end, interval)
     }), 200
 
 
+@app.route('/api/reports/occupancy-snapshots', methods=['POST'])
+@token_required
+@admin_required
+def create_occupancy_snapshot(current_user):
+# Record today's occupancy snapshot now (the scheduler does it hourly)
+    
+    snapshot = take_snapshot()
+    if snapshot is None:
+        return jsonify({'message': 'Đã có snapshot hôm nay hoặc không lấy được dữ liệu phòng/hợp đồng'}), 200
+    return jsonify({
+        'message': 'Đã ghi snapshot công suất phòng!',
+        'date': snapshot['date'].date().isoformat(),
+        'occupancy_rate': snapshot['occupancy_rate']
+    }), 201
+
+
+@app.route('/api/reports/analytics', methods=['GET'])
+@token_required
+@admin_required
+def get_analytics_report(current_user):
+# Revenue / debt aging / per-room statistics served from the in-memory columnar snapshot
+# ?kind=revenue&year= | kind=debt | kind=rooms[&room_id=]
+    
+    if not Config.ANALYTICS_ENABLED:
+        return jsonify({'message': 'Chưa bật phân tích trong bộ nhớ (ANALYTICS_ENABLED)!'}), 501
+    
+    kind = request.args.get('kind', 'revenue')
+    snapshot = get_analytics_snapshot()
+    if kind == 'revenue':
+        try:
+            year = int(request.args.get('year', datetime.datetime.now().year))
+        except ValueError:
+            return jsonify({'message': 'year không hợp lệ!'}), 400
+        deposits = get_year_rollups(year)['deposits']
+        bills = {m['_id']: m for m in snapshot.revenue_by_month(year)}
+        monthly_data = []
+        for month in range(1, 13):
+            bills_rev = bills.get(month, {}).get('revenue', 0)
+            deps_rev = deposits.get(month, {}).get('revenue', 0)
+            monthly_data.append({
+                'month': month,
+                'revenue': bills_rev + deps_rev,
+                'bills_revenue': bills_rev,
+                'deposits_revenue': deps_rev,
+                'bills_count': bills.get(month, {}).get('bills_count', 0)
+            })
+        result = {'year': year, 'total_revenue': sum(m['revenue'] for m in monthly_data), 'monthly_data': monthly_data}
+    elif kind == 'debt':
+        result = snapshot.debt_aging(datetime.datetime.utcnow().date())
+    elif kind == 'rooms':
+        result = {'rooms': snapshot.room_stats(request.args.get('room_id'))}
+    else:
+        return jsonify({'message': 'kind phải là revenue, debt hoặc rooms!'}), 400
+    
+    return jsonify({**result, 'snapshot': snapshot.info()}), 200
+
+
+@app.route('/api/reports/analytics/refresh', methods=['POST'])
+@token_required
+@admin_required
+def refresh_analytics(current_user):
+# Reload the columnar snapshot now
+    
+    if not Config.ANALYTICS_ENABLED:
+        return jsonify({'message': 'Chưa bật phân tích trong bộ nhớ (ANALYTICS_ENABLED)!'}), 501
+    return jsonify(refresh_analytics_snapshot().info()), 200
+
+
+@app.route('/api/reports/read-models/sync', methods=['POST'])
+@token_required
+@admin_required
+def sync_read_models(current_user):
+# Refresh the per-room read model now (the scheduler does it periodically)
+    
+    result = sync_room_read_models()
+    if result is None:
+        return jsonify({'message': 'Không lấy được dữ liệu phòng/hợp đồng!'}), 503
+    return jsonify({'message': 'Đã đồng bộ dữ liệu phòng!', **result}), 200
+
+
+@app.route('/api/reports/cache', methods=['GET'])
+@token_required
+@admin_required
+def get_report_cache_metrics(current_user):
+# Report cache metrics (hits, misses, stale hits, invalidations, ...)
+    
+    return jsonify(report_cache.stats()), 200
+
+
+@app.route('/api/reports/cache', methods=['DELETE'])
+@token_required
+@admin_required
+def clear_report_cache(current_user):
+# Drop every cached report
+    
+    report_cache.clear()
+    return jsonify({'message': 'Đã xóa cache báo cáo!'}), 200
+
+
 @app.route('/api/reports/export', methods=['GET'])
 @token_required
 @admin_required
 def export_report(current_user):
-# Export report (placeholder)
+# Export a report as a streamed CSV / XLSX download
+# ?type=overview|revenue|debt|room|bills&format=csv|xlsx&year= (or year_from=&year_to=)&room_id=&status=
     
-    return jsonify({
-        'message': 'Tính năng xuất Excel đang được phát triển',
-        'report_type': request.args.get('type', 'overview')
-    }), 501
+    spec, error = parse_export_request(request.args)
+    if error:
+        return jsonify({'message': error}), 400
+    if spec['format'] == 'xlsx' and not xlsx_available():
+        return jsonify({'message': 'Chưa cài đặt XlsxWriter, hãy xuất CSV!'}), 501
+    
+    token = request.headers.get('Authorization')
+    rows = export_rows(spec, token)
+    body = iter_export(spec['format'], EXPORT_COLUMNS[spec['type']], rows, sheet_name=spec['type'])
+    return Response(
+        stream_with_context(body),
+        mimetype=MIMETYPES[spec['format']],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(spec)}"'}
+    )
+
+
+# ============== Report Jobs ==============
+
+@app.route('/api/reports/jobs', methods=['POST'])
+@token_required
+@admin_required
+def create_report_job(current_user):
+# Queue an export as a background job; body takes the same fields as /api/reports/export
+    
+    spec, error = parse_export_request(request.get_json() or {})
+    if error:
+        return jsonify({'message': error}), 400
+    if spec['format'] == 'xlsx' and not xlsx_available():
+        return jsonify({'message': 'Chưa cài đặt XlsxWriter, hãy xuất CSV!'}), 501
+    
+    job, error = submit_job(spec, current_user.get('user_id'), request.headers.get('Authorization'))
+    if error:
+        return jsonify({'message': error}), 429
+    return jsonify({'message': 'Đã tiếp nhận yêu cầu báo cáo!', 'job': format_job(job)}), 202
+
+
+@app.route('/api/reports/jobs', methods=['GET'])
+@token_required
+@admin_required
+def get_report_jobs(current_user):
+# Recent jobs of the current user
+    
+    jobs = list_jobs(current_user.get('user_id'))
+    return jsonify({'jobs': [format_job(j) for j in jobs]}), 200
+
+
+@app.route('/api/reports/jobs/<job_id>', methods=['GET'])
+@token_required
+@admin_required
+def get_report_job(current_user, job_id):
+# Job status
+    
+    job = get_job(job_id, current_user.get('user_id'))
+    if not job:
+        return jsonify({'message': 'Không tìm thấy yêu cầu báo cáo!'}), 404
+    return jsonify(format_job(job)), 200
+
+
+@app.route('/api/reports/jobs/<job_id>/download', methods=['GET'])
+@token_required
+@admin_required
+def download_report_job(current_user, job_id):
+# Download the file of a finished job
+    
+    job = get_job(job_id, current_user.get('user_id'))
+    if not job:
+        return jsonify({'message': 'Không tìm thấy yêu cầu báo cáo!'}), 404
+    if job['status'] != 'done':
+        return jsonify({'message': 'Báo cáo chưa sẵn sàng!', 'status': job['status']}), 409
+    
+    return Response(
+        iter_artifact(job),
+        mimetype=MIMETYPES[job['spec']['format']],
+        headers={
+            'Content-Disposition': f'attachment; filename="{job["filename"]}"',
+            'Content-Length': str(job['size'])
+        }
+    )
+
+
+# ============== Internal APIs ==============
+
+@app.route('/internal/reports/revenue-events', methods=['POST'])
+@internal_api_required
+def receive_revenue_event():
+# Apply a revenue event (bill paid/reverted, deposit completed) to the rollups
+    
+    event, error = parse_revenue_event(request.get_json() or {})
+    if error:
+        return jsonify({'message': error}), 400
+    applied = apply_revenue_event(event)
+    return jsonify({'event_id': event['_id'], 'applied': applied}), 200
 
 
 # ============== Entry Point ==============
 
 if __name__ == '__main__':
     print(f"\n{'='*50}\n  {Config.SERVICE_NAME.upper()}\n  Port: {Config.SERVICE_PORT}\n{'='*50}\n")
+    
+    # Revenue rollup reconciliation and occupancy snapshots
+    from scheduler import start_scheduler
+    scheduler = start_scheduler()
+    atexit.register(scheduler.shutdown)
+    
+    # Jobs left queued/running by a previous run of this instance
+    fail_interrupted_jobs()
+    
     register_service()
     app.run(host='0.0.0.0', port=Config.SERVICE_PORT, debug=Config.DEBUG)
\ No newline at end of file
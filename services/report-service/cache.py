@@ -0,0 +1,201 @@
+# Report Service - Report Cache
+# Caches computed report payloads keyed by endpoint + params.
+#   fresh  (age < REPORT_CACHE_TTL)                      -> served as HIT
+#   stale  (age < REPORT_CACHE_TTL + REPORT_CACHE_STALE_TTL) -> served as STALE, refreshed in background
+#   older, or any data version changed                    -> recomputed (MISS)
+# Data versions: 'bills' / 'payments' counters in bills_db.data_versions and the room-service /
+# contract-service counters, so a write anywhere invalidates the reports that depend on it.
+import datetime
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from model import get_data_versions, report_cache_collection
+from utils import get_contracts_version, get_rooms_version
+
+
+# ============== Stores ==============
+
+class LocalCacheStore:
+    """In-process LRU store."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoCacheStore:
+    """Store shared by all report-service instances (report_cache collection, TTL-expired)."""
+
+    evictions = 0
+
+    def __init__(self, collection, retention_seconds):
+        self.collection = collection
+        self.retention_seconds = retention_seconds
+
+    def get(self, key):
+        doc = self.collection.find_one({'_id': key})
+        if not doc:
+            return None
+        return {'value': json.loads(doc['value']), 'versions': doc['versions'], 'created_at': doc['created_at']}
+
+    def set(self, key, entry):
+        self.collection.replace_one({'_id': key}, {
+            # Stored as JSON: report payloads may have keys BSON does not accept
+            'value': json.dumps(entry['value'], default=str),
+            'versions': entry['versions'],
+            'created_at': entry['created_at'],
+            'expires_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=self.retention_seconds)
+        }, upsert=True)
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def __len__(self):
+        return self.collection.estimated_document_count()
+
+
+# ============== Versions ==============
+
+# Versions kept by other services
+REMOTE_VERSIONS = {'rooms': get_rooms_version, 'contracts': get_contracts_version}
+_remote_versions = {name: {'value': None, 'checked_at': 0.0} for name in REMOTE_VERSIONS}
+
+
+# Look a remote version up at most every REMOTE_VERSION_CHECK_INTERVAL seconds
+def _current_remote_version(name):
+    cached = _remote_versions[name]
+    now = time.time()
+    if now - cached['checked_at'] >= Config.REMOTE_VERSION_CHECK_INTERVAL:
+        cached['value'] = REMOTE_VERSIONS[name]()
+        cached['checked_at'] = now
+    return cached['value']
+
+
+def current_versions(sources):
+    versions = get_data_versions([s for s in sources if s not in REMOTE_VERSIONS])
+    for name in sources:
+        if name in REMOTE_VERSIONS:
+            versions[name] = _current_remote_version(name)
+    return versions
+
+
+# ============== Cache ==============
+
+def cache_key(name, params):
+    return name + '?' + '&'.join(f"{k}={params[k]}" for k in sorted(params))
+
+
+class ReportCache:
+
+    def __init__(self, store, ttl, stale_ttl):
+        self.store = store
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._metrics = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'invalidations': 0,
+            'refreshes': 0, 'refresh_errors': 0
+        }
+
+    def _count(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _compute_and_store(self, key, sources, build):
+        # Versions are read before computing: a write during the build invalidates the result
+        versions = current_versions(sources)
+        value = build()
+        self.store.set(key, {'value': value, 'versions': versions, 'created_at': time.time()})
+        return value
+
+    def _refresh(self, key, sources, build):
+        try:
+            self._compute_and_store(key, sources, build)
+            self._count('refreshes')
+        except Exception as e:
+            self._count('refresh_errors')
+            print(f"[CACHE] Refresh of {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    # Refresh a stale entry in the background, once per key at a time
+    def _refresh_async(self, key, sources, build):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, sources, build), daemon=True).start()
+
+    # Return (value, 'HIT' | 'STALE' | 'MISS')
+    def get_or_compute(self, key, sources, build):
+        entry = self.store.get(key)
+        if entry is not None:
+            if entry['versions'] != current_versions(sources):
+                self._count('invalidations')
+            else:
+                age = time.time() - entry['created_at']
+                if age < self.ttl:
+                    self._count('hits')
+                    return entry['value'], 'HIT'
+                if age < self.ttl + self.stale_ttl:
+                    self._count('stale_hits')
+                    self._refresh_async(key, sources, build)
+                    return entry['value'], 'STALE'
+
+        self._count('misses')
+        return self._compute_and_store(key, sources, build), 'MISS'
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics['hits'] + metrics['stale_hits'] + metrics['misses']
+        return {
+            'backend': Config.REPORT_CACHE_BACKEND,
+            'entries': len(self.store),
+            'evictions': self.store.evictions,
+            'ttl': self.ttl,
+            'stale_ttl': self.stale_ttl,
+            'hit_rate': round((metrics['hits'] + metrics['stale_hits']) / lookups, 4) if lookups else 0,
+            **metrics
+        }
+
+
+def create_store():
+    if Config.REPORT_CACHE_BACKEND == 'mongo':
+        return MongoCacheStore(report_cache_collection, Config.REPORT_CACHE_TTL + Config.REPORT_CACHE_STALE_TTL)
+    return LocalCacheStore(Config.REPORT_CACHE_MAX_ENTRIES)
+
+
+report_cache = ReportCache(create_store(), Config.REPORT_CACHE_TTL, Config.REPORT_CACHE_STALE_TTL)
@@ -5,6 +5,50 @@ class Config:
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/bills_db')
     DB_NAME = 'bills_db'
     COLLECTION_NAME = 'bills'
+    # Written by bill-service's archival job: per-month totals of archived paid bills
+    ARCHIVE_ROLLUP_COLLECTION_NAME = 'bill_archive_rollups'
+    ARCHIVE_COLLECTION_PREFIX = 'bills_archive_'
+    REVENUE_ROLLUP_COLLECTION_NAME = 'revenue_rollups'
+    REVENUE_EVENT_COLLECTION_NAME = 'revenue_events'
+    REVENUE_RECONCILE_INTERVAL = int(os.getenv('REVENUE_RECONCILE_INTERVAL', '3600'))  # seconds
+    # Daily occupancy snapshots (time-series); the job runs hourly and records each day once
+    OCCUPANCY_SNAPSHOT_COLLECTION_NAME = 'occupancy_snapshots'
+    # One lock document per day (_id = date), so concurrent runs record a day once
+    OCCUPANCY_SNAPSHOT_LOCK_COLLECTION_NAME = 'occupancy_snapshot_locks'
+    OCCUPANCY_TREND_MAX_POINTS = int(os.getenv('OCCUPANCY_TREND_MAX_POINTS', '120'))
+    # Per-room read model (room + contracts), synced from room-service and contract-service
+    ROOM_READ_MODEL_COLLECTION_NAME = 'room_read_models'
+    ROOM_READ_MODEL_SYNC_INTERVAL = int(os.getenv('ROOM_READ_MODEL_SYNC_INTERVAL', '120'))  # seconds
+    # Revenue forecast: utility cost per room averaged over the last N billed months
+    FORECAST_HISTORY_MONTHS = int(os.getenv('FORECAST_HISTORY_MONTHS', '6'))
+    FORECAST_MAX_MONTHS = 24
+    # Optional in-memory columnar snapshot of bills (analytics.py)
+    ANALYTICS_ENABLED = os.getenv('ANALYTICS_ENABLED', 'false').lower() == 'true'
+    ANALYTICS_REFRESH_INTERVAL = int(os.getenv('ANALYTICS_REFRESH_INTERVAL', '300'))  # seconds
+    # Data version counters (bills: shared with bill-service, payments: revenue events/reconcile)
+    VERSION_COLLECTION_NAME = 'data_versions'
+    # Report cache: 'local' (in-process LRU) or 'mongo' (shared by all instances)
+    REPORT_CACHE_BACKEND = os.getenv('REPORT_CACHE_BACKEND', 'local')
+    REPORT_CACHE_COLLECTION_NAME = 'report_cache'
+    REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '256'))
+    REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', '60'))  # seconds fresh
+    REPORT_CACHE_STALE_TTL = int(os.getenv('REPORT_CACHE_STALE_TTL', '300'))  # seconds served stale while refreshing
+    REMOTE_VERSION_CHECK_INTERVAL = 2  # seconds between room-/contract-service version lookups
+    # Streaming exports
+    EXPORT_FLUSH_ROWS = int(os.getenv('EXPORT_FLUSH_ROWS', '1000'))  # CSV rows per streamed chunk
+    EXPORT_CHUNK_SIZE = 64 * 1024  # bytes per streamed XLSX chunk
+    EXPORT_MAX_YEARS = int(os.getenv('EXPORT_MAX_YEARS', '10'))
+    # Background report jobs
+    REPORT_JOB_COLLECTION_NAME = 'report_jobs'
+    REPORT_JOB_BUCKET = 'report_artifacts'  # GridFS bucket of finished job files
+    REPORT_JOB_WORKERS = int(os.getenv('REPORT_JOB_WORKERS', '2'))
+    REPORT_JOB_MAX_ACTIVE = int(os.getenv('REPORT_JOB_MAX_ACTIVE', '10'))  # queued + running per instance
+    REPORT_JOB_MAX_PER_USER = int(os.getenv('REPORT_JOB_MAX_PER_USER', '2'))
+    REPORT_JOB_RETENTION = int(os.getenv('REPORT_JOB_RETENTION', '86400'))  # seconds finished jobs are kept
+    # Instances touch heartbeat_at of their queued/running jobs every interval; jobs silent for
+    # longer than the timeout (instance gone) are failed by any instance
+    REPORT_JOB_HEARTBEAT_INTERVAL = int(os.getenv('REPORT_JOB_HEARTBEAT_INTERVAL', '30'))  # seconds
+    REPORT_JOB_HEARTBEAT_TIMEOUT = int(os.getenv('REPORT_JOB_HEARTBEAT_TIMEOUT', '300'))  # seconds
     SERVICE_NAME = 'report-service'
     SERVICE_PORT = int(os.getenv('SERVICE_PORT', '5009'))
     JWT_SECRET = os.getenv('JWT_SECRET', 'your-super-secret-key-change-this')
@@ -17,4 +61,5 @@ JWT_SECRET = Config.JWT_SECRET
 SERVICE_NAME = Config.SERVICE_NAME
 SERVICE_PORT = Config.SERVICE_PORT
 CONSUL_HOST = Config.CONSUL_HOST
-CONSUL_PORT = Config.CONSUL_PORT
\ No newline at end of file
+CONSUL_PORT = Config.CONSUL_PORT
+INTERNAL_API_KEY = Config.INTERNAL_API_KEY
\ No newline at end of file
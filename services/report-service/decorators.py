@@ -32,3 +32,12 @@ def admin_required(f):
             return jsonify({'message': 'Yêu cầu quyền admin!'}), 403
         return f(current_user, *args, **kwargs)
     return decorated
+
+def internal_api_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        api_key = request.headers.get('X-Internal-Api-Key')
+        if not api_key or api_key != Config.INTERNAL_API_KEY:
+            return jsonify({'message': 'Unauthorized'}), 403
+        return f(*args, **kwargs)
+    return decorated
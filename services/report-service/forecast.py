@@ -0,0 +1,108 @@
+# Report Service - Revenue Forecast
+# Projects bill revenue for the coming months from active contracts:
+#   rent       monthly_rent, prorated by the days of each month the contract covers
+#   utilities  the room's average electric + water + other fees over the last
+#              FORECAST_HISTORY_MONTHS billed months (rooms without history: overall average)
+# Contracts x months are evaluated as one coverage matrix. With renewal_rate > 0, that share
+# of a contract's revenue is assumed to continue after its end date.
+import datetime
+
+import numpy as np
+
+from config import Config
+from analytics import to_day, NO_DAY, EPOCH
+from model import bills_collection
+from utils import get_contracts_internal
+
+
+BILLED_STATUSES = ['pending', 'unpaid', 'partial', 'paid']
+
+
+def _month_index(year, month):
+    return year * 12 + month - 1
+
+
+# Average monthly utility fees per room over the last `months` billing periods: {room_id: amount}
+def room_utility_averages(today, months):
+    first = _month_index(today.year, today.month) - months
+    pipeline = [
+        {'$match': {'status': {'$in': BILLED_STATUSES}, 'period_year': {'$gte': first // 12}}},
+        {'$match': {'$expr': {'$gte': [
+            {'$add': [{'$multiply': ['$period_year', 12]}, '$period_month', -1]}, first
+        ]}}},
+        {'$group': {'_id': '$room_id', 'utilities': {'$avg': {'$add': [
+            {'$ifNull': ['$electric_fee', 0]}, {'$ifNull': ['$water_fee', 0]}, {'$ifNull': ['$other_fee', 0]}
+        ]}}}}
+    ]
+    return {r['_id']: r['utilities'] or 0 for r in bills_collection.aggregate(pipeline)}
+
+
+def _month_bounds(today, months):
+    starts, ends, labels = [], [], []
+    index = _month_index(today.year, today.month) + 1
+    for i in range(index, index + months):
+        first = datetime.date(i // 12, i % 12 + 1, 1)
+        following = datetime.date((i + 1) // 12, (i + 1) % 12 + 1, 1)
+        starts.append(first.toordinal() - EPOCH)
+        ends.append(following.toordinal() - EPOCH - 1)
+        labels.append(first.strftime('%Y-%m'))
+    return np.array(starts), np.array(ends), labels
+
+
+# Share of each month (columns) covered by each [start, end] day range (rows)
+def _coverage(start, end, month_starts, month_ends):
+    days = (month_ends - month_starts + 1)[None, :]
+    covered = np.minimum(end[:, None], month_ends[None, :]) - np.maximum(start[:, None], month_starts[None, :]) + 1
+    return np.clip(covered / days, 0, 1)
+
+
+def build_forecast(months, renewal_rate, today=None):
+    today = today or datetime.datetime.utcnow().date()
+    contracts = get_contracts_internal('active')
+    if contracts is None:
+        raise RuntimeError('Không lấy được danh sách hợp đồng')
+
+    utilities_by_room = room_utility_averages(today, Config.FORECAST_HISTORY_MONTHS)
+    default_utilities = float(np.mean(list(utilities_by_room.values()))) if utilities_by_room else 0.0
+
+    month_starts, month_ends, labels = _month_bounds(today, months)
+    rent = np.array([float(c.get('monthly_rent') or 0) for c in contracts])
+    utilities = np.array([utilities_by_room.get(c.get('room_id'), default_utilities) for c in contracts])
+    start = np.array([to_day(c.get('start_date')) for c in contracts], dtype=np.int64)
+    end = np.array([to_day(c.get('end_date')) for c in contracts], dtype=np.int64)
+    # Missing dates: treat as already started / open-ended
+    start = np.where(start == NO_DAY, month_starts[0], start)
+    end = np.where(end == NO_DAY, month_ends[-1], end)
+
+    if len(contracts):
+        coverage = _coverage(start, end, month_starts, month_ends)
+        renewed = _coverage(end + 1, np.full_like(end, month_ends[-1]), month_starts, month_ends) * renewal_rate
+        rent_by_month = rent @ coverage + rent @ renewed
+        utilities_by_month = utilities @ coverage + utilities @ renewed
+        active = (coverage > 0).sum(axis=0)
+        expiring = ((end[:, None] >= month_starts[None, :]) & (end[:, None] <= month_ends[None, :])).sum(axis=0)
+    else:
+        rent_by_month = utilities_by_month = np.zeros(months)
+        active = expiring = np.zeros(months, dtype=int)
+
+    projection = [{
+        'month': labels[i],
+        'rent': round(float(rent_by_month[i]), 0),
+        'utilities': round(float(utilities_by_month[i]), 0),
+        'total': round(float(rent_by_month[i] + utilities_by_month[i]), 0),
+        'active_contracts': int(active[i]),
+        'expiring_contracts': int(expiring[i])
+    } for i in range(months)]
+
+    return {
+        'generated_on': today.isoformat(),
+        'months': months,
+        'assumptions': {
+            'renewal_rate': renewal_rate,
+            'utility_history_months': Config.FORECAST_HISTORY_MONTHS,
+            'default_room_utilities': round(default_utilities, 0)
+        },
+        'contracts': len(contracts),
+        'total': sum(p['total'] for p in projection),
+        'projection': projection
+    }
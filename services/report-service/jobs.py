@@ -0,0 +1,224 @@
+# Report Service - Background Report Jobs
+# Heavy exports (multi-year revenue, every bill of several years) can outlast gateway
+# timeouts, so they can also run as jobs:
+#   POST /api/reports/jobs                -> job queued (202)
+#   GET  /api/reports/jobs/<id>           -> queued | running | done | failed
+#   GET  /api/reports/jobs/<id>/download  -> finished file
+# Jobs run in a pool of REPORT_JOB_WORKERS threads per instance, so interactive requests keep
+# their threads and database connections; admission is capped per instance
+# (REPORT_JOB_MAX_ACTIVE queued + running) and per user (REPORT_JOB_MAX_PER_USER).
+# Finished files go to GridFS so any instance can serve the download; jobs and their files
+# are removed REPORT_JOB_RETENTION seconds after they finish.
+# Each instance refreshes heartbeat_at of the jobs it holds every REPORT_JOB_HEARTBEAT_INTERVAL
+# seconds; a queued/running job without a heartbeat for REPORT_JOB_HEARTBEAT_TIMEOUT seconds
+# (its instance crashed or was replaced) is failed by whichever instance notices first.
+import datetime
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from gridfs.errors import NoFile
+
+from config import Config
+from export import MIMETYPES, iter_export
+from model import report_jobs_collection, report_artifacts
+from reports import EXPORT_COLUMNS, export_filename, export_rows
+
+
+ACTIVE_STATUSES = ['queued', 'running']
+INSTANCE_ID = socket.gethostname()
+
+_executor = ThreadPoolExecutor(max_workers=Config.REPORT_JOB_WORKERS, thread_name_prefix='report-job')
+_lock = threading.Lock()
+_active = {'count': 0}
+# Ids of the jobs queued or running in this process
+_held = set()
+
+
+def _finish(job_id, update):
+    now = datetime.datetime.utcnow()
+    report_jobs_collection.update_one({'_id': job_id}, {'$set': {
+        **update,
+        'finished_at': now,
+        'expires_at': now + datetime.timedelta(seconds=Config.REPORT_JOB_RETENTION)
+    }})
+
+
+def _run_job(job_id, spec, token):
+    try:
+        report_jobs_collection.update_one(
+            {'_id': job_id}, {'$set': {'status': 'running', 'started_at': datetime.datetime.utcnow()}}
+        )
+        upload = report_artifacts.open_upload_stream(
+            export_filename(spec), metadata={'job_id': job_id, 'content_type': MIMETYPES[spec['format']]}
+        )
+        try:
+            rows = export_rows(spec, token)
+            for chunk in iter_export(spec['format'], EXPORT_COLUMNS[spec['type']], rows, sheet_name=spec['type']):
+                upload.write(chunk)
+            upload.close()
+        except Exception:
+            upload.abort()
+            raise
+        _finish(job_id, {'status': 'done', 'file_id': upload._id, 'size': upload.length})
+    except Exception as e:
+        print(f"[JOBS] Job {job_id} failed: {e}")
+        _finish(job_id, {'status': 'failed', 'error': str(e)})
+    finally:
+        with _lock:
+            _active['count'] -= 1
+            _held.discard(job_id)
+
+
+# Queue an export job (spec from parse_export_request); returns (job, error)
+def submit_job(spec, user_id, token):
+    cleanup_expired_jobs()
+    fail_stale_jobs()
+    if report_jobs_collection.count_documents(
+        {'user_id': user_id, 'status': {'$in': ACTIVE_STATUSES}}
+    ) >= Config.REPORT_JOB_MAX_PER_USER:
+        return None, 'Bạn đang có quá nhiều báo cáo đang xử lý, vui lòng chờ!'
+    with _lock:
+        if _active['count'] >= Config.REPORT_JOB_MAX_ACTIVE:
+            return None, 'Hệ thống đang xử lý quá nhiều báo cáo, vui lòng thử lại sau!'
+        _active['count'] += 1
+
+    now = datetime.datetime.utcnow()
+    job = {
+        '_id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'instance': INSTANCE_ID,
+        'status': 'queued',
+        'spec': spec,
+        'filename': export_filename(spec),
+        'created_at': now,
+        'heartbeat_at': now,
+        'expires_at': None
+    }
+    try:
+        report_jobs_collection.insert_one(job)
+        with _lock:
+            _held.add(job['_id'])
+        _executor.submit(_run_job, job['_id'], spec, token)
+    except Exception:
+        with _lock:
+            _active['count'] -= 1
+            _held.discard(job['_id'])
+        raise
+    return job, None
+
+
+def get_job(job_id, user_id):
+    return report_jobs_collection.find_one({'_id': job_id, 'user_id': user_id})
+
+
+def list_jobs(user_id, limit=20):
+    return list(report_jobs_collection.find({'user_id': user_id}).sort('created_at', -1).limit(limit))
+
+
+# Chunks of a finished job's file
+def iter_artifact(job):
+    stream = report_artifacts.open_download_stream(job['file_id'])
+    try:
+        while True:
+            chunk = stream.read(Config.EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        stream.close()
+
+
+def format_job(job):
+    result = {
+        'id': job['_id'],
+        'status': job['status'],
+        'type': job['spec']['type'],
+        'format': job['spec']['format'],
+        'years': job['spec']['years'],
+        'filename': job['filename']
+    }
+    for field in ('created_at', 'started_at', 'finished_at', 'expires_at'):
+        if job.get(field):
+            result[field] = job[field].isoformat()
+    if job['status'] == 'done':
+        result['size'] = job.get('size')
+        result['download_url'] = f"/api/reports/jobs/{job['_id']}/download"
+    if job.get('error'):
+        result['error'] = job['error']
+    return result
+
+
+# ============== Maintenance ==============
+
+# Remove finished jobs past retention together with their files
+def cleanup_expired_jobs():
+    expired = list(report_jobs_collection.find(
+        {'expires_at': {'$lt': datetime.datetime.utcnow()}}, {'file_id': 1}
+    ))
+    for job in expired:
+        if job.get('file_id'):
+            try:
+                report_artifacts.delete(job['file_id'])
+            except NoFile:
+                pass
+    if expired:
+        report_jobs_collection.delete_many({'_id': {'$in': [j['_id'] for j in expired]}})
+    return len(expired)
+
+
+# Refresh heartbeat_at of the jobs this process holds
+def heartbeat_jobs():
+    with _lock:
+        held = list(_held)
+    if held:
+        report_jobs_collection.update_many(
+            {'_id': {'$in': held}, 'status': {'$in': ACTIVE_STATUSES}},
+            {'$set': {'heartbeat_at': datetime.datetime.utcnow()}}
+        )
+    return len(held)
+
+
+# Fail queued/running jobs of any instance whose heartbeat stopped (instance crashed or was
+# replaced, e.g. a recreated container with a new hostname)
+def fail_stale_jobs():
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=Config.REPORT_JOB_HEARTBEAT_TIMEOUT)
+    query = {'status': {'$in': ACTIVE_STATUSES}, '$or': [
+        {'heartbeat_at': {'$lt': cutoff}},
+        # Jobs queued before heartbeats existed
+        {'heartbeat_at': {'$exists': False}, 'created_at': {'$lt': cutoff}}
+    ]}
+    stale = list(report_jobs_collection.find(query, {'_id': 1}))
+    failed = 0
+    for job in stale:
+        now = datetime.datetime.utcnow()
+        result = report_jobs_collection.update_one(
+            {**query, '_id': job['_id']},
+            {'$set': {
+                'status': 'failed',
+                'error': 'Báo cáo bị gián đoạn do dịch vụ ngừng hoạt động',
+                'finished_at': now,
+                'expires_at': now + datetime.timedelta(seconds=Config.REPORT_JOB_RETENTION)
+            }}
+        )
+        failed += result.modified_count
+    if failed:
+        print(f"[JOBS] Failed {failed} stale jobs")
+    return failed
+
+
+# Scheduled: keep this instance's jobs alive and fail abandoned ones
+def maintain_jobs():
+    heartbeat_jobs()
+    fail_stale_jobs()
+
+
+# Jobs this instance had queued or running before a restart will never finish
+def fail_interrupted_jobs():
+    jobs = list(report_jobs_collection.find(
+        {'instance': INSTANCE_ID, 'status': {'$in': ACTIVE_STATUSES}}, {'_id': 1}
+    ))
+    for job in jobs:
+        _finish(job['_id'], {'status': 'failed', 'error': 'Dịch vụ khởi động lại khi đang xử lý báo cáo'})
+    return len(jobs)
@@ -1,5 +1,7 @@
 # Report Service Database Models
+from gridfs import GridFSBucket
 from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid
 from config import Config
 
 class Database:
@@ -14,16 +16,113 @@ class Database:
     @property
     def bills(self):
         return self._db[Config.COLLECTION_NAME]
+    
+    @property
+    def archive_rollups(self):
+        return self._db[Config.ARCHIVE_ROLLUP_COLLECTION_NAME]
+    
+    @property
+    def revenue_rollups(self):
+        return self._db[Config.REVENUE_ROLLUP_COLLECTION_NAME]
+    
+    @property
+    def revenue_events(self):
+        return self._db[Config.REVENUE_EVENT_COLLECTION_NAME]
+    
+    @property
+    def data_versions(self):
+        return self._db[Config.VERSION_COLLECTION_NAME]
+    
+    @property
+    def report_cache(self):
+        return self._db[Config.REPORT_CACHE_COLLECTION_NAME]
+    
+    @property
+    def report_jobs(self):
+        return self._db[Config.REPORT_JOB_COLLECTION_NAME]
+    
+    # Files produced by report jobs
+    @property
+    def report_artifacts(self):
+        return GridFSBucket(self._db, bucket_name=Config.REPORT_JOB_BUCKET)
+    
+    @property
+    def room_read_models(self):
+        return self._db[Config.ROOM_READ_MODEL_COLLECTION_NAME]
+    
+    @property
+    def occupancy_snapshots(self):
+        return self._db[Config.OCCUPANCY_SNAPSHOT_COLLECTION_NAME]
+    
+    @property
+    def occupancy_snapshot_locks(self):
+        return self._db[Config.OCCUPANCY_SNAPSHOT_LOCK_COLLECTION_NAME]
+    
+    # Create occupancy_snapshots as a time-series collection (MongoDB 5.0+)
+    def ensure_occupancy_snapshots(self):
+        if Config.OCCUPANCY_SNAPSHOT_COLLECTION_NAME in self._db.list_collection_names():
+            return
+        try:
+            self._db.create_collection(
+                Config.OCCUPANCY_SNAPSHOT_COLLECTION_NAME,
+                timeseries={'timeField': 'date', 'granularity': 'hours'}
+            )
+        except CollectionInvalid:
+            pass
+    
+    # Per-year archives of settled bills, written by bill-service
+    def archive(self, year):
+        return self._db[f"{Config.ARCHIVE_COLLECTION_PREFIX}{int(year)}"]
+    
+    def archive_years(self):
+        prefix = Config.ARCHIVE_COLLECTION_PREFIX
+        return sorted(
+            int(name[len(prefix):]) for name in self._db.list_collection_names()
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        )
 
 _database = Database()
 bills_collection = _database.bills
+archive_rollups_collection = _database.archive_rollups
+revenue_rollups_collection = _database.revenue_rollups
+revenue_events_collection = _database.revenue_events
+data_versions_collection = _database.data_versions
+report_cache_collection = _database.report_cache
+report_jobs_collection = _database.report_jobs
+occupancy_snapshots_collection = _database.occupancy_snapshots
+occupancy_snapshot_locks_collection = _database.occupancy_snapshot_locks
+room_read_models_collection = _database.room_read_models
+report_artifacts = _database.report_artifacts
+archive_collection = _database.archive
+archive_years = _database.archive_years
 
 def init_indexes():
     try:
         bills_collection.create_index([('month', ASCENDING), ('year', ASCENDING)])
         bills_collection.create_index([('status', ASCENDING)])
+        # Room report: $lookup of a room's bills
+        bills_collection.create_index([('room_id', ASCENDING), ('created_at', DESCENDING)])
+        bills_collection.create_index([('status', ASCENDING), ('period_year', ASCENDING), ('period_month', ASCENDING)])
+        revenue_rollups_collection.create_index([('year', ASCENDING), ('month', ASCENDING), ('source', ASCENDING)])
+        # Event ids only need to outlive redelivery
+        revenue_events_collection.create_index([('created_at', ASCENDING)], expireAfterSeconds=90 * 24 * 3600)
+        report_cache_collection.create_index([('expires_at', ASCENDING)], expireAfterSeconds=0)
+        report_jobs_collection.create_index([('user_id', ASCENDING), ('status', ASCENDING)])
+        report_jobs_collection.create_index([('expires_at', ASCENDING)])
+        report_jobs_collection.create_index([('status', ASCENDING), ('heartbeat_at', ASCENDING)])
+        _database.ensure_occupancy_snapshots()
         print("[DB] ✓ Report indexes created")
     except Exception as e:
         print(f"[DB] Index: {e}")
 
-init_indexes()
\ No newline at end of file
+init_indexes()
+
+
+def bump_data_version(name):
+    data_versions_collection.update_one({'_id': name}, {'$inc': {'version': 1}}, upsert=True)
+
+
+# Current counters of the given local versions: {name: version}
+def get_data_versions(names):
+    found = {d['_id']: d.get('version', 0) for d in data_versions_collection.find({'_id': {'$in': list(names)}})}
+    return {name: found.get(name, 0) for name in names}
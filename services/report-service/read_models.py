@@ -0,0 +1,80 @@
+# Report Service - Room Read Model
+# room_read_models keeps one document per room (_id = room_id) with the room's details
+# (room-service) and its contracts (contract-service), synced every
+# ROOM_READ_MODEL_SYNC_INTERVAL seconds. The per-room report is then a single aggregation:
+# the read model joined with the room's bills ($lookup), totals computed server-side
+# (build_room_report adds the room's archived bills to them).
+import datetime
+
+from pymongo import ReplaceOne
+
+from model import bills_collection, room_read_models_collection
+from utils import get_rooms_internal, get_contracts_internal
+
+
+DEBT_STATUSES = ['unpaid', 'partial']
+
+
+# ============== Sync ==============
+
+def sync_room_read_models():
+    rooms = get_rooms_internal()
+    contracts = get_contracts_internal()
+    if rooms is None or contracts is None:
+        print("[READ MODEL] Room or contract service unavailable, keeping previous data")
+        return None
+
+    by_room = {}
+    for contract in sorted(contracts, key=lambda c: str(c.get('created_at') or ''), reverse=True):
+        by_room.setdefault(contract.get('room_id'), []).append(contract)
+
+    now = datetime.datetime.utcnow()
+    operations = [
+        ReplaceOne({'_id': room['_id']}, {
+            'room': room,
+            'contracts': by_room.get(room['_id'], []),
+            'rooms_version': rooms.get('version'),
+            'synced_at': now
+        }, upsert=True)
+        for room in rooms.get('rooms', [])
+    ]
+    if operations:
+        room_read_models_collection.bulk_write(operations, ordered=False)
+    # Rooms deleted in room-service (by id: another instance's clock may differ from ours)
+    room_ids = [room['_id'] for room in rooms.get('rooms', [])]
+    removed = room_read_models_collection.delete_many({'_id': {'$nin': room_ids}}).deleted_count
+
+    print(f"[READ MODEL] Synced {len(operations)} rooms, removed {removed}")
+    return {'rooms': len(operations), 'removed': removed}
+
+
+# ============== Report ==============
+
+def _sum_bills(statuses, value):
+    return {'$sum': {'$map': {
+        'input': {'$filter': {'input': '$bills', 'as': 'bill', 'cond': {'$in': ['$$bill.status', statuses]}}},
+        'as': 'bill',
+        'in': value
+    }}}
+
+
+# Room report from the read model, or None when the room has not been synced yet
+def room_report_from_read_model(room_id):
+    pipeline = [
+        {'$match': {'_id': room_id}},
+        {'$lookup': {
+            'from': bills_collection.name,
+            'localField': '_id',
+            'foreignField': 'room_id',
+            'pipeline': [{'$sort': {'created_at': -1}}],
+            'as': 'bills'
+        }},
+        {'$addFields': {'statistics': {
+            'total_bills': {'$size': '$bills'},
+            'total_revenue': _sum_bills(['paid'], {'$ifNull': ['$$bill.total', 0]}),
+            'total_debt': _sum_bills(DEBT_STATUSES, {'$ifNull': ['$$bill.debt_amount', {'$max': [0, {'$subtract': [
+                {'$ifNull': ['$$bill.total', 0]}, {'$ifNull': ['$$bill.paid_amount', 0]}
+            ]}]}]})
+        }}}
+    ]
+    return next(room_read_models_collection.aggregate(pipeline), None)
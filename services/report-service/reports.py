@@ -0,0 +1,526 @@
+# Report Service - Report Builders
+# Each builder computes one report payload (plain dicts, JSON-ready); endpoints serve them
+# through the report cache. export_rows() yields the same reports as flat rows for
+# /api/reports/export, reading bill-level reports straight from Mongo cursors.
+#
+# Usage (overview bill statistics at scale: the previous four count_documents + two
+# aggregations against the single get_bill_summary() aggregation, on synthetic bills in a
+# scratch database, <DB_NAME>_benchmark, which is dropped afterwards):
+#   python reports.py --benchmark --bills 1000000
+import argparse
+import datetime
+import heapq
+import random
+import time
+
+from config import Config
+from export import EXPORT_FORMATS
+from model import bills_collection, archive_collection, archive_years
+from utils import (
+    format_bill, bill_debt, get_bill_summary,
+    get_room_stats, get_contracts, get_contract_detail,
+    get_room_contracts, get_room_detail
+)
+from rollups import get_year_rollups
+from read_models import room_report_from_read_model
+
+
+def build_overview(year, token):
+# Overview: rooms, contracts, bill counts and the year's finances
+    
+    rooms = get_room_stats(token) or {'total': 0, 'available': 0, 'occupied': 0, 'occupancy_rate': 0}
+    active_contracts = get_contracts(token, 'active')
+    
+    bill_summary = get_bill_summary()
+    
+    # Bill and deposit revenue of the year from the materialized rollups
+    rollups = get_year_rollups(year)
+    revenue_bills = sum(m['revenue'] for m in rollups['bills'].values())
+    deposit_revenue = sum(m['revenue'] for m in rollups['deposits'].values())
+    
+    total_revenue = revenue_bills + deposit_revenue
+    total_debt = bill_summary['debt']
+    
+    return {
+        'year': int(year),
+        'rooms': rooms,
+        'contracts': {'active': active_contracts['total'] if active_contracts else 0},
+        'bills': bill_summary['stats'],
+        'finance': {
+            'total_revenue': total_revenue,
+            'total_debt': total_debt,
+            'collection_rate': round((total_revenue / (total_revenue + total_debt) * 100) if (total_revenue + total_debt) > 0 else 0, 2)
+        }
+    }
+
+
+def build_revenue(year):
+# Monthly bill + deposit revenue of a year
+    
+    rollups = get_year_rollups(year)
+    
+    monthly_data = []
+    for month in range(1, 13):
+        month_bills = rollups['bills'].get(month)
+        bills_rev = month_bills['revenue'] if month_bills else 0
+        deps_rev = rollups['deposits'].get(month, {}).get('revenue', 0)
+        
+        monthly_data.append({
+            'month': month,
+            'revenue': bills_rev + deps_rev,
+            'bills_revenue': bills_rev,
+            'deposits_revenue': deps_rev,
+            'bills_count': month_bills['count'] if month_bills else 0
+        })
+    
+    return {
+        'year': int(year),
+        'total_revenue': sum(m['revenue'] for m in monthly_data),
+        'monthly_data': monthly_data
+    }
+
+
+def build_debt(token):
+# Unpaid / partial bills with tenant info and days overdue
+    
+    debt_bills = list(bills_collection.find({
+        'status': {'$in': ['unpaid', 'partial']}
+    }).sort('due_date', 1))
+    
+    now = datetime.datetime.now()
+    overdue_count = 0
+    
+    for bill in debt_bills:
+        format_bill(bill)
+        
+        # Get user info from contract
+        if bill.get('contract_id'):
+            contract = get_contract_detail(bill['contract_id'], token)
+            if contract:
+                bill['user_name'] = contract.get('user_info', {}).get('name', '')
+                bill['user_phone'] = contract.get('user_info', {}).get('phone', '')
+        
+        # Calculate overdue days
+        if bill.get('due_date'):
+            try:
+                due = datetime.datetime.fromisoformat(bill['due_date'])
+                days = (now - due).days
+                bill['days_overdue'] = days if days > 0 else 0
+                if days > 0:
+                    overdue_count += 1
+            except:
+                bill['days_overdue'] = 0
+    
+    return {
+        'total_debt': sum(bill_debt(b) for b in debt_bills),
+        'total_bills': len(debt_bills),
+        'overdue_bills': overdue_count,
+        'details': debt_bills
+    }
+
+
+def _archived_room_totals(room_id):
+# Count and total of a room's archived bills (all paid), one indexed $group per archive year
+    
+    count, total = 0, 0
+    for year in archive_years():
+        pipeline = [
+            {'$match': {'room_id': room_id}},
+            {'$group': {'_id': None, 'count': {'$sum': 1}, 'total': {'$sum': {'$ifNull': ['$total', 0]}}}}
+        ]
+        for row in archive_collection(year).aggregate(pipeline):
+            count += row['count']
+            total += row['total']
+    return count, total
+
+
+def _add_archived(statistics, room_id):
+# Archived bills left the hot collection; count them in the room totals
+    
+    count, total = _archived_room_totals(room_id)
+    statistics['total_bills'] += count
+    statistics['total_revenue'] += total
+    statistics['archived_bills'] = count
+    return statistics
+
+
+def build_room_report(room_id, token):
+# One room: detail, contracts, bills and totals; one query on the room read model,
+# falling back to room-service / contract-service for rooms not synced yet.
+# The bill list holds the hot bills; the statistics include the archived ones.
+    
+    model = room_report_from_read_model(room_id)
+    if model is not None:
+        return {
+            'room': model['room'],
+            'contracts': model['contracts'],
+            'bills': [format_bill(b) for b in model['bills']],
+            'statistics': _add_archived(model['statistics'], room_id)
+        }
+    
+    room = get_room_detail(room_id, token)
+    contracts = get_room_contracts(room_id, token)
+    bills = list(bills_collection.find({'room_id': room_id}).sort('created_at', -1))
+    
+    for b in bills:
+        format_bill(b)
+    
+    return {
+        'room': room,
+        'contracts': contracts.get('contracts', []) if contracts else [],
+        'bills': bills,
+        'statistics': _add_archived({
+            'total_bills': len(bills),
+            'total_revenue': sum(b.get('total', 0) for b in bills if b['status'] == 'paid'),
+            'total_debt': sum(bill_debt(b) for b in bills if b['status'] in ['unpaid', 'partial'])
+        }, room_id)
+    }
+
+
+# ============== Debt Aging ==============
+
+OPEN_STATUSES = ['pending', 'unpaid', 'partial']
+# (bucket, lowest days overdue); bills not yet due (or without due date) are 'current'
+AGING_BUCKETS = [('1_30', 1), ('31_60', 31), ('61_90', 61), ('90_plus', 91)]
+AGING_BUCKET_NAMES = ['current'] + [name for name, _ in AGING_BUCKETS]
+
+
+# Open bills with outstanding amount, days overdue and aging bucket, all computed server-side;
+# due_date is normalized to its YYYY-MM-DD prefix (stored as a date or a full ISO timestamp)
+def _aging_stages(today):
+    return [
+        {'$match': {'status': {'$in': OPEN_STATUSES}}},
+        {'$project': {
+            'user_id': 1,
+            'room_id': 1,
+            'outstanding': {'$ifNull': ['$debt_amount', {'$max': [0, {'$subtract': [
+                {'$ifNull': ['$total', 0]}, {'$ifNull': ['$paid_amount', 0]}
+            ]}]}]},
+            'days_overdue': {'$dateDiff': {
+                'startDate': {'$dateFromString': {
+                    'dateString': {'$substrCP': [{'$ifNull': ['$due_date', '']}, 0, 10]},
+                    'format': '%Y-%m-%d', 'onError': None, 'onNull': None
+                }},
+                'endDate': datetime.datetime.combine(today, datetime.time()),
+                'unit': 'day'
+            }}
+        }},
+        {'$addFields': {'bucket': {'$switch': {
+            'branches': [
+                {'case': {'$gte': [{'$ifNull': ['$days_overdue', 0]}, low]}, 'then': name}
+                for name, low in reversed(AGING_BUCKETS)
+            ],
+            'default': 'current'
+        }}}}
+    ]
+
+
+# Outstanding amount per bucket as $group accumulators
+def _bucket_sums():
+    return {
+        name: {'$sum': {'$cond': [{'$eq': ['$bucket', name]}, '$outstanding', 0]}}
+        for name in AGING_BUCKET_NAMES
+    }
+
+
+def _breakdown(key, limit):
+    return [
+        {'$group': {'_id': f'${key}', 'total': {'$sum': '$outstanding'}, 'bills': {'$sum': 1}, **_bucket_sums()}},
+        {'$sort': {'total': -1, '_id': 1}},
+        {'$limit': limit}
+    ]
+
+
+def debt_aging_pipeline(today, limit):
+# Aging buckets plus the largest debtors per tenant and per room, as one $facet
+    
+    return _aging_stages(today) + [{'$facet': {
+        'buckets': [{'$group': {'_id': '$bucket', 'amount': {'$sum': '$outstanding'}, 'bills': {'$sum': 1}}}],
+        'by_tenant': _breakdown('user_id', limit),
+        'by_room': _breakdown('room_id', limit)
+    }}]
+
+
+def build_debt_aging(today, limit):
+# Debt aging (current, 1-30, 31-60, 61-90, 90+ days) in one aggregation, with the
+# largest debtors per tenant and per room
+    
+    result = next(bills_collection.aggregate(debt_aging_pipeline(today, limit), allowDiskUse=True))
+    
+    found = {b['_id']: b for b in result['buckets']}
+    buckets = [
+        {'bucket': name, 'bills': found.get(name, {}).get('bills', 0), 'amount': found.get(name, {}).get('amount', 0)}
+        for name in AGING_BUCKET_NAMES
+    ]
+    
+    def rows(groups, key):
+        return [{
+            key: g['_id'], 'total': g['total'], 'bills': g['bills'],
+            'buckets': {name: g[name] for name in AGING_BUCKET_NAMES}
+        } for g in groups]
+    
+    return {
+        'as_of': today.isoformat(),
+        'total_debt': sum(b['amount'] for b in buckets),
+        'total_bills': sum(b['bills'] for b in buckets),
+        'buckets': buckets,
+        'by_tenant': rows(result['by_tenant'], 'user_id'),
+        'by_room': rows(result['by_room'], 'room_id')
+    }
+
+
+# ============== Export Rows ==============
+
+EXPORT_TYPES = ('overview', 'revenue', 'debt', 'room', 'bills')
+
+BILL_COLUMNS = [
+    ('id', 'Mã hóa đơn'), ('room_id', 'Phòng'), ('contract_id', 'Hợp đồng'), ('month', 'Tháng'),
+    ('status', 'Trạng thái'), ('room_fee', 'Tiền phòng'), ('electric_fee', 'Tiền điện'),
+    ('water_fee', 'Tiền nước'), ('other_fee', 'Phí khác'), ('late_fee', 'Phí trễ hạn'),
+    ('total', 'Tổng tiền'), ('paid_amount', 'Đã trả'), ('debt', 'Còn nợ'),
+    ('due_date', 'Hạn thanh toán'), ('paid_at', 'Ngày thanh toán'), ('created_at', 'Ngày tạo')
+]
+BILL_PROJECTION = {
+    key: 1 for key, _ in BILL_COLUMNS if key not in ('id', 'debt')
+} | {'debt_amount': 1}
+
+EXPORT_COLUMNS = {
+    'overview': [('year', 'Năm'), ('section', 'Nhóm'), ('metric', 'Chỉ tiêu'), ('value', 'Giá trị')],
+    'revenue': [
+        ('year', 'Năm'), ('month', 'Tháng'), ('bills_revenue', 'Doanh thu hóa đơn'), ('deposits_revenue', 'Tiền cọc'),
+        ('revenue', 'Tổng doanh thu'), ('bills_count', 'Số hóa đơn')
+    ],
+    'debt': BILL_COLUMNS + [('days_overdue', 'Số ngày quá hạn'), ('user_name', 'Khách thuê'), ('user_phone', 'Số điện thoại')],
+    'room': BILL_COLUMNS,
+    'bills': BILL_COLUMNS
+}
+
+
+def _bill_row(bill):
+    format_bill(bill)
+    bill['debt'] = bill_debt(bill)
+    return bill
+
+
+# Python sort key matching MongoDB's (created_at, _id) order. created_at is a BSON date, or an
+# ISO string on bills not yet migrated; MongoDB sorts mixed types by BSON type
+# (null < string < date), so the key does the same instead of comparing a string with a date
+def _created_sort_key(bill):
+    created = bill.get('created_at')
+    if isinstance(created, datetime.datetime):
+        return 2, created, bill['_id']
+    if isinstance(created, str):
+        return 1, created, bill['_id']
+    return 0, '', bill['_id']
+
+
+# Hot bills and archived bills merged newest first; cursors are consumed lazily
+def _iter_bills_with_archive(query, years):
+    sort = [('created_at', -1), ('_id', -1)]
+    sources = [bills_collection] + [archive_collection(y) for y in years]
+    cursors = [c.find(query, BILL_PROJECTION).sort(sort).batch_size(1000) for c in sources]
+
+    last_id = None
+    for bill in heapq.merge(*cursors, key=_created_sort_key, reverse=True):
+        # A bill can briefly exist in both places while it is being moved; both copies
+        # share the same sort key, so they come out next to each other
+        if bill['_id'] == last_id:
+            continue
+        last_id = bill['_id']
+        yield _bill_row(bill)
+
+
+def _overview_rows(years, token):
+    for year in years:
+        report = build_overview(year, token)
+        for section in ('rooms', 'contracts', 'bills', 'finance'):
+            for metric, value in (report.get(section) or {}).items():
+                yield {'year': year, 'section': section, 'metric': metric, 'value': value}
+
+
+def _revenue_rows(years):
+    for year in years:
+        for month in build_revenue(year)['monthly_data']:
+            yield {'year': year, **month}
+
+
+def _year_bills(years, status):
+    archived = set(archive_years())
+    for year in years:
+        query = {'period_year': year}
+        if status:
+            query['status'] = status
+        archives = [year] if status in (None, 'paid') and year in archived else []
+        yield from _iter_bills_with_archive(query, archives)
+
+
+def _debt_rows(token):
+    now = datetime.datetime.now()
+    contracts = {}
+    cursor = bills_collection.find(
+        {'status': {'$in': ['unpaid', 'partial']}}, BILL_PROJECTION
+    ).sort('due_date', 1).batch_size(1000)
+    for bill in cursor:
+        _bill_row(bill)
+        # One contract lookup per contract, not per bill
+        contract_id = bill.get('contract_id')
+        if contract_id:
+            if contract_id not in contracts:
+                contract = get_contract_detail(contract_id, token) or {}
+                contracts[contract_id] = contract.get('user_info', {})
+            bill['user_name'] = contracts[contract_id].get('name', '')
+            bill['user_phone'] = contracts[contract_id].get('phone', '')
+        bill['days_overdue'] = 0
+        if bill.get('due_date'):
+            try:
+                bill['days_overdue'] = max(0, (now - datetime.datetime.fromisoformat(bill['due_date'])).days)
+            except ValueError:
+                pass
+        yield bill
+
+
+# Validate export parameters (query string or job body); returns (spec, error).
+# Years: ?year=2025 or ?year_from=2022&year_to=2025 (at most EXPORT_MAX_YEARS)
+def parse_export_request(data):
+    report_type = data.get('type', 'overview')
+    export_format = str(data.get('format', 'csv')).lower()
+    if report_type not in EXPORT_TYPES:
+        return None, f"type phải là một trong: {', '.join(EXPORT_TYPES)}"
+    if export_format not in EXPORT_FORMATS:
+        return None, 'format phải là csv hoặc xlsx!'
+    
+    try:
+        year = int(data.get('year', datetime.datetime.now().year))
+        year_from = int(data.get('year_from', year))
+        year_to = int(data.get('year_to', year))
+    except (TypeError, ValueError):
+        return None, 'year không hợp lệ!'
+    if year_from > year_to or year_to - year_from >= Config.EXPORT_MAX_YEARS:
+        return None, f'Khoảng năm không hợp lệ (tối đa {Config.EXPORT_MAX_YEARS} năm)!'
+    
+    if report_type == 'room' and not data.get('room_id'):
+        return None, 'Thiếu room_id!'
+    return {
+        'type': report_type,
+        'format': export_format,
+        'years': list(range(year_from, year_to + 1)),
+        'room_id': data.get('room_id'),
+        'status': data.get('status')
+    }, None
+
+
+def export_filename(spec):
+    years = spec['years']
+    if spec['type'] == 'room':
+        suffix = spec['room_id']
+    elif spec['type'] == 'debt':
+        suffix = datetime.datetime.now().strftime('%Y-%m-%d')
+    else:
+        suffix = str(years[0]) if len(years) == 1 else f"{years[0]}-{years[-1]}"
+    return f"{spec['type']}_{suffix}.{spec['format']}"
+
+
+# Rows of one export (spec from parse_export_request)
+def export_rows(spec, token):
+    report_type = spec['type']
+    if report_type == 'overview':
+        return _overview_rows(spec['years'], token)
+    if report_type == 'revenue':
+        return _revenue_rows(spec['years'])
+    if report_type == 'debt':
+        return _debt_rows(token)
+    if report_type == 'bills':
+        return _year_bills(spec['years'], spec.get('status'))
+
+    query = {'room_id': spec['room_id']}
+    if spec.get('status'):
+        query['status'] = spec['status']
+    years = archive_years() if spec.get('status') in (None, 'paid') else []
+    return _iter_bills_with_archive(query, years)
+
+
+# ============== Benchmark ==============
+
+BENCHMARK_STATUSES = ('paid', 'paid', 'paid', 'unpaid', 'partial', 'pending')
+
+
+# The overview bill statistics as computed before get_bill_summary()
+def _legacy_bill_summary(collection, rollups):
+    archived = list(rollups.aggregate([
+        {'$group': {'_id': None, 'total': {'$sum': '$total'}, 'bills_count': {'$sum': '$bills_count'}}}
+    ]))
+    archived = archived[0]['bills_count'] if archived else 0
+    debt = list(collection.aggregate([
+        {'$match': {'status': {'$in': ['unpaid', 'partial']}}},
+        {'$group': {'_id': None, 'total': {'$sum': {'$subtract': [
+            '$total', {'$ifNull': ['$paid_amount', 0]}
+        ]}}}}
+    ]))
+    return {
+        'stats': {
+            'total': collection.count_documents({}) + archived,
+            'paid': collection.count_documents({'status': 'paid'}) + archived,
+            'unpaid': collection.count_documents({'status': 'unpaid'}),
+            'partial': collection.count_documents({'status': 'partial'})
+        },
+        'debt': debt[0]['total'] if debt else 0
+    }
+
+
+def _timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def benchmark(count, repeat):
+    from pymongo import MongoClient, ASCENDING
+
+    client = MongoClient(Config.MONGO_URI)
+    scratch_db = f"{Config.DB_NAME}_benchmark"
+    client.drop_database(scratch_db)
+    scratch = client[scratch_db][Config.COLLECTION_NAME]
+    rollups = client[scratch_db][Config.ARCHIVE_ROLLUP_COLLECTION_NAME]
+    rng = random.Random(7)
+    try:
+        scratch.create_index([('status', ASCENDING)])
+        batch = []
+        for i in range(count):
+            status = rng.choice(BENCHMARK_STATUSES)
+            total = float(rng.randint(2000, 6000) * 1000)
+            batch.append({
+                '_id': f"BILL{i:08d}", 'room_id': f"R{i % 2000:04d}", 'status': status, 'total': total,
+                'paid_amount': total / 2 if status == 'partial' else 0
+            })
+            if len(batch) == 10000:
+                scratch.insert_many(batch)
+                batch = []
+        if batch:
+            scratch.insert_many(batch)
+        rollups.insert_many([
+            {'period_year': year, 'period_month': month, 'bills_count': 150, 'total': 450000000.0}
+            for year in range(2019, 2024) for month in range(1, 13)
+        ])
+
+        legacy_ms, legacy = _timed(lambda: _legacy_bill_summary(scratch, rollups), repeat)
+        summary_ms, summary = _timed(lambda: get_bill_summary(scratch, rollups), repeat)
+        same = legacy['stats'] == summary['stats'] and abs(legacy['debt'] - summary['debt']) < 0.01
+        print(f"[BENCHMARK] overview bill statistics, {count} bills")
+        print(f"  4 count_documents + 2 aggregations {legacy_ms:10.2f} ms")
+        print(f"  get_bill_summary (1 aggregation)   {summary_ms:10.2f} ms")
+        print(f"  results {'match' if same else 'DIFFER'}: {summary['stats']}, debt {summary['debt']:.0f}")
+        return same
+    finally:
+        client.drop_database(scratch_db)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report builders benchmark')
+    parser.add_argument('--benchmark', action='store_true', help='Time the overview bill statistics')
+    parser.add_argument('--bills', type=int, default=1000000, help='Synthetic bills for --benchmark')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per timed approach')
+    args = parser.parse_args()
+    if args.benchmark:
+        raise SystemExit(0 if benchmark(args.bills, args.repeat) else 1)
+    parser.print_help()
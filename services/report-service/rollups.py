@@ -0,0 +1,150 @@
+# Report Service - Revenue Rollups
+# revenue_rollups holds one document per (year, month, source), source = 'bills' | 'deposits'.
+# bill-service and payment-service post revenue events (bill paid / reverted, deposit
+# completed) which are applied with $inc, de-duplicated by event_id in revenue_events.
+# A periodic reconciliation recomputes whole years from the source data, so a lost event
+# only skews numbers until the next run.
+import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from model import revenue_rollups_collection, revenue_events_collection, bump_data_version
+from utils import get_revenue_by_month, get_payment_summary
+
+
+ROLLUP_SOURCES = ('bills', 'deposits')
+# Data version bumped when a source's rollups change
+VERSION_SOURCES = {'bills': 'bills', 'deposits': 'payments'}
+
+
+def rollup_id(year, month, source):
+    return f"{int(year)}-{int(month):02d}:{source}"
+
+
+# ============== Events ==============
+
+# Validate an incoming event; returns (event, error)
+def parse_revenue_event(data):
+    if data.get('source') not in ROLLUP_SOURCES:
+        return None, 'source không hợp lệ!'
+    if not data.get('event_id'):
+        return None, 'Thiếu event_id!'
+    try:
+        event = {
+            '_id': str(data['event_id']),
+            'source': data['source'],
+            'year': int(data['year']),
+            'month': int(data['month']),
+            'amount': float(data.get('amount', 0)),
+            'count': int(data.get('count', 1))
+        }
+    except (KeyError, TypeError, ValueError):
+        return None, 'Dữ liệu sự kiện không hợp lệ!'
+    if not 1 <= event['month'] <= 12:
+        return None, 'month không hợp lệ!'
+    return event, None
+
+
+# Apply one event to its rollup; returns False when the event was already applied.
+# If the $inc fails the event record is removed again, so the sender's retry applies it
+def apply_revenue_event(event):
+    try:
+        revenue_events_collection.insert_one({**event, 'created_at': datetime.datetime.utcnow()})
+    except DuplicateKeyError:
+        return False
+    try:
+        revenue_rollups_collection.update_one(
+            {'_id': rollup_id(event['year'], event['month'], event['source'])},
+            {
+                '$inc': {'revenue': event['amount'], 'count': event['count']},
+                '$set': {'updated_at': datetime.datetime.utcnow()},
+                '$setOnInsert': {'year': event['year'], 'month': event['month'], 'source': event['source']}
+            },
+            upsert=True
+        )
+    except Exception:
+        revenue_events_collection.delete_one({'_id': event['_id']})
+        raise
+    bump_data_version(VERSION_SOURCES[event['source']])
+    return True
+
+
+# ============== Reconciliation ==============
+
+# Overwrite one source's 12 monthly rollups of a year with {month: (revenue, count)};
+# only months whose numbers changed are written
+def _write_year(year, source, months):
+    now = datetime.datetime.utcnow()
+    current = {
+        d['month']: (d.get('revenue'), d.get('count'))
+        for d in revenue_rollups_collection.find({'year': year, 'source': source})
+    }
+    operations = []
+    for month in range(1, 13):
+        revenue, count = months.get(month, (0, 0))
+        if current.get(month) == (revenue, count):
+            continue
+        operations.append(UpdateOne(
+            {'_id': rollup_id(year, month, source)},
+            {'$set': {
+                'year': year, 'month': month, 'source': source,
+                'revenue': revenue, 'count': count,
+                'updated_at': now, 'reconciled_at': now
+            }},
+            upsert=True
+        ))
+    if operations:
+        revenue_rollups_collection.bulk_write(operations, ordered=False)
+        bump_data_version(VERSION_SOURCES[source])
+
+
+def reconcile_bills(year):
+    months = {m['_id']: (m['revenue'], m['bills_count']) for m in get_revenue_by_month(year)}
+    _write_year(int(year), 'bills', months)
+
+
+# Room deposits, summed by payment-service
+def reconcile_deposits(year):
+    summary = get_payment_summary(year, payment_type='room_reservation_deposit')
+    if summary is None:
+        return False
+    months = {g['month']: (g['total'], g['count']) for g in summary.get('groups', [])}
+    _write_year(int(year), 'deposits', months)
+    return True
+
+
+def reconcile_year(year):
+    reconcile_bills(year)
+    reconcile_deposits(year)
+
+
+# Scheduled job: reconcile the current and previous year
+def reconcile_recent_years():
+    year = datetime.datetime.utcnow().year
+    for y in (year - 1, year):
+        try:
+            reconcile_year(y)
+        except Exception as e:
+            print(f"[ROLLUPS] Reconcile {y} failed: {e}")
+
+
+# ============== Reads ==============
+
+# Monthly rollups of a year: {source: {month: {'revenue', 'count'}}}; built on first read
+def get_year_rollups(year):
+    year = int(year)
+    docs = list(revenue_rollups_collection.find({'year': year}))
+    missing = set(ROLLUP_SOURCES) - {d['source'] for d in docs}
+    if missing:
+        if 'bills' in missing:
+            reconcile_bills(year)
+        if 'deposits' in missing:
+            reconcile_deposits(year)
+        docs = list(revenue_rollups_collection.find({'year': year}))
+
+    result = {source: {} for source in ROLLUP_SOURCES}
+    for d in docs:
+        result[d['source']][d['month']] = {'revenue': d.get('revenue', 0), 'count': d.get('count', 0)}
+    return result
+
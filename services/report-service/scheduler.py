@@ -0,0 +1,84 @@
+# Report Service - Background Scheduler
+import datetime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from config import Config
+from rollups import reconcile_recent_years
+from snapshots import take_snapshot
+from read_models import sync_room_read_models
+from jobs import maintain_jobs
+
+
+def start_scheduler():
+# Start the background scheduler
+    
+    scheduler = BackgroundScheduler()
+    
+    # Recompute revenue rollups of the current and previous year
+    scheduler.add_job(
+        reconcile_recent_years,
+        'interval',
+        seconds=Config.REVENUE_RECONCILE_INTERVAL,
+        id='revenue_reconcile',
+        name='Reconcile revenue rollups',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Record the daily occupancy snapshot (hourly, so a failed run is retried the same day)
+    scheduler.add_job(
+        take_snapshot,
+        'interval',
+        hours=1,
+        id='occupancy_snapshot',
+        name='Record occupancy snapshot',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Refresh the per-room read model (first run at startup)
+    scheduler.add_job(
+        sync_room_read_models,
+        'interval',
+        seconds=Config.ROOM_READ_MODEL_SYNC_INTERVAL,
+        next_run_time=datetime.datetime.now(),
+        id='room_read_models',
+        name='Sync room read models',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Report job heartbeats; fail jobs whose instance stopped
+    scheduler.add_job(
+        maintain_jobs,
+        'interval',
+        seconds=Config.REPORT_JOB_HEARTBEAT_INTERVAL,
+        id='report_job_heartbeat',
+        name='Report job heartbeat',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Reload the columnar analytics snapshot
+    if Config.ANALYTICS_ENABLED:
+        from analytics import refresh_snapshot
+        scheduler.add_job(
+            refresh_snapshot,
+            'interval',
+            seconds=Config.ANALYTICS_REFRESH_INTERVAL,
+            id='analytics_snapshot',
+            name='Reload analytics snapshot',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+    
+    scheduler.start()
+    print("[SCHEDULER] Started - revenue rollups reconciled every "
+          f"{Config.REVENUE_RECONCILE_INTERVAL}s, occupancy snapshot checked hourly")
+    return scheduler
@@ -0,0 +1,144 @@
+# Report Service - Occupancy Snapshots
+# One document per day in the occupancy_snapshots time-series collection: room counts per
+# status (room-service), active contracts (contract-service) and year-to-date revenue (rollups).
+# The job runs hourly and only records a day once (date-keyed lock in occupancy_snapshot_locks),
+# so a day missed while a service was down is picked up on the next run.
+# /api/reports/occupancy-trend reads ranges of it, averaged per day / week / month so long
+# ranges stay within OCCUPANCY_TREND_MAX_POINTS points.
+import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from config import Config
+from model import occupancy_snapshots_collection, occupancy_snapshot_locks_collection
+from rollups import get_year_rollups
+from utils import get_room_stats_internal, count_active_contracts
+
+
+TREND_INTERVALS = ('day', 'week', 'month')
+ROOM_STATUSES = ('available', 'occupied', 'reserved', 'maintenance')
+LOCK_SECONDS = 600
+
+
+def _day_start(day):
+    return datetime.datetime.combine(day, datetime.time())
+
+
+def _revenue_to_date(today):
+    rollups = get_year_rollups(today.year)
+    return sum(
+        m['revenue'] for source in rollups.values()
+        for month, m in source.items() if month <= today.month
+    )
+
+
+# Take the day's lock (_id = date); a lock whose run died is taken over after LOCK_SECONDS.
+# True when this run may record the day
+def _acquire_day(date, now):
+    locked_until = now + datetime.timedelta(seconds=LOCK_SECONDS)
+    try:
+        occupancy_snapshot_locks_collection.insert_one(
+            {'_id': date, 'status': 'pending', 'locked_until': locked_until, 'created_at': now}
+        )
+        return True
+    except DuplicateKeyError:
+        pass
+    taken = occupancy_snapshot_locks_collection.update_one(
+        {'_id': date, 'status': 'pending', 'locked_until': {'$lt': now}},
+        {'$set': {'locked_until': locked_until}}
+    )
+    return taken.modified_count == 1
+
+
+def _release_day(date):
+    occupancy_snapshot_locks_collection.delete_one({'_id': date, 'status': 'pending'})
+
+
+def _finish_day(date):
+    occupancy_snapshot_locks_collection.update_one(
+        {'_id': date}, {'$set': {'status': 'done', 'locked_until': None}}
+    )
+
+
+# Record today's snapshot unless it exists; returns the snapshot, or None when skipped.
+# The time-series collection has no unique index, so the day's lock document decides
+# which of several concurrent runs (instances, manual POST) records it.
+def take_snapshot(today=None):
+    today = today or datetime.datetime.utcnow().date()
+    date = _day_start(today)
+    if not _acquire_day(date, datetime.datetime.utcnow()):
+        return None
+
+    try:
+        # Days recorded before the lock collection existed
+        if occupancy_snapshots_collection.find_one(
+            {'date': {'$gte': date, '$lt': date + datetime.timedelta(days=1)}}, {'_id': 1}
+        ):
+            _finish_day(date)
+            return None
+
+        rooms = get_room_stats_internal()
+        active_contracts = count_active_contracts()
+        if rooms is None or active_contracts is None:
+            print(f"[SNAPSHOT] {today}: room or contract service unavailable, retrying next run")
+            _release_day(date)
+            return None
+
+        snapshot = {
+            'date': date,
+            'rooms': {status: rooms.get(status, 0) for status in ROOM_STATUSES},
+            'total_rooms': rooms.get('total', 0),
+            'occupancy_rate': rooms.get('occupancy_rate', 0),
+            'active_contracts': active_contracts,
+            'revenue_to_date': _revenue_to_date(today),
+            'taken_at': datetime.datetime.utcnow()
+        }
+        occupancy_snapshots_collection.insert_one(snapshot)
+    except Exception:
+        # Let the next run retry the day
+        _release_day(date)
+        raise
+
+    _finish_day(date)
+    print(f"[SNAPSHOT] {today}: occupancy {snapshot['occupancy_rate']}%")
+    return snapshot
+
+
+# Smallest interval that keeps the range within OCCUPANCY_TREND_MAX_POINTS points
+def pick_interval(start, end):
+    days = (end - start).days + 1
+    if days <= Config.OCCUPANCY_TREND_MAX_POINTS:
+        return 'day'
+    if days / 7 <= Config.OCCUPANCY_TREND_MAX_POINTS:
+        return 'week'
+    return 'month'
+
+
+# Snapshots between start and end (dates, inclusive), averaged per interval
+def get_occupancy_trend(start, end, interval):
+    pipeline = [
+        {'$match': {'date': {'$gte': _day_start(start), '$lt': _day_start(end + datetime.timedelta(days=1))}}},
+        {'$sort': {'date': 1}},
+        {'$group': {
+            '_id': {'$dateTrunc': {'date': '$date', 'unit': interval, 'startOfWeek': 'monday'}},
+            'occupancy_rate': {'$avg': '$occupancy_rate'},
+            'active_contracts': {'$avg': '$active_contracts'},
+            'total_rooms': {'$last': '$total_rooms'},
+            'revenue_to_date': {'$last': '$revenue_to_date'},
+            'days': {'$sum': 1},
+            **{status: {'$avg': f'$rooms.{status}'} for status in ROOM_STATUSES}
+        }},
+        {'$sort': {'_id': 1}}
+    ]
+    points = []
+    for row in occupancy_snapshots_collection.aggregate(pipeline):
+        points.append({
+            'period': row['_id'].date().isoformat(),
+            'days': row['days'],
+            'occupancy_rate': round(row['occupancy_rate'] or 0, 2),
+            'active_contracts': round(row['active_contracts'] or 0, 1),
+            'total_rooms': row['total_rooms'],
+            'rooms': {status: round(row[status] or 0, 1) for status in ROOM_STATUSES},
+            'revenue_to_date': row['revenue_to_date']
+        })
+    return points
@@ -2,8 +2,8 @@
 import datetime
 import os
 import requests
-from model import bills_collection
-from config import CONSUL_HOST, CONSUL_PORT
+from model import bills_collection, archive_rollups_collection
+from config import CONSUL_HOST, CONSUL_PORT, INTERNAL_API_KEY
 
 
 # ============== Service Discovery ==============
@@ -96,32 +96,163 @@ def get_room_detail(room_id, token):
     return None
 
 
-def get_payments(token, status=None):
-    """Get payments from payment-service."""
+def get_rooms_version():
+    """Get room-service's data version counter (None when unavailable)."""
+    try:
+        url = get_service_url('room-service')
+        response = requests.get(
+            f"{url}/internal/rooms/version",
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=3
+        )
+        if response.ok:
+            return response.json().get('version')
+    except Exception as e:
+        print(f"Error getting rooms version: {e}")
+    return None
+
+
+def get_contracts_version():
+    """Get contract-service's data version counter (None when unavailable)."""
+    try:
+        url = get_service_url('contract-service')
+        response = requests.get(
+            f"{url}/internal/contracts/version",
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=3
+        )
+        if response.ok:
+            return response.json().get('version')
+    except Exception as e:
+        print(f"Error getting contracts version: {e}")
+    return None
+
+
+def get_room_stats_internal():
+    """Get room counts per status from room-service without a user token."""
+    try:
+        url = get_service_url('room-service')
+        response = requests.get(
+            f"{url}/internal/rooms/stats",
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=10
+        )
+        if response.ok:
+            return response.json()
+    except Exception as e:
+        print(f"Error getting internal room stats: {e}")
+    return None
+
+
+def get_rooms_internal():
+    """Get all rooms (without images) and the rooms version from room-service."""
+    try:
+        url = get_service_url('room-service')
+        response = requests.get(
+            f"{url}/internal/rooms",
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=30
+        )
+        if response.ok:
+            return response.json()
+    except Exception as e:
+        print(f"Error getting internal rooms: {e}")
+    return None
+
+
+def get_contracts_internal(status=None):
+    """Get contracts from contract-service without a user token (None when unavailable)."""
+    try:
+        url = get_service_url('contract-service')
+        response = requests.get(
+            f"{url}/internal/contracts",
+            params={'status': status} if status else {},
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=30
+        )
+        if response.ok:
+            return response.json().get('contracts', [])
+    except Exception as e:
+        print(f"Error getting internal contracts: {e}")
+    return None
+
+
+def count_active_contracts():
+    """Get the number of active contracts from contract-service (None when unavailable)."""
+    try:
+        url = get_service_url('contract-service')
+        response = requests.get(
+            f"{url}/internal/contracts",
+            params={'status': 'active', 'count_only': 'true'},
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=10
+        )
+        if response.ok:
+            return response.json().get('total')
+    except Exception as e:
+        print(f"Error counting active contracts: {e}")
+    return None
+
+
+def get_payment_summary(year, payment_type=None, group_by='month'):
+    """Get server-side payment sums from payment-service (completed payments)."""
     try:
         url = get_service_url('payment-service')
-        headers = {'Authorization': token} if token else {}
-        endpoint = f"{url}/api/payments"
-        if status:
-            endpoint += f"?status={status}"
-        response = requests.get(endpoint, headers=headers, timeout=10)
+        params = {'year': year, 'group_by': group_by}
+        if payment_type:
+            params['payment_type'] = payment_type
+        response = requests.get(
+            f"{url}/internal/payments/summary",
+            params=params,
+            headers={'X-Internal-Api-Key': INTERNAL_API_KEY},
+            timeout=10
+        )
         if response.ok:
             return response.json()
     except Exception as e:
-        print(f"Error getting payments: {e}")
+        print(f"Error getting payment summary: {e}")
     return None
 
 def get_timestamp():
     return datetime.datetime.utcnow().isoformat()
 
 
+def parse_period(month, year=None):
+# Canonical (period_year, period_month) from "YYYY-MM" or legacy numeric month + year
+# (same rules as bill-service's migrate_bills.py); (None, None) when unparsable
+    
+    try:
+        if isinstance(month, str) and '-' in month:
+            y, m = month.split('-')[:2]
+            y, m = int(y), int(m)
+        elif month not in (None, '') and year not in (None, ''):
+            y, m = int(year), int(month)
+        else:
+            return None, None
+    except (TypeError, ValueError):
+        return None, None
+    if not 1 <= m <= 12:
+        return None, None
+    return y, m
+
+
 def format_bill(bill):
 # Format bill for response
     
     bill['id'] = bill['_id']
+    if isinstance(bill.get('created_at'), datetime.datetime):
+        bill['created_at'] = bill['created_at'].isoformat()
     return bill
 
 
+def bill_debt(bill):
+# Outstanding amount of a bill (explicit debt_amount, else total - paid_amount)
+    
+    if bill.get('debt_amount') is not None:
+        return bill['debt_amount']
+    return max(0, float(bill.get('total') or 0) - float(bill.get('paid_amount') or 0))
+
+
 def calculate_bill_amounts(data):
 # Calculate bill amounts
     
@@ -144,114 +275,63 @@ def calculate_bill_amounts(data):
     }
 
 
-def get_bill_stats():
-# Get bill statistics
+def bill_summary_pipeline(rollups_name):
+# Bill counts per status, revenue and outstanding debt in one aggregation (one round trip):
+# a $group by status over the hot bills, with the archive rollups (all paid) unioned in
     
-    return {
-        'total': bills_collection.count_documents({}),
-        'paid': bills_collection.count_documents({'status': 'paid'}),
-        'unpaid': bills_collection.count_documents({'status': 'unpaid'}),
-        'partial': bills_collection.count_documents({'status': 'partial'})
-    }
+    return [
+        {'$group': {
+            '_id': '$status',
+            'count': {'$sum': 1},
+            'total': {'$sum': '$total'},
+            'outstanding': {'$sum': {'$subtract': ['$total', {'$ifNull': ['$paid_amount', 0]}]}}
+        }},
+        {'$unionWith': {'coll': rollups_name, 'pipeline': [
+            {'$group': {'_id': 'archived', 'count': {'$sum': '$bills_count'}, 'total': {'$sum': '$total'}}}
+        ]}}
+    ]
 
 
-def get_total_revenue(year=None):
-# Calculate total revenue from paid bills, optionally filtered by year
+def get_bill_summary(collection=bills_collection, rollups=archive_rollups_collection):
+# Overview bill statistics, revenue and debt from bill_summary_pipeline()
     
-    match_query = {'status': 'paid'}
+    groups = {g['_id']: g for g in collection.aggregate(bill_summary_pipeline(rollups.name))}
     
-    # Filter by year if provided
-    if year:
-        year_str = str(year)
-        match_query['$or'] = [
-            {'month': {'$regex': f'^{year_str}'}},  # String format "2025-12"
-            {'year': int(year)}  # Legacy numeric format
-        ]
+    def count(status):
+        return groups.get(status, {}).get('count', 0)
     
-    # Try both 'total' and 'total_amount' fields for compatibility
-    pipeline = [
-        {'$match': match_query},
-        {'$group': {'_id': None, 'total': {'$sum': {'$ifNull': ['$total', {'$ifNull': ['$total_amount', 0]}]}}}}
-    ]
-    result = list(bills_collection.aggregate(pipeline))
-    return result[0]['total'] if result else 0
-
-
-def get_total_debt():
-# Calculate total debt from unpaid/partial bills
-    
-    # Calculate debt as total - paid_amount, or use debt_amount if exists
-    pipeline = [
-        {'$match': {'status': {'$in': ['unpaid', 'partial']}}},
-        {'$project': {
-            'debt': {'$subtract': [
-                {'$ifNull': ['$total', {'$ifNull': ['$total_amount', 0]}]},
-                {'$ifNull': ['$paid_amount', 0]}
-            ]}
-        }},
-        {'$group': {'_id': None, 'total': {'$sum': '$debt'}}}
-    ]
-    result = list(bills_collection.aggregate(pipeline))
-    return result[0]['total'] if result else 0
+    archived = count('archived')
+    return {
+        'stats': {
+            'total': sum(g['count'] for g in groups.values()),
+            'paid': count('paid') + archived,
+            'unpaid': count('unpaid'),
+            'partial': count('partial')
+        },
+        'revenue': groups.get('paid', {}).get('total', 0) + groups.get('archived', {}).get('total', 0),
+        'debt': sum(groups.get(s, {}).get('outstanding', 0) for s in ('unpaid', 'partial'))
+    }
 
 
-def get_revenue_by_month(year):
-# Get revenue aggregated by month - handles string month format like '2025-12'
-    
-    year_str = str(year)
+def revenue_by_month_pipeline(year):
+# Paid bills of a year grouped by period month
     
-    # Match bills where month starts with the year (e.g., "2025-12" starts with "2025")
-    pipeline = [
-        {'$match': {
-            'status': 'paid',
-            '$or': [
-                {'month': {'$regex': f'^{year_str}'}},  # String format "2025-12"
-                {'year': int(year)}  # Legacy numeric format
-            ]
-        }},
-        {'$project': {
-            'total': {'$ifNull': ['$total', {'$ifNull': ['$total_amount', 0]}]},
-            'month_num': {
-                '$cond': {
-                    'if': {'$eq': [{'$type': '$month'}, 'string']},
-                    'then': {'$toInt': {'$substr': ['$month', 5, 2]}},  # Extract month from "2025-12"
-                    'else': '$month'
-                }
-            }
-        }},
+    return [
+        {'$match': {'status': 'paid', 'period_year': int(year)}},
         {'$group': {
-            '_id': '$month_num',
+            '_id': '$period_month',
             'revenue': {'$sum': '$total'},
             'bills_count': {'$sum': 1}
-        }},
-        {'$sort': {'_id': 1}}
+        }}
     ]
-    return list(bills_collection.aggregate(pipeline))
 
 
-def get_deposits_by_month(payments, year):
-# Calculate deposits by month from completed payments
+def get_revenue_by_month(year):
+# Get revenue aggregated by month from normalized period fields, plus archived rollups
     
-    deposits_by_month = {}
-    for payment in payments:
-        try:
-            # Only count completed room reservation deposits
-            if payment.get('status') != 'completed':
-                continue
-            if payment.get('payment_type') != 'room_reservation_deposit':
-                continue
-            
-            # Parse created_at timestamp
-            created_str = payment.get('created_at', payment.get('updated_at', ''))
-            if not created_str:
-                continue
-            
-            created = datetime.datetime.fromisoformat(created_str.replace('Z', '+00:00'))
-            if created.year == int(year):
-                month = created.month
-                amount = float(payment.get('amount', payment.get('amount_vnd', 0)))
-                deposits_by_month[month] = deposits_by_month.get(month, 0) + amount
-        except Exception as e:
-            print(f"Error processing payment for deposit: {e}")
-            pass
-    return deposits_by_month
+    months = {m['_id']: m for m in bills_collection.aggregate(revenue_by_month_pipeline(year))}
+    for rollup in archive_rollups_collection.find({'period_year': int(year)}):
+        month = months.setdefault(rollup['period_month'], {'_id': rollup['period_month'], 'revenue': 0, 'bills_count': 0})
+        month['revenue'] += rollup.get('total', 0)
+        month['bills_count'] += rollup.get('bills_count', 0)
+    return [months[m] for m in sorted(months)]
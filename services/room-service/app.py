@@ -6,17 +6,21 @@ import atexit
 import base64
 
 from config import Config
-from model import rooms_collection
+from model import rooms_collection, bump_rooms_version, get_rooms_version
 from decorators import token_required, admin_required, internal_api_required
 from utils import (
     generate_room_id,
     get_timestamp,
     format_room_response,
     check_duplicate_room_name,
+    normalize_tier_override,
     cleanup_expired_reservations
 )
 from service_registry import register_service, deregister_service
 
+# Room fields that affect bill amounts
+PRICE_FIELDS = ['electricity_price', 'electric_price', 'water_price', 'electric_tiers', 'water_tiers']
+
 # APScheduler for background jobs
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -38,6 +42,7 @@ def scheduled_cleanup_job():
     try:
         cleaned = cleanup_expired_reservations()
         if cleaned:
+            bump_rooms_version()
             print(f"[Scheduler] Auto-cleaned {len(cleaned)} expired reservations: {cleaned}")
     except Exception as e:
         print(f"[Scheduler] Error during cleanup: {e}")
@@ -65,6 +70,19 @@ def start_scheduler():
 atexit.register(lambda: scheduler.shutdown(wait=False) if scheduler.running else None)
 
 
+# ============== Data Version ==============
+
+@app.after_request
+# Every successful write changes room data
+def bump_version_after_write(response):
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        try:
+            bump_rooms_version()
+        except Exception as e:
+            print(f"[DB] Failed to bump rooms version: {e}")
+    return response
+
+
 # ============== Health Check ==============
 
 @app.route('/health', methods=['GET'])
@@ -242,7 +260,7 @@ def update_room(current_user, room_id):
     allowed_fields = [
         'name', 'price', 'status', 'room_type', 'description',
         'deposit', 'electricity_price', 'electric_price', 'water_price', 'current_contract_id',
-        'area', 'area_m2', 'floor', 'amenities', 'images'
+        'area', 'area_m2', 'floor', 'amenities', 'images', 'electric_tiers', 'water_tiers'
     ]
     
     update_fields = {}
@@ -259,6 +277,11 @@ def update_room(current_user, room_id):
                     value = [a.strip() for a in value.split(',') if a.strip()]
                 if not isinstance(value, list):
                     value = []
+            elif field in ['electric_tiers', 'water_tiers']:
+                try:
+                    value = normalize_tier_override(value)
+                except ValueError as e:
+                    return jsonify({'message': str(e)}), 400
             elif field == 'images':
                 if not isinstance(value, list):
                     value = []
@@ -284,6 +307,10 @@ def update_room(current_user, room_id):
     
     update_fields['updated_at'] = get_timestamp()
     
+    # Separate marker for the price-change feed consumed by bill-service
+    if any(f in update_fields and update_fields[f] != room.get(f) for f in PRICE_FIELDS):
+        update_fields['prices_updated_at'] = update_fields['updated_at']
+    
     try:
         rooms_collection.update_one({'_id': room_id}, {'$set': update_fields})
         updated_room = rooms_collection.find_one({'_id': room_id})
@@ -316,29 +343,95 @@ def delete_room(current_user, room_id):
         return jsonify({'message': f'Lỗi xóa phòng: {str(e)}'}), 500
 
 
+# Room counts per status and occupancy rate
+def compute_room_stats():
+    counts = {r['_id']: r['count'] for r in rooms_collection.aggregate([
+        {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+    ])}
+    total = sum(counts.values())
+    occupied = counts.get(Config.STATUS_OCCUPIED, 0)
+    
+    return {
+        'total': total,
+        'available': counts.get(Config.STATUS_AVAILABLE, 0),
+        'occupied': occupied,
+        'maintenance': counts.get(Config.STATUS_MAINTENANCE, 0),
+        'reserved': counts.get(Config.STATUS_RESERVED, 0),
+        'occupancy_rate': round((occupied / total * 100) if total > 0 else 0, 2)
+    }
+
+
 @app.route('/api/rooms/stats', methods=['GET'])
 @token_required
 # Get room statistics
 def get_room_stats(current_user):
-    total = rooms_collection.count_documents({})
-    available = rooms_collection.count_documents({'status': Config.STATUS_AVAILABLE})
-    occupied = rooms_collection.count_documents({'status': Config.STATUS_OCCUPIED})
-    maintenance = rooms_collection.count_documents({'status': Config.STATUS_MAINTENANCE})
-    reserved = rooms_collection.count_documents({'status': Config.STATUS_RESERVED})
+    return jsonify(compute_room_stats()), 200
+
+
+# ============== Internal APIs ==============
+
+@app.route('/internal/rooms/price-changes', methods=['GET'])
+@internal_api_required
+# Feed of rooms whose prices changed, ordered by (prices_updated_at, _id).
+# Pass back the last item's prices_updated_at/_id as since/after_id to continue.
+def internal_room_price_changes():
+    since = request.args.get('since', '')
+    after_id = request.args.get('after_id', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 500)), 2000))
+    except ValueError:
+        return jsonify({'message': 'limit không hợp lệ!'}), 400
     
-    occupancy_rate = round((occupied / total * 100) if total > 0 else 0, 2)
+    query = {
+        'prices_updated_at': {'$gte': since},
+        '$or': [{'prices_updated_at': {'$gt': since}}, {'_id': {'$gt': after_id}}]
+    }
+    projection = {f: 1 for f in PRICE_FIELDS}
+    projection['prices_updated_at'] = 1
+    
+    rooms = list(
+        rooms_collection.find(query, projection)
+        .sort([('prices_updated_at', 1), ('_id', 1)])
+        .limit(limit)
+    )
     
     return jsonify({
-        'total': total,
-        'available': available,
-        'occupied': occupied,
-        'maintenance': maintenance,
-        'reserved': reserved,
-        'occupancy_rate': occupancy_rate
+        'rooms': [{
+            '_id': r['_id'],
+            'electricity_price': r.get('electricity_price') or r.get('electric_price', Config.DEFAULT_ELECTRIC_PRICE),
+            'water_price': r.get('water_price', Config.DEFAULT_WATER_PRICE),
+            'electric_tiers': r.get('electric_tiers'),
+            'water_tiers': r.get('water_tiers'),
+            'prices_updated_at': r['prices_updated_at']
+        } for r in rooms],
+        'has_more': len(rooms) == limit
     }), 200
 
 
-# ============== Internal APIs ==============
+@app.route('/internal/rooms', methods=['GET'])
+@internal_api_required
+# All rooms without images (report-service read model sync)
+def internal_list_rooms():
+    rooms = list(rooms_collection.find({}, {'images': 0}).sort('_id', 1))
+    return jsonify({
+        'rooms': [format_room_response(r) for r in rooms],
+        'version': get_rooms_version()
+    }), 200
+
+
+@app.route('/internal/rooms/stats', methods=['GET'])
+@internal_api_required
+# Room statistics for other services (report-service occupancy snapshots)
+def internal_room_stats():
+    return jsonify(compute_room_stats()), 200
+
+
+@app.route('/internal/rooms/version', methods=['GET'])
+@internal_api_required
+# Counter that changes whenever room data changes (used for report cache invalidation)
+def internal_rooms_version():
+    return jsonify({'version': get_rooms_version()}), 200
+
 
 @app.route('/internal/rooms/<room_id>/status', methods=['PUT'])
 @internal_api_required
@@ -8,6 +8,7 @@ class Config:
     MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/rooms_db')
     DB_NAME = 'rooms_db'
     COLLECTION_NAME = 'rooms'
+    VERSION_COLLECTION_NAME = 'data_versions'
     
     # Service Info
     SERVICE_NAME = 'room-service'
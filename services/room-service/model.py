@@ -28,11 +28,16 @@ class Database:
     @property
     def rooms(self):
         return self._db[Config.COLLECTION_NAME]
+    
+    @property
+    def data_versions(self):
+        return self._db[Config.VERSION_COLLECTION_NAME]
 
 
 # Initialize database
 _database = Database()
 rooms_collection = _database.rooms
+data_versions_collection = _database.data_versions
 
 
 # Initialize database indexes
@@ -41,6 +46,7 @@ def init_indexes():
         rooms_collection.create_index([('name', ASCENDING)], unique=True)
         rooms_collection.create_index([('status', ASCENDING)])
         rooms_collection.create_index([('user_id', ASCENDING)], sparse=True)
+        rooms_collection.create_index([('prices_updated_at', ASCENDING), ('_id', ASCENDING)], sparse=True)
         print("[DB] ✓ Room indexes created")
     except Exception as e:
         print(f"[DB] Index creation: {e}")
@@ -49,6 +55,16 @@ def init_indexes():
 init_indexes()
 
 
+# Room data version: bumped on every room write so report caches can tell when room data changed
+def bump_rooms_version():
+    data_versions_collection.update_one({'_id': 'rooms'}, {'$inc': {'version': 1}}, upsert=True)
+
+
+def get_rooms_version():
+    doc = data_versions_collection.find_one({'_id': 'rooms'})
+    return doc.get('version', 0) if doc else 0
+
+
 # Utility functions
 def get_rooms_collection():
     return rooms_collection
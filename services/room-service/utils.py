@@ -49,6 +49,8 @@ def format_room_response(room, include_sensitive=True):
         'deposit': room.get('deposit', 0),
         'electricity_price': room.get('electricity_price') or room.get('electric_price', Config.DEFAULT_ELECTRIC_PRICE),
         'water_price': room.get('water_price', Config.DEFAULT_WATER_PRICE),
+        'electric_tiers': room.get('electric_tiers'),
+        'water_tiers': room.get('water_tiers'),
         'description': room.get('description', ''),
         'area': room.get('area') or room.get('area_m2', 0),
         'floor': room.get('floor', 1),
@@ -67,6 +69,8 @@ def format_room_response(room, include_sensitive=True):
     if not include_sensitive:
         data.pop('electricity_price', None)
         data.pop('water_price', None)
+        data.pop('electric_tiers', None)
+        data.pop('water_tiers', None)
         data.pop('current_contract_id', None)
         data.pop('reserved_by_user_id', None)
         data.pop('reserved_payment_id', None)
@@ -78,6 +82,35 @@ def format_room_response(room, include_sensitive=True):
     return data
 
 
+# Tiered tariff override: [{'limit': kWh/m3 or None, 'price': VND}, ...]; empty = use default.
+# Limits must increase and only the last tier may be open-ended (limit None).
+# Raises ValueError with the message for the client.
+def normalize_tier_override(value):
+    if not isinstance(value, list):
+        return None
+    tiers = []
+    for t in value:
+        if not isinstance(t, dict) or t.get('price') in (None, ''):
+            continue
+        try:
+            limit = float(t['limit']) if t.get('limit') not in (None, '') else None
+            price = float(t['price'])
+        except (TypeError, ValueError):
+            raise ValueError('Giá và giới hạn bậc phải là số!')
+        tiers.append({'limit': limit, 'price': price})
+
+    last_limit = 0.0
+    for i, tier in enumerate(tiers):
+        if tier['limit'] is None:
+            if i != len(tiers) - 1:
+                raise ValueError('Chỉ bậc cuối cùng được để trống giới hạn!')
+            continue
+        if tier['limit'] <= last_limit:
+            raise ValueError('Bậc giá phải tăng dần!')
+        last_limit = tier['limit']
+    return tiers or None
+
+
 # Check if room name already exists
 def check_duplicate_room_name(name, exclude_room_id=None):
     query = {'name': name}